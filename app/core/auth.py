@@ -1,11 +1,15 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from pydantic import BaseModel
+import hashlib
 import os
+import threading
+import time
 
 # Security configurations
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
@@ -32,6 +36,119 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+
+class UserStore:
+    """
+    Users with their password hashes, looked up by username.
+
+    User objects are built once and shared, so resolving a token does not
+    construct any models. Passwords are only ever compared as hashes.
+    """
+
+    def __init__(self, users: Optional[Dict[str, str]] = None):
+        # username -> (shared User, password hash, None until a plain password is hashed)
+        self._users: Dict[str, Tuple[User, Optional[str]]] = {}
+        # Plain-text passwords from the environment, hashed on first login
+        self._plain: Dict[str, str] = {}
+        self._hash_lock = threading.Lock()
+        for username, hashed_password in (users or {}).items():
+            self.add(username, hashed_password)
+
+    @classmethod
+    def from_env(cls) -> "UserStore":
+        """
+        Build the store from API_USERNAME with API_PASSWORD_HASH (a bcrypt hash).
+
+        A plain API_PASSWORD is still accepted and hashed on first login.
+        The user is registered straight away either way, so tokens issued
+        by another worker or before a restart resolve without a login here.
+        """
+        store = cls()
+        username = os.getenv("API_USERNAME")
+        if username:
+            if os.getenv("API_PASSWORD_HASH"):
+                store.add(username, os.getenv("API_PASSWORD_HASH"))
+            elif os.getenv("API_PASSWORD"):
+                store.add(username, None)
+                store._plain[username] = os.getenv("API_PASSWORD")
+        return store
+
+    def add(self, username: str, hashed_password: Optional[str], disabled: bool = False) -> None:
+        self._users[username] = (User(username=username, disabled=disabled), hashed_password)
+
+    def get(self, username: str) -> Optional[User]:
+        entry = self._users.get(username)
+        return entry[0] if entry else None
+
+    def authenticate(self, username: str, password: str) -> Optional[User]:
+        """
+        Check a username and password; slow by design (bcrypt), so call it off the event loop.
+
+        Returns:
+            The user, or None if the credentials are wrong
+        """
+        entry = self._users.get(username)
+        if entry is None:
+            # Spend the same time as a real check so usernames cannot be probed
+            pwd_context.dummy_verify()
+            return None
+        user, hashed_password = entry
+        if hashed_password is None:
+            with self._hash_lock:
+                user, hashed_password = self._users[username]
+                if hashed_password is None:
+                    hashed_password = get_password_hash(self._plain.pop(username))
+                    self._users[username] = (user, hashed_password)
+        if user.disabled or not verify_password(password, hashed_password):
+            return None
+        return user
+
+
+class TokenCache:
+    """
+    Bounded LRU of already-verified access tokens.
+
+    Keyed by a hash of the token so raw tokens are not kept in memory;
+    an entry is never served past the token's own expiry.
+    """
+
+    def __init__(self, max_size: Optional[int] = None):
+        self.max_size = max_size or int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+        self._entries: "OrderedDict[str, Tuple[User, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[User]:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, token: str, user: User, expires_at: float) -> None:
+        key = self._key(token)
+        self._entries[key] = (user, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Forget every verified token, e.g. after disabling a user."""
+        self._entries.clear()
+
+
+user_store = UserStore.from_env()
+token_cache = TokenCache()
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -42,7 +159,17 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+def resolve_token(token: str) -> User:
+    """
+    Get the user for an access token, verifying the JWT only on a cache miss.
+
+    Raises:
+        HTTPException: 401 if the token is invalid, expired or for an unknown user
+    """
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -50,16 +177,16 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     )
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    
-    # In a real application, you would fetch the user from a database
-    # For this example, we'll use a simple check
-    if token_data.username != os.getenv("API_USERNAME"):
+    username = payload.get("sub")
+    user = user_store.get(username) if username else None
+    if user is None or user.disabled:
         raise credentials_exception
-    
-    return User(username=token_data.username) 
\ No newline at end of file
+
+    if payload.get("exp"):
+        token_cache.put(token, user, payload["exp"])
+    return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+    return resolve_token(token)
@@ -0,0 +1,168 @@
+"""
+Single-flight coalescing of identical in-flight requests.
+
+When many callers make the same request at once (a popular IVR prompt,
+a scripted simulation), only the first one goes upstream; the others
+wait for it and get the same result. Streams are fanned out chunk by
+chunk, so a caller joining mid-stream replays what was already sent
+and then follows along. Each key takes at most ``max_waiters`` callers,
+so one slow or failing upstream call cannot hold up an unbounded crowd;
+past that a fresh upstream call is started.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from app.core.metrics import COALESCED_REQUESTS
+
+
+def request_key(**fields: Any) -> str:
+    """Hash a request's model, parameters and messages into a coalescing key."""
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+class _Flight:
+    """One upstream call and the callers waiting on it."""
+
+    __slots__ = ("task", "waiters", "chunks", "done", "error", "changed")
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        # Only used by streams
+        self.chunks: List = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+
+    def notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class RequestCoalescer:
+    def __init__(self, name: str, max_waiters: Optional[int] = None, enabled: Optional[bool] = None):
+        """
+        Args:
+            name: Label for the coalescing metrics
+            max_waiters: Callers sharing one upstream call, including the first
+            enabled: Coalesce at all (defaults to LLM_COALESCE)
+        """
+        self.name = name
+        self.max_waiters = max_waiters or int(os.getenv("LLM_COALESCE_MAX_WAITERS", "64"))
+        if enabled is None:
+            enabled = os.getenv("LLM_COALESCE", "true").lower() == "true"
+        self.enabled = enabled
+        self._flights: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.joined = 0
+        self.overflows = 0
+
+    def _join(self, flights: Dict[str, _Flight], key: str) -> Optional[_Flight]:
+        """Get the flight to wait on, or None if the caller has to start one."""
+        flight = flights.get(key)
+        if flight is None:
+            return None
+        if flight.waiters >= self.max_waiters:
+            self.overflows += 1
+            COALESCED_REQUESTS.labels(self.name, "overflow").inc()
+            return None
+        self.joined += 1
+        COALESCED_REQUESTS.labels(self.name, "joined").inc()
+        return flight
+
+    def _start(self, flights: Dict[str, _Flight], key: str, run: Callable[[_Flight], Awaitable[Any]]) -> _Flight:
+        self.leaders += 1
+        COALESCED_REQUESTS.labels(self.name, "leader").inc()
+        flight = _Flight()
+        # Later identical requests join this flight; an overflowing one replaces it
+        flights[key] = flight
+
+        async def runner():
+            try:
+                return await run(flight)
+            finally:
+                if flights.get(key) is flight:
+                    del flights[key]
+
+        flight.task = asyncio.ensure_future(runner())
+        return flight
+
+    @staticmethod
+    def _leave(flight: _Flight) -> None:
+        flight.waiters -= 1
+        # Nobody is left to use the result
+        if flight.waiters == 0 and not flight.task.done():
+            flight.task.cancel()
+
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await ``call()``, sharing the result with identical concurrent requests.
+
+        The upstream call runs in its own task, so a caller giving up does
+        not cancel it for the others; it is cancelled once every caller has.
+        Errors are raised to every caller.
+        """
+        if not self.enabled:
+            return await call()
+        flight = self._join(self._flights, key)
+        if flight is None:
+            flight = self._start(self._flights, key, lambda flight: call())
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            self._leave(flight)
+
+    async def stream(self, key: str, call: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """
+        Iterate ``call()``, sharing the chunks with identical concurrent requests.
+
+        Every caller gets every chunk from the start, even when it joined
+        after the first ones were produced. An error is raised to each
+        caller once it has replayed the chunks sent before it.
+        """
+        if not self.enabled:
+            async for chunk in call():
+                yield chunk
+            return
+        flight = self._join(self._streams, key)
+        if flight is None:
+            flight = self._start(self._streams, key, lambda flight: self._pump(flight, call()))
+        flight.waiters += 1
+        try:
+            sent = 0
+            while True:
+                while sent < len(flight.chunks):
+                    yield flight.chunks[sent]
+                    sent += 1
+                if flight.done:
+                    break
+                await flight.changed.wait()
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            self._leave(flight)
+
+    @staticmethod
+    async def _pump(flight: _Flight, chunks: AsyncIterator[Any]) -> None:
+        try:
+            async for chunk in chunks:
+                flight.chunks.append(chunk)
+                flight.notify()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            flight.notify()
+            await chunks.aclose()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._flights) + len(self._streams),
+            "leaders": self.leaders,
+            "saved": self.joined,
+            "overflows": self.overflows,
+        }
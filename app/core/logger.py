@@ -1,34 +1,188 @@
+import atexit
+import json
 import logging
-import sys
-from datetime import datetime
+import logging.handlers
 import os
+import queue
+import random
+import sys
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Iterator
+
+# Correlation IDs (request_id, simulation_id, call_sid) for the current request or task
+_log_context: ContextVar[Dict[str, str]] = ContextVar("log_context", default={})
+
+
+def bind_log_context(**fields: str) -> None:
+    """Attach correlation IDs to every record logged from the current task from now on."""
+    _log_context.set({**_log_context.get(), **fields})
+
+
+@contextmanager
+def log_context(**fields: str) -> Iterator[None]:
+    """Attach correlation IDs to every record logged inside the block."""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copy the caller's correlation IDs onto the record before it changes threads."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.context = _log_context.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of DEBUG records.
+
+    A call can override the rate with ``extra={"sample_rate": 0.01}``;
+    INFO and above are always kept.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = getattr(record, "sample_rate", self.rate)
+        return rate >= 1 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with correlation IDs as top-level fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **getattr(record, "context", {}),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        context = getattr(record, "context", None)
+        if context:
+            line += " [" + " ".join(f"{key}={value}" for key, value in context.items()) + "]"
+        return line
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to the listener thread without formatting them.
+
+    The stock QueueHandler renders the message in the caller; here the
+    message, JSON encoding and any traceback are all rendered by the
+    listener, so the event loop only pays for an enqueue.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _LazyDirectoryMixin:
+    """Create the log directory when the first record is written, not at import."""
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+class _RotatingFileHandler(_LazyDirectoryMixin, logging.handlers.RotatingFileHandler):
+    pass
+
+
+class _TimedRotatingFileHandler(_LazyDirectoryMixin, logging.handlers.TimedRotatingFileHandler):
+    pass
+
+
+def _file_handler(path: str) -> logging.Handler:
+    backup_count = int(os.getenv("LOG_BACKUP_COUNT", "7"))
+    if os.getenv("LOG_ROTATION", "time") == "size":
+        return _RotatingFileHandler(
+            path, maxBytes=int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024))),
+            backupCount=backup_count, delay=True
+        )
+    return _TimedRotatingFileHandler(path, when="midnight", backupCount=backup_count, delay=True)
 
-# Create logs directory if it doesn't exist
-os.makedirs("logs", exist_ok=True)
 
 # Configure logging
 def setup_logger(name: str) -> logging.Logger:
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    
+    if logger.handlers:
+        return logger
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
     # Create formatters
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    
-    # Create handlers
+    formatter = JsonFormatter() if os.getenv("LOG_FORMAT", "json") == "json" else TextFormatter()
+
+    # Create handlers, run on a background listener thread
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-    
-    # File handler
-    file_handler = logging.FileHandler(
-        f"logs/app_{datetime.now().strftime('%Y%m%d')}.log"
-    )
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    
+    handlers = [console_handler]
+    if os.getenv("LOG_TO_FILE", "true").lower() == "true":
+        handlers.append(_file_handler(os.path.join(os.getenv("LOG_DIR", "logs"), "app.log")))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Drain whatever is still queued on interpreter exit
+    atexit.register(listener.stop)
+
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter(float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))))
+    logger.addHandler(queue_handler)
+    logger.listener = listener
+
     return logger
 
+
+class CorrelationMiddleware:
+    """ASGI middleware giving every request a request_id, echoed as X-Request-ID."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        token = _log_context.set({"request_id": request_id})
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _log_context.reset(token)
+
+
 # Create logger instance
-logger = setup_logger("call_center") 
\ No newline at end of file
+logger = setup_logger("call_center")
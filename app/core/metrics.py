@@ -0,0 +1,329 @@
+"""
+Prometheus-style metrics with lock-free updates.
+
+Each metric child keeps one cell per thread, so ``inc`` and ``observe``
+never take a lock: the event loop and every worker thread write only to
+their own cell, and a scrape sums the cells. A lock is only taken the
+first time a thread touches a child or a new label set is created.
+
+Values that services already track (cache hit counters, queue depths)
+are exposed through callback metrics, read at scrape time only.
+"""
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Samples = Union[float, Dict[Tuple[str, ...], float]]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class _Child:
+    """The per-label-set value, sharded by thread."""
+
+    def __init__(self, size: int):
+        self._size = size
+        self._cells: Dict[int, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def _cell(self) -> List[float]:
+        cell = self._cells.get(threading.get_ident())
+        if cell is None:
+            with self._lock:
+                cell = self._cells.setdefault(threading.get_ident(), [0.0] * self._size)
+        return cell
+
+    def _totals(self) -> List[float]:
+        totals = [0.0] * self._size
+        for cell in list(self._cells.values()):
+            for index, value in enumerate(cell):
+                totals[index] += value
+        return totals
+
+
+class _CounterChild(_Child):
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount: float = 1) -> None:
+        self._cell()[0] += amount
+
+    @property
+    def value(self) -> float:
+        return self._totals()[0]
+
+
+class _GaugeChild:
+    # Gauges are set, not accumulated, so the last writer wins
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+
+class _HistogramChild(_Child):
+    def __init__(self, buckets: Sequence[float]):
+        # One counter per bucket plus +Inf, then the sum
+        super().__init__(len(buckets) + 2)
+        self._buckets = buckets
+
+    def observe(self, value: float) -> None:
+        cell = self._cell()
+        cell[bisect_left(self._buckets, value)] += 1
+        cell[-1] += value
+
+    def time(self) -> "_Timer":
+        """Observe the duration of a ``with`` block in seconds."""
+        return _Timer(self)
+
+    @property
+    def count(self) -> float:
+        return sum(self._totals()[:-1])
+
+
+class _Timer:
+    __slots__ = ("_child", "_started")
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+
+    def __enter__(self) -> "_Timer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._child.observe(time.perf_counter() - self._started)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], Samples]] = None,
+        registry: Optional["Registry"] = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames and function is None:
+            self._default = self._children[()] = self._new_child()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Get the child for one label set, creating it on first use."""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _values(self) -> Iterator[Tuple[Dict[str, str], object]]:
+        for key, child in list(self._children.items()):
+            yield dict(zip(self.labelnames, key)), child
+
+    def _callback_samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        samples = self.function()
+        if not isinstance(samples, dict):
+            samples = {(): samples}
+        for key, value in samples.items():
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        samples = self._callback_samples() if self.function else self.samples()
+        lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for name, labels, value in samples)
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """A monotonically increasing count, e.g. requests or tokens."""
+
+    type = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self._default.inc(amount)
+
+    def samples(self):
+        for labels, child in self._values():
+            yield self.name, labels, child.value
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, e.g. active simulations."""
+
+    type = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._default.set(value)
+
+    def inc(self, amount: float = 1) -> None:
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self._default.dec(amount)
+
+    def samples(self):
+        for labels, child in self._values():
+            yield self.name, labels, child.value
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, e.g. latencies in seconds."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional["Registry"] = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry=registry)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def time(self) -> _Timer:
+        return self._default.time()
+
+    def samples(self):
+        for labels, child in self._values():
+            totals = child._totals()
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (math.inf,), totals):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, totals[-1]
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    """A set of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def unregister(self, name: str) -> None:
+        self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        blocks = []
+        for metric in list(self._metrics.values()):
+            try:
+                blocks.append(metric.render())
+            except Exception:
+                # A broken callback must not take the whole scrape down
+                continue
+        return "\n".join(blocks) + "\n"
+
+
+REGISTRY = Registry()
+
+# Hot-path metrics shared by the services
+LLM_REQUEST_SECONDS = Histogram(
+    "call_center_llm_request_seconds", "LLM request latency (time to first chunk when streaming)",
+    ["mode", "outcome"]
+)
+LLM_TOKENS = Counter("call_center_llm_tokens_total", "LLM tokens used", ["kind"])
+LLM_BACKEND_REQUESTS = Counter(
+    "call_center_llm_backend_requests_total", "LLM requests per routed backend", ["backend", "outcome"]
+)
+LLM_HEDGES = Counter("call_center_llm_hedges_total", "Hedged LLM requests and which attempt won", ["outcome"])
+COALESCED_REQUESTS = Counter(
+    "call_center_coalesced_requests_total",
+    "Requests by coalescing result; joined requests were served without an upstream call",
+    ["name", "result"]
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "call_center_http_request_seconds", "HTTP request latency until the response starts",
+    ["method", "route", "status"]
+)
+STT_SECONDS = Histogram("call_center_stt_seconds", "Speech-to-text latency per segment", ["engine"])
+TTS_SECONDS = Histogram("call_center_tts_seconds", "Text-to-speech synthesis time on cache misses", ["backend"])
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route request latency."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        responded = False
+
+        def observe(status: int) -> None:
+            # Route templates rather than raw paths keep label cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, status).observe(time.perf_counter() - started)
+
+        async def send_wrapper(message):
+            nonlocal responded
+            if message["type"] == "http.response.start":
+                responded = True
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if not responded:
+                observe(500)
+            raise
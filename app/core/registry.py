@@ -0,0 +1,115 @@
+"""
+Lazily constructed application services.
+
+Services are registered as factories and only built the first time they
+are used, so importing the application stays cheap and a worker can
+start serving before every model and lexicon is loaded. Services marked
+``warm`` are built (and their ``warm_up`` hook run) by ``warm_up``,
+which the application lifespan runs in the background; readiness
+reports whether it has finished.
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from app.core.logger import logger
+
+
+class _Registration:
+    __slots__ = ("factory", "warm", "close")
+
+    def __init__(self, factory: Callable[["ServiceRegistry"], Any], warm: bool,
+                 close: Optional[Callable[[Any], Awaitable[None]]]):
+        self.factory = factory
+        self.warm = warm
+        self.close = close
+
+
+class ServiceRegistry:
+    def __init__(self):
+        self._registrations: Dict[str, _Registration] = {}
+        self._instances: Dict[str, Any] = {}
+        # Creation order, so services are closed before the ones they depend on
+        self._order: List[str] = []
+        # Re-entrant: factories look up the services they depend on
+        self._lock = threading.RLock()
+        self.ready = False
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[["ServiceRegistry"], Any],
+        warm: bool = False,
+        close: Optional[Callable[[Any], Awaitable[None]]] = None,
+    ) -> None:
+        """
+        Register a service factory.
+
+        Args:
+            name: Attribute the service is available under
+            factory: Builds the service; receives the registry to look up dependencies
+            warm: Build the service during warm-up rather than on first use
+            close: Coroutine function releasing the service at shutdown
+        """
+        self._registrations[name] = _Registration(factory, warm, close)
+
+    def get(self, name: str) -> Any:
+        """Get a service, building it on first use."""
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        registration = self._registrations[name]
+        with self._lock:
+            if name not in self._instances:
+                started = time.perf_counter()
+                self._instances[name] = registration.factory(self)
+                self._order.append(name)
+                logger.info("Initialized %s in %.1f ms", name, (time.perf_counter() - started) * 1000)
+        return self._instances[name]
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_") or name not in self._registrations:
+            raise AttributeError(name)
+        return self.get(name)
+
+    def peek(self, name: str) -> Any:
+        """Get a service only if it has already been built, without building it."""
+        return self._instances.get(name)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    async def warm_up(self) -> None:
+        """Build every warm service and run its ``warm_up`` hook off the event loop."""
+        started = time.perf_counter()
+        try:
+            for name, registration in list(self._registrations.items()):
+                if not registration.warm:
+                    continue
+                service = self.get(name)
+                hook = getattr(service, "warm_up", None)
+                if hook:
+                    await asyncio.to_thread(hook)
+            self.ready = True
+            logger.info("Services warmed up in %.1f ms", (time.perf_counter() - started) * 1000)
+        except Exception as e:
+            logger.error("Error warming up services: %s", e)
+
+    def status(self) -> Dict[str, bool]:
+        """Which registered services have been built."""
+        return {name: name in self._instances for name in self._registrations}
+
+    async def aclose(self) -> None:
+        """Close built services in reverse creation order."""
+        for name in reversed(self._order):
+            close = self._registrations[name].close
+            service = self._instances.get(name)
+            if close and service is not None:
+                try:
+                    await close(service)
+                except Exception as e:
+                    logger.error("Error closing %s: %s", name, e)
+        self._instances.clear()
+        self._order.clear()
+        self.ready = False
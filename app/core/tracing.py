@@ -0,0 +1,28 @@
+"""
+Optional OpenTelemetry tracing.
+
+Set OTEL_TRACING_ENABLED=true with opentelemetry-api installed (and an SDK
+and exporter configured the usual OpenTelemetry way) to get spans around
+the hot paths. Otherwise ``span`` is a shared no-op context manager.
+"""
+import contextlib
+import os
+from typing import Dict, Optional
+from app.core.logger import logger
+
+_NOOP = contextlib.nullcontext()
+_tracer = None
+
+if os.getenv("OTEL_TRACING_ENABLED", "false").lower() == "true":
+    try:
+        from opentelemetry import trace
+        _tracer = trace.get_tracer("call_center")
+    except ImportError:
+        logger.error("OTEL_TRACING_ENABLED is set but opentelemetry is not installed")
+
+
+def span(name: str, attributes: Optional[Dict[str, str]] = None):
+    """Start a tracing span as the current span, or do nothing when tracing is off."""
+    if _tracer is None:
+        return _NOOP
+    return _tracer.start_as_current_span(name, attributes=attributes)
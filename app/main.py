@@ -1,40 +1,207 @@
-from fastapi import FastAPI, Request, HTTPException, Depends, status
-from fastapi.responses import Response, JSONResponse
+from fastapi import FastAPI, Request, HTTPException, Depends, status, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, JSONResponse, StreamingResponse, FileResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 # from sqlalchemy.orm import Session
 import os
+import json
 import uuid
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Awaitable, Dict, Optional
 from dotenv import load_dotenv
 
-from app.services.llm_service import LLMService
+from app.services.llm_router_service import create_llm_service
 from app.services.simulation_service import SimulationService
-from app.services.analytics_service import AnalyticsService
-# from app.models.database import init_db, Call, Message
-from app.core.auth import get_current_user, create_access_token, User, Token
-from app.core.logger import logger
-from app.services.sentiment_service import SentimentService
+from app.services.cache_service import ResponseCache, RedisCacheBackend
+from app.services.storage_service import SimulationStore
+from app.services.session_state_service import create_session_backend
+from app.services.export_service import ExportService, EXPORT_FORMATS
+from app.services.analytics_service import AnalyticsService, SENTIMENT_RANGES
+from app.models.database import init_async_db, create_tables
+from app.core.auth import get_current_user, create_access_token, user_store, User, Token
+from app.core.logger import logger, bind_log_context, CorrelationMiddleware
+from app.core.metrics import REGISTRY, CONTENT_TYPE, Counter, Gauge, MetricsMiddleware
+from app.core.registry import ServiceRegistry
+from app.services.sentiment_service import SentimentService, SentimentWorker
+from app.services.tts_service import TTSService
+from app.services.speech_service import SpeechService
+from app.services.transcription_service import TranscriptionService
+from app.services.media_stream_service import MediaStreamSession
+from app.services.twilio_service import TwilioService
+from app.services.voice_service import VoiceService
 
 # Load environment variables
 load_dotenv()
 
+HISTORY_PAGE_SIZE = 20
+MAX_HISTORY_PAGE_SIZE = 200
+MAX_TTS_CHARS = 1000
+
+# Initialize database
+engine, async_session = init_async_db(
+    os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./call_center.db"),
+    pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20"))
+)
+
+# Services are built on first use; the warm ones are loaded in the
+# background at startup, and /ready reports when that has finished
+services = ServiceRegistry()
+
+
+def _response_cache(services: ServiceRegistry) -> Optional[ResponseCache]:
+    # Off by default: cached replies are shared between callers
+    if os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() != "true":
+        return None
+    return ResponseCache(
+        backend=RedisCacheBackend(os.getenv("CACHE_REDIS_URL")) if os.getenv("CACHE_REDIS_URL") else None
+    )
+
+
+def _session_backend(services: ServiceRegistry):
+    # Set SESSION_BACKEND (redis or sql) when running several workers behind a load balancer
+    return create_session_backend(async_session) if os.getenv("SESSION_BACKEND") else None
+
+
+def _aclose(service) -> Awaitable[None]:
+    return service.aclose()
+
+
+def _stop(service) -> Awaitable[None]:
+    return service.stop()
+
+
+services.register("llm_service", lambda s: create_llm_service(), warm=True, close=_aclose)
+services.register("response_cache", _response_cache, warm=True)
+services.register("sentiment_service", lambda s: SentimentService(), warm=True)
+services.register("sentiment_worker", lambda s: SentimentWorker(s.sentiment_service), warm=True, close=_stop)
+services.register("session_backend", _session_backend, warm=True, close=_aclose)
+services.register(
+    "simulation_store",
+    lambda s: SimulationStore(async_session, shared=s.session_backend is not None),
+    warm=True,
+    close=_stop
+)
+services.register("simulation_service", lambda s: SimulationService(
+    s.llm_service,
+    response_cache=s.response_cache,
+    store=s.simulation_store,
+    sentiment_worker=s.sentiment_worker,
+    session_backend=s.session_backend
+), warm=True)
+services.register("analytics_service", lambda s: AnalyticsService(async_session))
+services.register("export_service", lambda s: ExportService())
+services.register("tts_service", lambda s: TTSService())
+services.register("transcription_service", lambda s: TranscriptionService(), close=_stop)
+services.register("speech_service", lambda s: SpeechService(pool=s.transcription_service, tts=s.tts_service))
+services.register("twilio_service", lambda s: TwilioService(
+    os.getenv("TWILIO_ACCOUNT_SID"),
+    os.getenv("TWILIO_AUTH_TOKEN"),
+    os.getenv("TWILIO_PHONE_NUMBER")
+), close=_aclose)
+services.register("voice_service", lambda s: VoiceService(s.simulation_service, s.twilio_service))
+
+# Scrape-time views of counters the services already keep; services that
+# have not been built yet report nothing rather than being built by a scrape
+def _active_simulations() -> int:
+    simulation_service = services.peek("simulation_service")
+    if simulation_service is None:
+        return 0
+    return sum(1 for s in simulation_service.active_simulations.values() if s.is_active)
+
+
+def _queue_depths() -> Dict:
+    depths = {}
+    if services.is_loaded("sentiment_worker"):
+        depths[("sentiment",)] = services.sentiment_worker.queue.qsize()
+    if services.is_loaded("simulation_store"):
+        depths[("storage",)] = services.simulation_store.get_stats()["dirty"]
+    if services.is_loaded("transcription_service"):
+        depths[("transcription",)] = services.transcription_service.queue.qsize()
+    return depths
+
+
+def _cache_lookups() -> Dict:
+    lookups = {}
+    tts_service = services.peek("tts_service")
+    if tts_service:
+        lookups[("tts", "hit")] = tts_service.hits
+        lookups[("tts", "miss")] = tts_service.misses
+    response_cache = services.peek("response_cache")
+    if response_cache:
+        lookups[("response", "hit")] = response_cache.hits + response_cache.semantic_hits
+        lookups[("response", "miss")] = response_cache.misses
+    return lookups
+
+
+def _sentiment_scored() -> Dict:
+    sentiment_worker = services.peek("sentiment_worker")
+    if sentiment_worker is None:
+        return {}
+    return {("processed",): sentiment_worker.processed, ("dropped",): sentiment_worker.dropped}
+
+
+def _llm_backend_latency() -> Dict:
+    # Only a routed LLM client keeps per-backend statistics
+    get_stats = getattr(services.peek("llm_service"), "get_stats", None)
+    if get_stats is None:
+        return {}
+    return {
+        (backend["name"], backend["state"]): backend["ewma_ms"] / 1000
+        for backend in get_stats() if backend["ewma_ms"] is not None
+    }
+
+
+Gauge("call_center_active_simulations", "Simulations held in memory", function=_active_simulations)
+Gauge("call_center_queue_depth", "Items waiting in background queues", ["queue"], function=_queue_depths)
+Counter(
+    "call_center_cache_lookups_total", "Cache lookups by result", ["cache", "result"], function=_cache_lookups
+)
+Counter(
+    "call_center_sentiment_scored_total", "Messages scored by the sentiment worker", ["result"],
+    function=_sentiment_scored
+)
+Gauge(
+    "call_center_llm_backend_latency_seconds", "Latency EWMA and breaker state per routed LLM backend",
+    ["backend", "state"], function=_llm_backend_latency
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await create_tables(engine)
+    await services.simulation_store.start()
+    await services.sentiment_worker.start()
+    background_tasks = [asyncio.create_task(services.simulation_service.run_eviction_loop(
+        max_idle=float(os.getenv("SIMULATION_IDLE_EVICT_SECONDS", "300")),
+        max_idle_active=float(os.getenv("SIMULATION_ABANDONED_EVICT_SECONDS", "1800"))
+    ))]
+    if services.session_backend:
+        background_tasks.append(asyncio.create_task(services.simulation_service.run_event_listener()))
+    if os.getenv("SERVICE_WARMUP", "true").lower() == "true":
+        background_tasks.append(asyncio.create_task(services.warm_up()))
+    else:
+        services.ready = True
+    try:
+        yield
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await services.aclose()
+        await engine.dispose()
+
 # Initialize FastAPI app
-app = FastAPI(title="AI Call Center")
+app = FastAPI(title="AI Call Center", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(CorrelationMiddleware)
 
 # Mount static files and templates
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+app.mount("/static", StaticFiles(directory="app/static", check_dir=False), name="static")
 templates = Jinja2Templates(directory="app/templates")
 
-# Initialize services
-llm_service = LLMService(api_key=os.getenv("GROQ_API_KEY"))
-simulation_service = SimulationService(llm_service)
-analytics_service = AnalyticsService()
-sentiment_service = SentimentService()
-
-# Initialize database (commented out for future use)
-# engine = init_db(os.getenv("DATABASE_URL", "sqlite:///./call_center.db"))
-
 # Dependency to get database session (commented out for future use)
 # def get_db():
 #     db = Session(engine)
@@ -46,15 +213,21 @@ sentiment_service = SentimentService()
 # Web interface routes
 @app.get("/")
 async def home(request: Request):
-    empty_stats = {
-        "total_calls": 0,
-        "average_duration": 0,
-        "total_messages": 0
-    }
+    dashboard = await services.analytics_service.get_dashboard()
+    recent = await services.simulation_store.list_calls(limit=5)
+    recent_calls = [
+        {
+            "simulation_id": call["simulation_id"],
+            "duration": call["duration"] or 0,
+            "status": call["status"],
+            "sentiment_score": call["quality_metrics"].get("sentiment_score", 0)
+        }
+        for call in recent["calls"]
+    ]
     return templates.TemplateResponse("dashboard.html", {
         "request": request,
-        "stats": empty_stats,
-        "recent_calls": []
+        "stats": dashboard.get("stats"),
+        "recent_calls": recent_calls
     })
 
 @app.get("/simulator")
@@ -66,7 +239,9 @@ async def simulator(request: Request):
 async def start_simulation():
     """Start a new call simulation."""
     simulation_id = str(uuid.uuid4())
-    if simulation_service.start_simulation(simulation_id):
+    bind_log_context(simulation_id=simulation_id)
+    if services.simulation_service.start_simulation(simulation_id):
+        await services.simulation_service.sync_state(simulation_id)
         return JSONResponse({"simulation_id": simulation_id})
     raise HTTPException(status_code=400, detail="Could not start simulation")
 
@@ -75,11 +250,14 @@ async def end_simulation(request: Request):
     """End an active call simulation."""
     data = await request.json()
     simulation_id = data.get('simulation_id')
+    bind_log_context(simulation_id=simulation_id)
     
     if not simulation_id:
         return JSONResponse({'error': 'Missing simulation_id'}, status_code=400)
         
-    if simulation_service.end_simulation(simulation_id):
+    async with services.simulation_service.session(simulation_id):
+        ended = services.simulation_service.end_simulation(simulation_id)
+    if ended:
         return JSONResponse({"status": "success"})
     raise HTTPException(status_code=404, detail="Simulation not found")
 
@@ -88,20 +266,50 @@ async def process_message(request: Request):
     """Process a message in the simulation."""
     data = await request.json()
     simulation_id = data.get('simulation_id')
+    bind_log_context(simulation_id=simulation_id)
     message = data.get('message')
     
     if not all([simulation_id, message]):
         return JSONResponse({'error': 'Missing required fields'}, status_code=400)
         
-    response = await simulation_service.process_message(simulation_id, message)
+    response = await services.simulation_service.process_message(simulation_id, message)
     if response:
         return JSONResponse({"response": response})
     raise HTTPException(status_code=404, detail="Simulation not found or inactive")
 
+@app.post("/api/simulate/message/stream")
+async def stream_message(request: Request):
+    """Stream the AI response to a simulation message as server-sent events."""
+    data = await request.json()
+    simulation_id = data.get('simulation_id')
+    bind_log_context(simulation_id=simulation_id)
+    message = data.get('message')
+    
+    if not all([simulation_id, message]):
+        return JSONResponse({'error': 'Missing required fields'}, status_code=400)
+    
+    deltas = await services.simulation_service.stream_message(simulation_id, message)
+    if deltas is None:
+        raise HTTPException(status_code=404, detail="Simulation not found or inactive")
+    
+    async def event_stream():
+        parts = []
+        async for delta in deltas:
+            parts.append(delta)
+            yield f"data: {json.dumps({'delta': delta})}\n\n"
+        yield f"data: {json.dumps({'done': True, 'response': ''.join(parts)})}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/api/simulate/transfer")
 async def transfer_simulation(request: Request):
     data = await request.json()
     simulation_id = data.get('simulation_id')
+    bind_log_context(simulation_id=simulation_id)
     agent_id = data.get('agent_id')
     reason = data.get('reason')
     
@@ -109,7 +317,8 @@ async def transfer_simulation(request: Request):
         return JSONResponse({'error': 'Missing required fields'}, status_code=400)
     
     try:
-        simulation_service.transfer_call(simulation_id, agent_id, reason)
+        async with services.simulation_service.session(simulation_id):
+            services.simulation_service.transfer_call(simulation_id, agent_id, reason)
         return JSONResponse({'status': 'success', 'message': 'Call transferred successfully'})
     except Exception as e:
         return JSONResponse({'error': str(e)}, status_code=400)
@@ -118,13 +327,15 @@ async def transfer_simulation(request: Request):
 async def add_note(request: Request):
     data = await request.json()
     simulation_id = data.get('simulation_id')
+    bind_log_context(simulation_id=simulation_id)
     content = data.get('content')
     
     if not all([simulation_id, content]):
         return JSONResponse({'error': 'Missing required fields'}, status_code=400)
     
     try:
-        simulation_service.add_note(simulation_id, content)
+        async with services.simulation_service.session(simulation_id):
+            services.simulation_service.add_note(simulation_id, content)
         return JSONResponse({'status': 'success', 'message': 'Note added successfully'})
     except Exception as e:
         return JSONResponse({'error': str(e)}, status_code=400)
@@ -133,6 +344,7 @@ async def add_note(request: Request):
 async def add_tag(request: Request):
     data = await request.json()
     simulation_id = data.get('simulation_id')
+    bind_log_context(simulation_id=simulation_id)
     name = data.get('name')
     tag_type = data.get('type', 'default')
     
@@ -140,31 +352,263 @@ async def add_tag(request: Request):
         return JSONResponse({'error': 'Missing required fields'}, status_code=400)
     
     try:
-        simulation_service.add_tag(simulation_id, name, tag_type)
+        async with services.simulation_service.session(simulation_id):
+            services.simulation_service.add_tag(simulation_id, name, tag_type)
         return JSONResponse({'status': 'success', 'message': 'Tag added successfully'})
     except Exception as e:
         return JSONResponse({'error': str(e)}, status_code=400)
 
 @app.get("/call-history")
 async def call_history(request: Request):
-    simulations = simulation_service.get_all_simulations()
-    return templates.TemplateResponse("call_history.html", {
-        "request": request,
-        "simulations": simulations
-    })
+    # Calls are loaded by the page through the authenticated API, not rendered here
+    return templates.TemplateResponse("call_history.html", {"request": request})
+
+@app.get("/api/simulate/{simulation_id}/details")
+async def simulation_details(simulation_id: str, current_user: User = Depends(get_current_user)):
+    details = await services.simulation_service.find_simulation_details(simulation_id)
+    if not details:
+        raise HTTPException(status_code=404, detail="Simulation not found")
+    return JSONResponse(details)
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+def _history_filters(
+    status: Optional[str] = None,
+    tag: Optional[str] = None,
+    agent_id: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    sentiment: Optional[str] = None,
+    search: Optional[str] = None
+) -> Dict:
+    """Translate request parameters into SimulationService listing filters."""
+    min_sentiment, max_sentiment = SENTIMENT_RANGES.get(sentiment, (None, None))
+    return {
+        "status": status,
+        "tag": tag,
+        "agent_id": agent_id,
+        "date_from": _parse_date(date_from),
+        "date_to": _parse_date(date_to),
+        "min_sentiment": min_sentiment,
+        "max_sentiment": max_sentiment,
+        "search": search or None
+    }
+
+@app.get("/api/calls")
+async def list_calls(
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    tag: Optional[str] = None,
+    agent_id: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    sentiment: Optional[str] = None,
+    search: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """List calls newest first with keyset pagination."""
+    try:
+        filters = _history_filters(status, tag, agent_id, date_from, date_to, sentiment, search)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    page = await services.simulation_service.get_all_simulations(
+        limit=min(max(limit, 1), MAX_HISTORY_PAGE_SIZE), cursor=cursor, **filters
+    )
+    return JSONResponse(page)
+
+@app.post("/api/calls/filter")
+async def filter_calls(request: Request, current_user: User = Depends(get_current_user)):
+    """Filter calls from the call history page."""
+    data = await request.json()
+    date_filter = data.get('date_filter', 'all')
+    status_filter = data.get('status_filter', 'all')
+    
+    date_from = None
+    now = datetime.utcnow()
+    if date_filter == 'today':
+        date_from = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    elif date_filter == 'week':
+        date_from = now - timedelta(days=7)
+    elif date_filter == 'month':
+        date_from = now - timedelta(days=30)
+    
+    filters = _history_filters(
+        status=None if status_filter == 'all' else status_filter,
+        tag=data.get('tag'),
+        agent_id=data.get('agent_id'),
+        sentiment=data.get('sentiment'),
+        search=data.get('search_query')
+    )
+    filters["date_from"] = date_from
+    page = await services.simulation_service.get_all_simulations(
+        limit=HISTORY_PAGE_SIZE, cursor=data.get('cursor'), **filters
+    )
+    return JSONResponse(page)
+
+@app.get("/api/calls/export")
+async def export_calls(
+    format: str = "csv",
+    gzip: bool = False,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream the call history with messages, notes and tags as CSV or NDJSON."""
+    if format not in EXPORT_FORMATS:
+        return JSONResponse({'error': f'Unsupported format: {format}'}, status_code=400)
+    try:
+        records = services.simulation_service.iter_simulations(
+            date_from=_parse_date(date_from), date_to=_parse_date(date_to)
+        )
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    
+    filename = f"call-history-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.{format}"
+    media_type = EXPORT_FORMATS[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        services.export_service.stream(records, fmt=format, compress=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/api/tts")
+async def text_to_speech(text: str, stream: bool = False, current_user: User = Depends(get_current_user)):
+    """Speak text, serving repeated phrases straight from the audio cache."""
+    if not text.strip() or len(text) > MAX_TTS_CHARS:
+        return JSONResponse({'error': f'Text must be 1-{MAX_TTS_CHARS} characters'}, status_code=400)
+
+    if stream:
+        # Sentence by sentence, so playback starts before the reply is fully synthesized
+        tts_service = services.tts_service
+        return StreamingResponse(tts_service.stream(text), media_type=tts_service.backend.content_type)
+
+    try:
+        path, media_type = await asyncio.to_thread(services.tts_service.synthesize_file, text)
+    except Exception as e:
+        logger.error("Error in text-to-speech conversion: %s", e)
+        raise HTTPException(status_code=502, detail="Speech synthesis failed")
+    return FileResponse(path, media_type=media_type, headers={"Cache-Control": "public, max-age=86400"})
+
+@app.get("/health")
+async def health():
+    """Liveness: the process is up and serving requests."""
+    return JSONResponse({"status": "ok"})
+
+@app.get("/ready")
+async def ready():
+    """Readiness: warm-up has finished, so the first calls will not pay for loading models."""
+    return JSONResponse(
+        {"ready": services.ready, "services": services.status()},
+        status_code=200 if services.ready else 503
+    )
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/api/analytics/dashboard")
+async def get_dashboard():
+    """Get dashboard statistics from the pre-aggregated call rollups."""
+    return JSONResponse(await services.analytics_service.get_dashboard())
+
+# Twilio voice webhooks
+async def verify_twilio_signature(request: Request) -> None:
+    """Reject webhook requests that were not signed by Twilio."""
+    path = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+    form = await request.form()
+    if not services.twilio_service.validate_request(path, form, request.headers.get("X-Twilio-Signature", "")):
+        raise HTTPException(status_code=403, detail="Invalid Twilio signature")
+
+@app.post("/api/voice/handle-call", dependencies=[Depends(verify_twilio_signature)])
+async def handle_call(request: Request):
+    """Answer a call and start gathering speech."""
+    form = await request.form()
+    call_sid = form.get("CallSid")
+    bind_log_context(call_sid=call_sid)
+    if not call_sid:
+        return JSONResponse({'error': 'Missing CallSid'}, status_code=400)
+    return Response(content=await services.voice_service.handle_call(call_sid), media_type="application/xml")
+
+@app.post("/api/voice/process-speech", dependencies=[Depends(verify_twilio_signature)])
+async def process_speech(request: Request):
+    """Reply to the caller's transcribed speech."""
+    form = await request.form()
+    call_sid = form.get("CallSid")
+    bind_log_context(call_sid=call_sid)
+    if not call_sid:
+        return JSONResponse({'error': 'Missing CallSid'}, status_code=400)
+
+    twiml = await services.voice_service.process_speech(call_sid, form.get("SpeechResult", ""))
+    if twiml is None:
+        raise HTTPException(status_code=404, detail="Call not found or already ended")
+    return Response(content=twiml, media_type="application/xml")
+
+@app.post("/api/voice/status", dependencies=[Depends(verify_twilio_signature)])
+async def call_status(request: Request):
+    """Record the end of a call from Twilio's status callback."""
+    form = await request.form()
+    call_sid = form.get("CallSid")
+    bind_log_context(call_sid=call_sid)
+    if call_sid:
+        await services.voice_service.handle_status(call_sid, form.get("CallStatus", ""))
+    return Response(status_code=204)
+
+@app.websocket("/api/voice/media-stream")
+async def media_stream(websocket: WebSocket):
+    """Bidirectional Twilio Media Streams audio for a call."""
+    # Twilio signs the upgrade request with the stream URL from our TwiML
+    twilio_service = services.twilio_service
+    if not twilio_service.validate_request(
+        websocket.url.path, {}, websocket.headers.get("X-Twilio-Signature", ""), url=twilio_service.stream_url
+    ):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    # Whisper workers are only spun up once a call actually streams audio
+    await services.transcription_service.start()
+    session = MediaStreamSession(
+        websocket.send_json, services.speech_service, services.simulation_service, services.tts_service
+    )
+    try:
+        await session.run(websocket.receive_text)
+    except WebSocketDisconnect:
+        logger.info("Media stream disconnected for call %s", session.call_sid)
+    finally:
+        await session.close()
 
 # Protected API endpoints
 @app.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    if form_data.username != os.getenv("API_USERNAME") or form_data.password != os.getenv("API_PASSWORD"):
+    # bcrypt is deliberately slow; keep it off the event loop
+    user = await asyncio.to_thread(user_store.authenticate, form_data.username, form_data.password)
+    if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": form_data.username})
+    access_token = create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
+@app.post("/api/calls/make")
+async def make_call(request: Request, current_user: User = Depends(get_current_user)):
+    """Place an outbound call through Twilio."""
+    data = await request.json()
+    to_number = data.get('to_number')
+    if not to_number:
+        return JSONResponse({'error': 'Missing to_number'}, status_code=400)
+
+    call_sid = await services.twilio_service.make_call(to_number)
+    if not call_sid:
+        raise HTTPException(status_code=500, detail="Could not place call")
+    return JSONResponse({"call_sid": call_sid})
+
 # Database-dependent endpoints (commented out for future use)
 # @app.get("/api/calls/statistics")
 # async def get_call_statistics(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
@@ -0,0 +1,111 @@
+"""
+In-memory representation of a live call.
+
+Thousands of calls can be held at once, so every record is a slotted
+dataclass rather than a dict, and timestamps are kept as UTC epoch
+seconds (floats). ISO strings are only produced when a call is
+serialized for an API response or export.
+"""
+import time
+from dataclasses import dataclass, field, fields
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_epoch(value: datetime) -> float:
+    """Convert a naive UTC datetime to epoch seconds."""
+    return (value - _EPOCH).total_seconds()
+
+
+def from_epoch(timestamp: float) -> datetime:
+    """Convert epoch seconds to a naive UTC datetime, as used by the database."""
+    return _EPOCH + timedelta(seconds=timestamp)
+
+
+def format_timestamp(timestamp: float) -> str:
+    return from_epoch(timestamp).isoformat()
+
+
+@dataclass(slots=True)
+class MessageRecord:
+    role: str
+    content: str
+    timestamp: float
+    # VADER compound score of a user message, once the sentiment worker has scored it
+    sentiment: Optional[float] = None
+
+    def as_dict(self) -> Dict:
+        return {"role": self.role, "content": self.content, "timestamp": format_timestamp(self.timestamp)}
+
+
+@dataclass(slots=True)
+class NoteRecord:
+    content: str
+    timestamp: float
+
+    def as_dict(self) -> Dict:
+        return {"content": self.content, "timestamp": format_timestamp(self.timestamp)}
+
+
+@dataclass(slots=True)
+class TagRecord:
+    name: str
+    type: str
+    timestamp: float
+
+    def as_dict(self) -> Dict:
+        return {"name": self.name, "type": self.type, "timestamp": format_timestamp(self.timestamp)}
+
+
+@dataclass(slots=True)
+class QualityMetrics:
+    latency: float = 0
+    packet_loss: float = 0
+    jitter: float = 0
+    quality_score: float = 100
+    sentiment_score: float = 50
+    sentiment_trend: List[float] = field(default_factory=list)
+    resolution_time: int = 0
+
+    def as_dict(self) -> Dict:
+        # The trend list is copied so the result can outlive later updates
+        return {
+            "latency": self.latency,
+            "packet_loss": self.packet_loss,
+            "jitter": self.jitter,
+            "quality_score": self.quality_score,
+            "sentiment_score": self.sentiment_score,
+            "sentiment_trend": list(self.sentiment_trend),
+            "resolution_time": self.resolution_time,
+        }
+
+    @classmethod
+    def from_dict(cls, values: Dict) -> "QualityMetrics":
+        """Build metrics from a stored dict, ignoring keys this version does not know."""
+        names = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in values.items() if key in names})
+
+
+def _utcnow() -> datetime:
+    return datetime.utcnow()
+
+
+@dataclass(slots=True, eq=False)
+class CallSimulation:
+    simulation_id: str
+    start_time: datetime = field(default_factory=_utcnow)
+    end_time: Optional[datetime] = None
+    messages: List[MessageRecord] = field(default_factory=list)
+    is_active: bool = True
+    is_recording: bool = False
+    transferred_to: Optional[Dict] = None
+    transfer_reason: Optional[str] = None
+    notes: List[NoteRecord] = field(default_factory=list)
+    tags: List[TagRecord] = field(default_factory=list)
+    status: str = "in-progress"
+    last_activity: float = field(default_factory=time.monotonic)
+    # Version of the shared session state this copy is based on
+    version: int = 0
+    quality_metrics: QualityMetrics = field(default_factory=QualityMetrics)
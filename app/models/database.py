@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, ForeignKey, JSON, Float, Index, LargeBinary
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -17,8 +18,28 @@ class Call(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Simulation fields
+    simulation_id = Column(String(64), unique=True, index=True)
+    ended_at = Column(DateTime)
+    agent_id = Column(String(50))
+    transfer_reason = Column(Text)
+    quality_metrics = Column(JSON)
+    message_count = Column(Integer, default=0)
+    sentiment_score = Column(Float)
+    
+    # Composite indexes backing keyset-paginated history listings,
+    # newest first, optionally narrowed by status, agent or sentiment
+    __table_args__ = (
+        Index("ix_calls_created_id", "created_at", "id"),
+        Index("ix_calls_status_created_id", "status", "created_at", "id"),
+        Index("ix_calls_agent_created_id", "agent_id", "created_at", "id"),
+        Index("ix_calls_sentiment_created_id", "sentiment_score", "created_at", "id"),
+    )
+    
     # Relationship with messages
     messages = relationship("Message", back_populates="call")
+    notes = relationship("Note", back_populates="call")
+    tags = relationship("Tag", back_populates="call")
 
 class Message(Base):
     __tablename__ = "messages"
@@ -27,13 +48,91 @@ class Message(Base):
     call_id = Column(Integer, ForeignKey("calls.id"))
     content = Column(Text)
     role = Column(String(20))  # 'user' or 'assistant'
+    sentiment = Column(Float)  # VADER compound score, user messages only
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        Index("ix_messages_call_created", "call_id", "created_at"),
+    )
+    
     # Relationship with call
     call = relationship("Call", back_populates="messages")
 
+class Note(Base):
+    __tablename__ = "notes"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    call_id = Column(Integer, ForeignKey("calls.id"), index=True)
+    content = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    call = relationship("Call", back_populates="notes")
+
+class Tag(Base):
+    __tablename__ = "tags"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    call_id = Column(Integer, ForeignKey("calls.id"), index=True)
+    name = Column(String(50))
+    type = Column(String(20))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_tags_name_call", "name", "call_id"),
+    )
+    
+    call = relationship("Call", back_populates="tags")
+
+class CallRollup(Base):
+    __tablename__ = "call_rollups"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    granularity = Column(String(10))  # 'minute', 'hour' or 'day'
+    bucket_start = Column(DateTime)
+    call_count = Column(Integer, default=0)
+    total_duration = Column(Integer, default=0)
+    message_count = Column(Integer, default=0)
+    transferred_count = Column(Integer, default=0)
+    positive_count = Column(Integer, default=0)
+    neutral_count = Column(Integer, default=0)
+    negative_count = Column(Integer, default=0)
+    sentiment_total = Column(Float, default=0)
+    
+    __table_args__ = (
+        Index("ix_call_rollups_bucket", "granularity", "bucket_start", unique=True),
+    )
+
+class SessionState(Base):
+    __tablename__ = "session_state"
+    
+    # Live simulation state shared by all workers, see session_state_service
+    simulation_id = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+class SessionEvent(Base):
+    __tablename__ = "session_events"
+    
+    id = Column(Integer, primary_key=True)
+    payload = Column(JSON)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
 # Database initialization
 def init_db(database_url: str):
     engine = create_engine(database_url)
     Base.metadata.create_all(bind=engine)
-    return engine 
\ No newline at end of file
+    return engine
+
+def init_async_db(database_url: str, pool_size: int = 10, max_overflow: int = 20):
+    """Create a pooled async engine and session factory."""
+    engine_kwargs = {"pool_pre_ping": True}
+    # SQLite gains nothing from pool sizing and in-memory databases reject it
+    if not database_url.startswith("sqlite"):
+        engine_kwargs.update(pool_size=pool_size, max_overflow=max_overflow)
+    engine = create_async_engine(database_url, **engine_kwargs)
+    return engine, async_sessionmaker(engine, expire_on_commit=False)
+
+async def create_tables(engine) -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
@@ -1,10 +1,206 @@
-from typing import List, Dict, Any
+import os
+import time
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.models.database import Call, Message
+from sqlalchemy import func, select, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.models.database import Call, Message, CallRollup
 from app.core.logger import logger
 
+# Sentiment bands on the 0-100 sentiment_score scale
+SENTIMENT_RANGES = {
+    "positive": (52.5, None),
+    "neutral": (47.5, 52.5),
+    "negative": (None, 47.5)
+}
+
+ROLLUP_GRANULARITIES = ("minute", "hour", "day")
+
+ROLLUP_COUNTERS = (
+    "call_count", "total_duration", "message_count", "transferred_count",
+    "positive_count", "neutral_count", "negative_count", "sentiment_total",
+)
+
+# Dialects with INSERT ... ON CONFLICT DO UPDATE
+UPSERT_DIALECTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def sentiment_label(score: Optional[float]) -> str:
+    """Map a 0-100 sentiment score onto its SENTIMENT_RANGES band."""
+    score = score or 0
+    for label, (low, high) in SENTIMENT_RANGES.items():
+        if (low is None or score >= low) and (high is None or score < high):
+            return label
+    return "neutral"
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Truncate a timestamp to the start of its rollup bucket."""
+    if granularity == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
 class AnalyticsService:
+    """
+    Call analytics backed by pre-aggregated rollups.
+
+    Every ended call is folded into per-minute, per-hour and per-day
+    ``call_rollups`` rows in the same transaction that persists it, so
+    dashboard reads only touch a handful of rollup rows instead of
+    scanning the calls and messages tables.
+    """
+
+    def __init__(self, session_factory: Optional[async_sessionmaker] = None, cache_ttl: Optional[float] = None):
+        self.session_factory = session_factory
+        self.cache_ttl = cache_ttl if cache_ttl is not None else float(os.getenv("ANALYTICS_CACHE_TTL", "10"))
+        self._cache: Dict[str, tuple] = {}
+
+    @staticmethod
+    async def record_call(session, values: Dict[str, Any]) -> None:
+        """
+        Add an ended call to its minute, hour and day rollups.
+
+        Runs inside the caller's transaction so a call is counted exactly
+        once, together with the write that marks it ended. Buckets are
+        upserted, so concurrent writers creating the same bucket add up
+        instead of one failing on the unique index.
+
+        Args:
+            session: Open async session with an active transaction
+            values: Column values of the ended call
+        """
+        label = sentiment_label(values.get("sentiment_score"))
+        increments = {
+            "call_count": 1,
+            "total_duration": values.get("duration") or 0,
+            "message_count": values.get("message_count") or 0,
+            "transferred_count": 1 if values.get("agent_id") else 0,
+            "positive_count": 1 if label == "positive" else 0,
+            "neutral_count": 1 if label == "neutral" else 0,
+            "negative_count": 1 if label == "negative" else 0,
+            "sentiment_total": values.get("sentiment_score") or 0,
+        }
+        added = {k: getattr(CallRollup, k) + v for k, v in increments.items()}
+        upsert = UPSERT_DIALECTS.get(session.get_bind().dialect.name)
+        for granularity in ROLLUP_GRANULARITIES:
+            start = bucket_start(values["created_at"], granularity)
+            if upsert is not None:
+                await session.execute(
+                    upsert(CallRollup)
+                    .values(granularity=granularity, bucket_start=start, **increments)
+                    .on_conflict_do_update(index_elements=["granularity", "bucket_start"], set_=added)
+                )
+                continue
+
+            increment = (
+                update(CallRollup)
+                .where(CallRollup.granularity == granularity, CallRollup.bucket_start == start)
+                .values(added)
+            )
+            if (await session.execute(increment)).rowcount:
+                continue
+            try:
+                # A savepoint, so losing the race does not roll back the caller's transaction
+                async with session.begin_nested():
+                    await session.execute(
+                        insert(CallRollup).values(granularity=granularity, bucket_start=start, **increments)
+                    )
+            except IntegrityError:
+                await session.execute(increment)
+
+    async def get_timeseries(
+        self,
+        granularity: str = "hour",
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Get rollup buckets for a time range.
+
+        Args:
+            granularity: 'minute', 'hour' or 'day'
+            since: First bucket to include
+            until: Only buckets starting before this time
+
+        Returns:
+            List of bucket dicts, oldest first
+        """
+        if granularity not in ROLLUP_GRANULARITIES:
+            raise ValueError(f"Unsupported granularity: {granularity}")
+
+        query = select(CallRollup).where(CallRollup.granularity == granularity)
+        if since:
+            query = query.where(CallRollup.bucket_start >= bucket_start(since, granularity))
+        if until:
+            query = query.where(CallRollup.bucket_start < until)
+        query = query.order_by(CallRollup.bucket_start)
+
+        async with self.session_factory() as session:
+            rows = (await session.scalars(query)).all()
+        return [
+            {"bucket_start": row.bucket_start.isoformat(), **{k: getattr(row, k) or 0 for k in ROLLUP_COUNTERS}}
+            for row in rows
+        ]
+
+    async def get_dashboard(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Get dashboard totals, sentiment distribution and a 24 hour series.
+
+        Results are served from an in-process cache for ``cache_ttl``
+        seconds; misses read only from the day and hour rollups.
+
+        Returns:
+            Dict with stats, sentiment and calls_over_time
+        """
+        cached = self._cache.get("dashboard")
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        try:
+            now = now or datetime.utcnow()
+            async with self.session_factory() as session:
+                totals = (await session.execute(
+                    select(*[func.coalesce(func.sum(getattr(CallRollup, k)), 0) for k in ROLLUP_COUNTERS])
+                    .where(CallRollup.granularity == "day")
+                )).one()
+            totals = dict(zip(ROLLUP_COUNTERS, totals))
+
+            since = bucket_start(now, "hour") - timedelta(hours=23)
+            hourly = {row["bucket_start"]: row["call_count"] for row in await self.get_timeseries("hour", since=since)}
+            hours = [since + timedelta(hours=i) for i in range(24)]
+
+            calls = totals["call_count"]
+            dashboard = {
+                "stats": {
+                    "total_calls": calls,
+                    "average_duration": round(totals["total_duration"] / calls, 2) if calls else 0,
+                    "total_messages": totals["message_count"],
+                    "transfer_rate": round(totals["transferred_count"] / calls, 4) if calls else 0,
+                    "average_sentiment": round(totals["sentiment_total"] / calls, 2) if calls else 0,
+                },
+                "sentiment": {
+                    "positive": totals["positive_count"],
+                    "neutral": totals["neutral_count"],
+                    "negative": totals["negative_count"],
+                },
+                "calls_over_time": {
+                    "labels": [hour.strftime("%H:%M") for hour in hours],
+                    "values": [hourly.get(hour.isoformat(), 0) for hour in hours],
+                },
+            }
+        except Exception as e:
+            logger.error("Error building dashboard: %s", e)
+            return {}
+
+        self._cache["dashboard"] = (time.monotonic() + self.cache_ttl, dashboard)
+        return dashboard
+
     @staticmethod
     def get_call_statistics(db: Session) -> Dict[str, Any]:
         """Get general call statistics."""
@@ -19,7 +215,7 @@ class AnalyticsService:
                 "total_messages": total_messages
             }
         except Exception as e:
-            logger.error(f"Error getting call statistics: {str(e)}")
+            logger.error("Error getting call statistics: %s", e)
             return {}
     
     @staticmethod
@@ -50,7 +246,7 @@ class AnalyticsService:
                 ]
             }
         except Exception as e:
-            logger.error(f"Error getting call history: {str(e)}")
+            logger.error("Error getting call history: %s", e)
             return {}
     
     @staticmethod
@@ -71,5 +267,5 @@ class AnalyticsService:
                 }
             }
         except Exception as e:
-            logger.error(f"Error analyzing conversation: {str(e)}")
+            logger.error("Error analyzing conversation: %s", e)
             return {} 
\ No newline at end of file
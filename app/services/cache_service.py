@@ -0,0 +1,265 @@
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from app.services.llm_service import FALLBACK_RESPONSE
+from app.services.context_service import is_history_note
+from app.core.logger import logger
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace."""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", text.lower())).strip()
+
+
+class InMemoryCacheBackend:
+    """Process-local LRU cache with per-entry TTL."""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, key: str) -> None:
+        self.entries.pop(key, None)
+
+
+class RedisCacheBackend:
+    """
+    Cache backend for a Redis-compatible server.
+
+    TTL is set per key; size-bounded eviction is left to the server's
+    maxmemory policy (allkeys-lru is recommended).
+    """
+
+    def __init__(self, url: Optional[str] = None, client=None, prefix: str = "llm-cache:"):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        await self.client.set(self.prefix + key, value, ex=ttl)
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(self.prefix + key)
+
+
+class SemanticIndex:
+    """
+    Bounded in-process index of suffix embeddings for near-duplicate lookups.
+
+    Vectors are kept L2-normalized in one matrix so a lookup is a single
+    matrix-vector product.
+    """
+
+    def __init__(self, embedder: Callable[[str], Sequence[float]], threshold: float, max_entries: int):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.keys: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self.vectors: Optional[np.ndarray] = None
+        self.slot_keys: List[Optional[str]] = []
+        self.free_slots: List[int] = []
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.asarray(self.embedder(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def search(self, namespace: str, vector: np.ndarray) -> Optional[str]:
+        if self.vectors is None or not self.keys:
+            return None
+        scores = self.vectors @ vector
+        for slot in np.argsort(scores)[::-1]:
+            if scores[slot] < self.threshold:
+                return None
+            key = self.slot_keys[slot]
+            if key is not None and self.keys[key][0] == namespace:
+                self.keys.move_to_end(key)
+                return key
+        return None
+
+    def add(self, namespace: str, key: str, vector: np.ndarray) -> None:
+        if key in self.keys:
+            self.keys.move_to_end(key)
+            return
+        if len(self.keys) >= self.max_entries:
+            evicted, (_, evicted_slot) = self.keys.popitem(last=False)
+            self.slot_keys[evicted_slot] = None
+            self.vectors[evicted_slot] = 0
+            self.free_slots.append(evicted_slot)
+
+        if self.vectors is None:
+            self.vectors = np.zeros((0, vector.shape[0]), dtype=np.float32)
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.vectors[slot] = vector
+            self.slot_keys[slot] = key
+        else:
+            slot = len(self.slot_keys)
+            self.vectors = np.vstack([self.vectors, vector[np.newaxis, :]])
+            self.slot_keys.append(key)
+        self.keys[key] = (namespace, slot)
+
+    def remove(self, key: str) -> None:
+        entry = self.keys.pop(key, None)
+        if entry is not None:
+            _, slot = entry
+            self.slot_keys[slot] = None
+            self.vectors[slot] = 0
+            self.free_slots.append(slot)
+
+
+class ResponseCache:
+    """
+    Cache of LLM responses keyed on the system prompt and the normalized
+    conversation.
+
+    Only conversations short enough to carry nothing caller-specific from
+    earlier turns are cached: at most ``suffix_messages`` dialogue messages
+    and no running summary, i.e. opening intents. A reply to a later turn
+    can depend on details (names, order numbers) from the earlier context,
+    so it is never served to another caller.
+
+    An optional embedding tier serves near-duplicate phrasings of a cached
+    request ("what time do you open" vs "what are your opening hours").
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        ttl: Optional[int] = None,
+        suffix_messages: Optional[int] = None,
+        embedder: Optional[Callable[[str], Sequence[float]]] = None,
+        similarity_threshold: float = 0.92,
+        max_semantic_entries: int = 5000,
+    ):
+        self.backend = backend or InMemoryCacheBackend(int(os.getenv("CACHE_MAX_ENTRIES", "10000")))
+        self.ttl = ttl or int(os.getenv("CACHE_TTL_SECONDS", "3600"))
+        self.suffix_messages = suffix_messages or int(os.getenv("CACHE_SUFFIX_MESSAGES", "2"))
+        self.semantic_index = (
+            SemanticIndex(embedder, similarity_threshold, max_semantic_entries) if embedder else None
+        )
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        # Lookups for conversations too far along to be cached
+        self.skipped = 0
+
+    def _split(self, messages: List[Dict[str, str]]) -> Optional[Tuple[str, str]]:
+        """
+        Return the namespace (system prompt hash) and normalized dialogue
+        text, or None if the conversation is too far along to be shared.
+        """
+        if any(m["role"] == "system" and is_history_note(m["content"]) for m in messages):
+            return None
+        dialogue = [m for m in messages if m["role"] != "system"]
+        if len(dialogue) > self.suffix_messages:
+            return None
+        system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+        namespace = hashlib.sha256(system.encode()).hexdigest()[:16]
+        dialogue_text = "\n".join(f"{m['role']}: {normalize_text(m['content'])}" for m in dialogue)
+        return namespace, dialogue_text
+
+    @staticmethod
+    def _key(namespace: str, suffix_text: str) -> str:
+        return namespace + ":" + hashlib.sha256(suffix_text.encode()).hexdigest()
+
+    async def get(self, messages: List[Dict[str, str]]) -> Optional[str]:
+        """
+        Look up a cached response for a conversation.
+
+        Args:
+            messages: LLM request messages for the turn
+
+        Returns:
+            Optional[str]: Cached response, or None on a miss
+        """
+        try:
+            split = self._split(messages)
+            if split is None:
+                self.skipped += 1
+                return None
+            namespace, suffix_text = split
+            key = self._key(namespace, suffix_text)
+            response = await self.backend.get(key)
+            if response is not None:
+                self.hits += 1
+                return response
+
+            if self.semantic_index:
+                similar_key = self.semantic_index.search(namespace, self.semantic_index.embed(suffix_text))
+                if similar_key:
+                    response = await self.backend.get(similar_key)
+                    if response is not None:
+                        self.semantic_hits += 1
+                        return response
+                    # Expired or evicted in the backend
+                    self.semantic_index.remove(similar_key)
+
+            self.misses += 1
+            return None
+        except Exception as e:
+            logger.error("Error reading response cache: %s", e)
+            self.misses += 1
+            return None
+
+    async def set(self, messages: List[Dict[str, str]], response: str) -> None:
+        """Store a response for a conversation."""
+        if not response or response == FALLBACK_RESPONSE:
+            return
+        try:
+            split = self._split(messages)
+            if split is None:
+                return
+            namespace, suffix_text = split
+            key = self._key(namespace, suffix_text)
+            await self.backend.set(key, response, self.ttl)
+            if self.semantic_index:
+                self.semantic_index.add(namespace, key, self.semantic_index.embed(suffix_text))
+        except Exception as e:
+            logger.error("Error writing response cache: %s", e)
+
+    def get_stats(self) -> Dict[str, float]:
+        """Get hit/miss counters for the cache."""
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "evictions": getattr(self.backend, "evictions", 0),
+        }
@@ -0,0 +1,396 @@
+"""
+Synthetic call generation for evaluating prompts at volume.
+
+Thousands of scripted or LLM-persona callers are run concurrently
+against SimulationService. Transcripts are scored for sentiment in a
+process pool while calls are still running, and the results are
+written column by column, to NumPy ``.npz`` or, with pyarrow installed,
+Parquet, for comparing prompt changes offline:
+
+    python -m app.services.call_generator_service --calls 10000 --concurrency 200 \\
+        --seed 7 --output run.npz
+
+Each call draws its caller and wording from a random generator seeded
+with the run seed and the call's index, and simulated network
+conditions are seeded the same way, so a rerun with the same seed
+replays the same callers regardless of scheduling. LLM replies are only
+reproducible as far as the model is.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from app.services.simulation_service import SimulationService
+from app.services.sentiment_service import SentimentService, scoring_pool, score_compounds
+from app.core.logger import logger
+
+# Each turn lists interchangeable wordings
+DEFAULT_SCRIPTS = [
+    {
+        "name": "billing-refund",
+        "turns": [
+            ["Hi, I was charged twice for my last order.", "Hello, there is a duplicate charge on my card."],
+            ["The order number is 48213.", "It was order 48213, placed last Tuesday."],
+            ["Can you refund the duplicate charge?", "I would like the second payment refunded, please."],
+            ["Thanks, that is really helpful!", "Great, thank you for sorting that out."],
+        ],
+    },
+    {
+        "name": "technical-support",
+        "turns": [
+            ["My internet keeps dropping every few minutes.", "The Wi-Fi connection has been unstable all week."],
+            ["I already restarted the router twice.", "Yes, I have tried turning it off and on again."],
+            ["The light on the router is blinking orange.", "There is an orange light flashing on the front."],
+            ["Okay, I will try that now. Thanks.", "Alright, thanks for the help."],
+        ],
+    },
+    {
+        "name": "angry-escalation",
+        "turns": [
+            ["This is the third time I am calling about the same problem!", "Nobody has fixed my issue after two calls."],
+            ["I want to speak to a manager right now.", "Please transfer me to a supervisor."],
+            ["Fine, but I expect a callback today.", "Then make sure someone calls me back today."],
+        ],
+    },
+]
+
+PERSONA_PROMPT = (
+    "You are role-playing a caller phoning a company's customer service line. {persona} "
+    "Reply with the caller's next line only, in one or two sentences. "
+    "When your issue is resolved or you want to hang up, end your line with GOODBYE."
+)
+END_MARKER = "GOODBYE"
+
+
+class ScriptedCaller:
+    """Reads a script, picking one wording per turn."""
+
+    def __init__(self, spec: Dict, rng: random.Random):
+        self.name = spec["name"]
+        self.lines = [rng.choice(turn) if isinstance(turn, list) else turn for turn in spec["turns"]]
+
+    async def next_message(self, transcript: List[Tuple[str, str]]) -> Optional[str]:
+        turn = sum(1 for role, _ in transcript if role == "user")
+        return self.lines[turn] if turn < len(self.lines) else None
+
+
+class PersonaCaller:
+    """Plays a persona with an LLM, until it says goodbye or runs out of turns."""
+
+    def __init__(self, spec: Dict, llm_service, max_turns: int = 8):
+        self.name = spec["name"]
+        self.opening = spec.get("opening")
+        self.system = PERSONA_PROMPT.format(persona=spec["persona"])
+        self.llm_service = llm_service
+        self.max_turns = spec.get("max_turns", max_turns)
+
+    async def next_message(self, transcript: List[Tuple[str, str]]) -> Optional[str]:
+        turns = sum(1 for role, _ in transcript if role == "user")
+        if turns >= self.max_turns or (transcript and END_MARKER in transcript[-2][1]):
+            return None
+        if not transcript and self.opening:
+            return self.opening
+        # The caller is the assistant here, so the roles are swapped
+        messages = [{"role": "system", "content": self.system}] + [
+            {"role": "assistant" if role == "user" else "user", "content": content}
+            for role, content in transcript
+        ]
+        if not transcript:
+            messages.append({"role": "user", "content": "Thank you for calling, how can I help you today?"})
+        reply = await self.llm_service.get_response_async(messages, max_tokens=80)
+        return reply.strip() or None
+
+
+class CallBatch:
+    """Generated calls as columns: one row per call and one row per message."""
+
+    def __init__(self, calls: Dict[str, np.ndarray], messages: Dict[str, np.ndarray]):
+        self.calls = calls
+        self.messages = messages
+
+    def write(self, path: str) -> List[str]:
+        """
+        Write the batch to ``.npz`` (one file, ``calls.*`` and ``messages.*``
+        arrays) or ``.parquet`` (``<name>.calls.parquet`` and
+        ``<name>.messages.parquet``).
+
+        Returns:
+            List[str]: Paths written
+        """
+        if path.endswith(".parquet"):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            base = path[:-len(".parquet")]
+            paths = []
+            for table_name, columns in (("calls", self.calls), ("messages", self.messages)):
+                table_path = f"{base}.{table_name}.parquet"
+                pq.write_table(pa.table(columns), table_path)
+                paths.append(table_path)
+            return paths
+        np.savez_compressed(path, **{
+            f"{table_name}.{column}": values
+            for table_name, columns in (("calls", self.calls), ("messages", self.messages))
+            for column, values in columns.items()
+        })
+        return [path if path.endswith(".npz") else path + ".npz"]
+
+    @classmethod
+    def read(cls, path: str) -> "CallBatch":
+        """Load a batch written to ``.npz``."""
+        calls, messages = {}, {}
+        with np.load(path) as data:
+            for key in data.files:
+                table_name, column = key.split(".", 1)
+                (calls if table_name == "calls" else messages)[column] = data[key]
+        return cls(calls, messages)
+
+
+class CallGenerator:
+    def __init__(
+        self,
+        simulation_service: SimulationService,
+        callers: Optional[Sequence[Dict]] = None,
+        caller_llm=None,
+        concurrency: int = 100,
+        seed: int = 0,
+        score_workers: Optional[int] = None,
+        score_batch: int = 2000,
+    ):
+        """
+        Args:
+            simulation_service: Service the calls run against
+            callers: Caller specs; scripts have ``turns``, personas have ``persona``
+            caller_llm: LLM playing persona callers
+            concurrency: Calls in progress at once
+            seed: Seed for caller choice and wording
+            score_workers: Sentiment scoring processes; 1 scores in this process
+            score_batch: Messages per scoring batch
+        """
+        self.simulation_service = simulation_service
+        self.callers = list(callers or DEFAULT_SCRIPTS)
+        if any("persona" in spec for spec in self.callers) and caller_llm is None:
+            raise ValueError("Persona callers need a caller_llm")
+        self.caller_llm = caller_llm
+        self.concurrency = concurrency
+        self.seed = seed
+        self.score_workers = score_workers or int(os.getenv("SENTIMENT_BACKFILL_WORKERS", str(os.cpu_count() or 1)))
+        self.score_batch = score_batch
+
+    def _caller(self, index: int):
+        rng = random.Random(f"{self.seed}:{index}")
+        spec = rng.choice(self.callers)
+        if "persona" in spec:
+            return PersonaCaller(spec, self.caller_llm)
+        return ScriptedCaller(spec, rng)
+
+    async def _run_call(self, index: int) -> Dict:
+        """Run one call to completion and collect its transcript and metrics."""
+        service = self.simulation_service
+        simulation_id = f"synthetic-{self.seed}-{index}"
+        caller = self._caller(index)
+        transcript: List[Tuple[str, str]] = []
+        response_ms: List[float] = []
+        completed = True
+        started = time.perf_counter()
+
+        service.start_simulation(simulation_id)
+        try:
+            while True:
+                message = await caller.next_message(transcript)
+                if message is None:
+                    break
+                turn_started = time.perf_counter()
+                response = await service.process_message(simulation_id, message)
+                if response is None:
+                    completed = False
+                    break
+                response_ms.append((time.perf_counter() - turn_started) * 1000)
+                transcript.append(("user", message))
+                transcript.append(("assistant", response))
+            simulation = service.active_simulations[simulation_id]
+            service.end_simulation(simulation_id, reason="completed" if completed else "failed")
+            metrics = simulation.quality_metrics
+            return {
+                "index": index,
+                "simulation_id": simulation_id,
+                "caller": caller.name,
+                "completed": completed,
+                "transferred": simulation.transferred_to is not None,
+                "duration_ms": (time.perf_counter() - started) * 1000,
+                "quality_score": metrics.quality_score,
+                "latency": metrics.latency,
+                "packet_loss": metrics.packet_loss,
+                "jitter": metrics.jitter,
+                "transcript": transcript,
+                "response_ms": response_ms,
+            }
+        finally:
+            # Nothing is kept once the call has been collected, even if it raised
+            service.active_simulations.pop(simulation_id, None)
+            service.context_service.drop(simulation_id)
+
+    async def run(self, calls: int) -> CallBatch:
+        """
+        Run ``calls`` synthetic calls, ``concurrency`` at a time.
+
+        Returns:
+            CallBatch: Per-call and per-message columns, ordered by call index
+        """
+        loop = asyncio.get_running_loop()
+        pool = scoring_pool(self.score_workers) if self.score_workers > 1 else None
+        local_scorer = SentimentService() if pool is None else None
+        indexes = iter(range(calls))
+        results: List[Dict] = []
+        texts: List[str] = []
+        scoring: List = []
+
+        def submit_scoring() -> None:
+            batch = texts[:]
+            texts.clear()
+            if pool is not None:
+                scoring.append(loop.run_in_executor(pool, score_compounds, batch))
+            else:
+                # Scoring is CPU-bound, so keep it off the event loop running the calls
+                scoring.append(asyncio.ensure_future(asyncio.to_thread(lambda: local_scorer.analyze_batch(batch)[:, 3])))
+
+        async def worker() -> None:
+            for index in indexes:
+                try:
+                    result = await self._run_call(index)
+                except Exception as e:
+                    logger.error("Error in synthetic call %s: %s", index, e)
+                    continue
+                results.append(result)
+                texts.extend(content for _, content in result["transcript"])
+                if len(texts) >= self.score_batch:
+                    submit_scoring()
+
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*[worker() for _ in range(min(self.concurrency, calls) or 1)])
+            if texts:
+                submit_scoring()
+            compounds = await asyncio.gather(*scoring)
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+        logger.info("Generated %s synthetic calls in %.1f s", len(results), time.perf_counter() - started)
+        # Messages were scored in completion order, which is also the order of results
+        compound = np.concatenate(compounds).astype(np.float32) if compounds else np.empty(0, dtype=np.float32)
+        return self._to_columns(results, compound)
+
+    @staticmethod
+    def _to_columns(results: List[Dict], compound: np.ndarray) -> CallBatch:
+        lengths = np.array([len(result["transcript"]) for result in results], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        order = np.argsort([result["index"] for result in results], kind="stable")
+        results = [results[i] for i in order]
+        # Reorder each call's block of message scores along with the calls
+        compound = np.concatenate([compound[offsets[i]:offsets[i + 1]] for i in order]) if len(order) else compound
+
+        call_index = np.repeat(np.array([r["index"] for r in results], dtype=np.int32), lengths[order])
+        roles = np.array([role for r in results for role, _ in r["transcript"]], dtype="U9")
+        is_user = roles == "user"
+        response_ms = np.full(len(roles), np.nan, dtype=np.float32)
+        response_ms[~is_user] = [ms for r in results for ms in r["response_ms"]]
+
+        call_row = np.repeat(np.arange(len(results)), lengths[order])
+
+        def mean_by_call(mask: np.ndarray) -> np.ndarray:
+            positions = call_row[mask]
+            sums = np.bincount(positions, weights=compound[mask], minlength=len(results))
+            counts = np.bincount(positions, minlength=len(results))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return (sums / counts).astype(np.float32)
+
+        calls = {
+            "call_index": np.array([r["index"] for r in results], dtype=np.int32),
+            "simulation_id": np.array([r["simulation_id"] for r in results], dtype=str),
+            "caller": np.array([r["caller"] for r in results], dtype=str),
+            "completed": np.array([r["completed"] for r in results], dtype=bool),
+            "transferred": np.array([r["transferred"] for r in results], dtype=bool),
+            "turns": (lengths[order] // 2).astype(np.int16),
+            "duration_ms": np.array([r["duration_ms"] for r in results], dtype=np.float32),
+            "mean_response_ms": np.array(
+                [np.mean(r["response_ms"]) if r["response_ms"] else np.nan for r in results], dtype=np.float32
+            ),
+            "quality_score": np.array([r["quality_score"] for r in results], dtype=np.float32),
+            "latency": np.array([r["latency"] for r in results], dtype=np.float32),
+            "packet_loss": np.array([r["packet_loss"] for r in results], dtype=np.float32),
+            "jitter": np.array([r["jitter"] for r in results], dtype=np.float32),
+            "caller_sentiment": mean_by_call(is_user),
+            "agent_sentiment": mean_by_call(~is_user),
+        }
+        messages = {
+            "call_index": call_index,
+            "position": np.concatenate([np.arange(n, dtype=np.int16) for n in lengths[order]])
+            if len(order) else np.empty(0, dtype=np.int16),
+            "role": roles,
+            "content": np.array([content for r in results for _, content in r["transcript"]], dtype=str),
+            "response_ms": response_ms,
+            "sentiment": compound,
+        }
+        return CallBatch(calls, messages)
+
+
+def summarize(batch: CallBatch) -> Dict:
+    """Headline numbers for comparing two runs."""
+    calls = batch.calls
+    return {
+        "calls": int(len(calls["call_index"])),
+        "completed": int(calls["completed"].sum()),
+        "transferred": int(calls["transferred"].sum()),
+        "mean_turns": float(calls["turns"].mean()) if len(calls["turns"]) else 0.0,
+        "mean_response_ms": float(np.nanmean(calls["mean_response_ms"])) if calls["completed"].any() else None,
+        "mean_caller_sentiment": float(np.nanmean(calls["caller_sentiment"])) if len(calls["turns"]) else None,
+        "mean_quality_score": float(calls["quality_score"].mean()) if len(calls["turns"]) else None,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    from app.services.llm_router_service import create_llm_service
+
+    parser = argparse.ArgumentParser(description="Run synthetic calls against the simulator")
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--callers", help="JSON file of caller scripts and personas (default: built-in scripts)")
+    parser.add_argument("--score-workers", type=int, help="Sentiment scoring processes")
+    parser.add_argument("--coalesce", action="store_true",
+                        help="Let identical conversations share LLM replies (fewer independent samples)")
+    parser.add_argument("--output", default="synthetic_calls.npz", help=".npz or .parquet")
+    args = parser.parse_args(argv)
+
+    callers = None
+    if args.callers:
+        with open(args.callers) as callers_file:
+            callers = json.load(callers_file)
+
+    async def run() -> CallBatch:
+        llm_service = create_llm_service()
+        llm_service.coalescer.enabled = args.coalesce
+        generator = CallGenerator(
+            SimulationService(llm_service, seed=args.seed),
+            callers=callers,
+            caller_llm=llm_service,
+            concurrency=args.concurrency,
+            seed=args.seed,
+            score_workers=args.score_workers,
+        )
+        try:
+            return await generator.run(args.calls)
+        finally:
+            await llm_service.aclose()
+
+    batch = asyncio.run(run())
+    paths = batch.write(args.output)
+    print(json.dumps({**summarize(batch), "output": paths}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
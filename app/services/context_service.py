@@ -0,0 +1,157 @@
+import asyncio
+import os
+from collections import deque
+from typing import Deque, Dict, List, Optional
+from app.services.llm_service import LLMService, FALLBACK_RESPONSE
+from app.core.logger import logger
+
+SUMMARY_PROMPT = """Update the running summary of a customer support call.
+Keep every fact the assistant needs to continue helping the caller
+(names, account details, issues, promises made) and drop small talk.
+Reply with the updated summary only."""
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+OMITTED_NOTE = "{count} earlier messages were omitted because they could not be summarized."
+
+
+def is_history_note(content: str) -> bool:
+    """Whether a system message stands in for earlier turns (a summary or an omission note)."""
+    return content.startswith(SUMMARY_PREFIX) or content.endswith(OMITTED_NOTE.format(count="")[1:])
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token plus message overhead)."""
+    return len(text) // 4 + 4
+
+
+class ConversationContext:
+    """Cached LLM projection of a single conversation."""
+
+    def __init__(self):
+        self.window: Deque[Dict[str, str]] = deque()
+        self.window_tokens = 0
+        self.pending: List[Dict[str, str]] = []
+        self.pending_tokens = 0
+        self.summary = ""
+        self.summary_task: Optional[asyncio.Task] = None
+        # Consecutive failed summaries, and messages dropped after too many
+        self.summary_failures = 0
+        self.omitted = 0
+
+
+class ContextService:
+    """
+    Keeps the prompt sent for each turn within a fixed token budget.
+
+    Recent messages live in a rolling window. Messages pushed out of the
+    window are folded into a running summary in the background; until the
+    summary catches up they are still sent verbatim. If summarization keeps
+    failing, the oldest of them are dropped and replaced by a note, so the
+    prompt stays bounded even while the LLM is down.
+    """
+
+    def __init__(
+        self,
+        llm_service: LLMService,
+        max_tokens: Optional[int] = None,
+        summary_trigger_tokens: Optional[int] = None,
+        summary_max_tokens: Optional[int] = None,
+        max_summary_failures: Optional[int] = None,
+    ):
+        self.llm_service = llm_service
+        self.max_tokens = max_tokens or int(os.getenv("CONTEXT_MAX_TOKENS", "2000"))
+        self.summary_trigger_tokens = summary_trigger_tokens or int(os.getenv("CONTEXT_SUMMARY_TRIGGER_TOKENS", "400"))
+        self.summary_max_tokens = summary_max_tokens or int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "200"))
+        self.max_summary_failures = max_summary_failures or int(os.getenv("CONTEXT_SUMMARY_MAX_FAILURES", "3"))
+        self.contexts: Dict[str, ConversationContext] = {}
+
+    def append(self, conversation_id: str, role: str, content: str) -> None:
+        """Add a message to a conversation, evicting the oldest ones over budget."""
+        context = self.contexts.setdefault(conversation_id, ConversationContext())
+        context.window.append({"role": role, "content": content})
+        context.window_tokens += estimate_tokens(content)
+
+        # Always keep the latest message, even if it alone exceeds the budget
+        while context.window_tokens > self.max_tokens and len(context.window) > 1:
+            evicted = context.window.popleft()
+            tokens = estimate_tokens(evicted["content"])
+            context.window_tokens -= tokens
+            context.pending.append(evicted)
+            context.pending_tokens += tokens
+
+    async def build_messages(self, conversation_id: str) -> List[Dict[str, str]]:
+        """
+        Build the LLM request for the next turn of a conversation.
+
+        Args:
+            conversation_id: Conversation to build the request for
+
+        Returns:
+            List[Dict[str, str]]: System prompt, summary of evicted turns and
+            the recent message window
+        """
+        context = self.contexts.setdefault(conversation_id, ConversationContext())
+
+        if (
+            context.pending_tokens >= self.summary_trigger_tokens
+            and (context.summary_task is None or context.summary_task.done())
+        ):
+            context.summary_task = asyncio.create_task(self._summarize(context))
+
+        messages: List[Dict[str, str]] = []
+        if context.omitted:
+            messages.append({"role": "system", "content": OMITTED_NOTE.format(count=context.omitted)})
+        if context.summary:
+            messages.append({
+                "role": "system",
+                "content": SUMMARY_PREFIX + context.summary
+            })
+        messages.extend(context.pending)
+        messages.extend(context.window)
+        return self.llm_service.format_conversation_history(messages)
+
+    def drop(self, conversation_id: str) -> None:
+        """Release the cached context of a finished conversation."""
+        context = self.contexts.pop(conversation_id, None)
+        if context and context.summary_task and not context.summary_task.done():
+            context.summary_task.cancel()
+
+    async def _summarize(self, context: ConversationContext) -> None:
+        """Fold the pending messages into the running summary."""
+        batch = list(context.pending)
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in batch)
+        try:
+            summary = await self.llm_service.get_response_async(
+                [
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {
+                        "role": "user",
+                        "content": f"Current summary:\n{context.summary or '(none)'}\n\nNew turns:\n{transcript}"
+                    },
+                ],
+                max_tokens=self.summary_max_tokens,
+            )
+            if not summary or summary == FALLBACK_RESPONSE:
+                self._summary_failed(context)
+                return
+
+            context.summary_failures = 0
+            context.summary = summary.strip()
+            # Messages evicted while the summary was being generated stay pending
+            del context.pending[:len(batch)]
+            context.pending_tokens = sum(estimate_tokens(m["content"]) for m in context.pending)
+        except Exception as e:
+            logger.error("Error summarizing conversation: %s", e)
+            self._summary_failed(context)
+
+    def _summary_failed(self, context: ConversationContext) -> None:
+        """After repeated failures, drop the oldest pending messages down to the summary trigger."""
+        context.summary_failures += 1
+        if context.summary_failures < self.max_summary_failures:
+            return
+        dropped = 0
+        while context.pending and context.pending_tokens >= self.summary_trigger_tokens:
+            context.pending_tokens -= estimate_tokens(context.pending.pop(0)["content"])
+            dropped += 1
+        if dropped:
+            context.omitted += dropped
+            logger.warning("Summarization keeps failing; omitted %d earlier messages", dropped)
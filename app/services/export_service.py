@@ -0,0 +1,100 @@
+import csv
+import io
+import json
+import zlib
+from typing import Any, AsyncIterator, Dict
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+CSV_COLUMNS = [
+    "simulation_id", "start_time", "end_time", "duration", "status", "agent_id",
+    "transfer_reason", "quality_score", "sentiment_score", "tags", "notes",
+    "message_index", "role", "content", "message_time",
+]
+
+
+class ExportService:
+    """Serialize call records into a streamed CSV or NDJSON download."""
+
+    def __init__(self, flush_bytes: int = 64 * 1024):
+        self.flush_bytes = flush_bytes
+
+    async def stream(
+        self,
+        records: AsyncIterator[Dict[str, Any]],
+        fmt: str = "csv",
+        compress: bool = False,
+    ) -> AsyncIterator[bytes]:
+        """
+        Encode call records as they arrive.
+
+        Output is buffered into chunks of roughly ``flush_bytes`` so the
+        response is not written one row at a time, and optionally gzip
+        compressed on the fly.
+
+        Args:
+            records: Call records with messages, notes and tags
+            fmt: 'csv' (one row per message) or 'ndjson' (one line per call)
+            compress: Gzip the output stream
+
+        Yields:
+            bytes: Encoded chunks of the export
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+
+        compressor = zlib.compressobj(wbits=31) if compress else None
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == "csv" else None
+        if writer:
+            writer.writerow(CSV_COLUMNS)
+
+        async for record in records:
+            if writer:
+                self._write_csv_rows(writer, record)
+            else:
+                buffer.write(json.dumps(record))
+                buffer.write("\n")
+
+            if buffer.tell() >= self.flush_bytes:
+                chunk = self._drain(buffer, compressor)
+                if chunk:
+                    yield chunk
+
+        chunk = self._drain(buffer, compressor)
+        if compressor:
+            chunk += compressor.flush()
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def _drain(buffer: io.StringIO, compressor) -> bytes:
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    @staticmethod
+    def _write_csv_rows(writer, record: Dict[str, Any]) -> None:
+        metrics = record.get("quality_metrics") or {}
+        call_columns = [
+            record["simulation_id"],
+            record["start_time"],
+            record["end_time"] or "",
+            record["duration"] if record["duration"] is not None else "",
+            record["status"],
+            record.get("agent_id") or "",
+            record.get("transfer_reason") or "",
+            metrics.get("quality_score", ""),
+            metrics.get("sentiment_score", ""),
+            ";".join(f"{t['name']}:{t['type']}" for t in record["tags"]),
+            " | ".join(n["content"] for n in record["notes"]),
+        ]
+        if not record["messages"]:
+            writer.writerow(call_columns + ["", "", "", ""])
+            return
+        for index, message in enumerate(record["messages"]):
+            writer.writerow(call_columns + [index, message["role"], message["content"], message["timestamp"]])
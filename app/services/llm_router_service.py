@@ -0,0 +1,424 @@
+"""
+Routing LLM requests across several backends.
+
+Each backend (a provider or model, wrapped in an LLMService) keeps an
+EWMA of its latency, a window of recent latencies and a circuit breaker.
+Requests go to the fastest healthy backend; if it has not answered by
+its own p95 latency, the request is hedged to the next backend and the
+first answer wins, the other request being cancelled. Failures fall
+through to the remaining backends, and a backend that keeps failing is
+skipped until its breaker lets a trial request through again.
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+from app.core.logger import logger
+from app.core.coalescing import RequestCoalescer, request_key
+from app.core.metrics import LLM_BACKEND_REQUESTS, LLM_HEDGES
+from app.services.llm_service import LLMService, FALLBACK_RESPONSE, with_fallback
+
+T = TypeVar("T")
+
+
+class NoBackendAvailable(Exception):
+    """Every backend's circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed until ``failure_threshold`` consecutive failures, then open for
+    ``reset_timeout`` seconds; after that a single trial request is let
+    through (half-open), which closes the breaker again on success.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    __slots__ = ("failure_threshold", "reset_timeout", "state", "failures", "opened_at", "_trial")
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+
+    def available(self) -> bool:
+        """Whether a request could be sent now, without claiming the trial slot."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.reset_timeout
+        return not self._trial
+
+    def acquire(self) -> bool:
+        """Claim permission to send a request."""
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._trial:
+                return False
+            self._trial = True
+        return self.state != self.OPEN
+
+    def release(self) -> None:
+        """Give back a claimed trial without an outcome, e.g. when it was cancelled."""
+        self._trial = False
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("Circuit breaker opened after %d failures", self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class BackendState:
+    """Health and latency statistics for one backend."""
+
+    __slots__ = ("service", "breaker", "alpha", "ewma", "latencies", "requests", "failures")
+
+    def __init__(self, service, breaker: CircuitBreaker, alpha: float = 0.2, window: int = 100):
+        self.service = service
+        self.breaker = breaker
+        self.alpha = alpha
+        self.ewma: Optional[float] = None
+        self.latencies: deque = deque(maxlen=window)
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def name(self) -> str:
+        return self.service.name
+
+    def observe(self, latency: float) -> None:
+        self.latencies.append(latency)
+        self.ewma = latency if self.ewma is None else self.alpha * latency + (1 - self.alpha) * self.ewma
+
+    def p95(self) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+
+
+class LLMRouter:
+    def __init__(
+        self,
+        backends: List,
+        hedge_delay: Optional[float] = None,
+        min_hedge_delay: Optional[float] = None,
+        max_hedge_delay: Optional[float] = None,
+        min_samples: int = 20,
+        ewma_alpha: float = 0.2,
+        failure_threshold: Optional[int] = None,
+        reset_timeout: Optional[float] = None,
+    ):
+        """
+        Args:
+            backends: Services with ``name``, ``complete`` and ``stream``, in order of preference
+            hedge_delay: Hedge delay used until a backend has ``min_samples`` latencies
+            min_hedge_delay: Lower bound on the p95-based hedge delay
+            max_hedge_delay: Upper bound on the p95-based hedge delay
+            min_samples: Latencies needed before a backend's p95 is trusted
+            ewma_alpha: Weight of the newest latency in the EWMA
+            failure_threshold: Consecutive failures that open a backend's breaker
+            reset_timeout: Seconds a breaker stays open before a trial request
+        """
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        failure_threshold = failure_threshold or int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+        reset_timeout = reset_timeout or float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+        self.backends = [
+            BackendState(service, CircuitBreaker(failure_threshold, reset_timeout), ewma_alpha)
+            for service in backends
+        ]
+        self.hedge_delay = hedge_delay or float(os.getenv("LLM_HEDGE_DELAY", "2.0"))
+        self.min_hedge_delay = min_hedge_delay if min_hedge_delay is not None else float(
+            os.getenv("LLM_HEDGE_MIN_DELAY", "0.05")
+        )
+        self.max_hedge_delay = max_hedge_delay or float(os.getenv("LLM_HEDGE_MAX_DELAY", "10"))
+        self.min_samples = min_samples
+        self.name = "router"
+        self.coalescer = RequestCoalescer(self.name)
+
+    def _ranked(self) -> List[BackendState]:
+        """Healthy backends, fastest first; untried ones keep their configured order after the rest."""
+        candidates = [backend for backend in self.backends if backend.breaker.available()]
+        return sorted(candidates, key=lambda backend: math.inf if backend.ewma is None else backend.ewma)
+
+    def _hedge_after(self, backend: BackendState) -> float:
+        if len(backend.latencies) < self.min_samples:
+            return self.hedge_delay
+        return min(max(backend.p95(), self.min_hedge_delay), self.max_hedge_delay)
+
+    async def _attempt(self, backend: BackendState, call: Callable[[], Awaitable[T]]) -> T:
+        backend.requests += 1
+        started = time.perf_counter()
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            # A hedged loser took at least this long; counting it keeps a slow
+            # backend from staying first in the ranking
+            backend.observe(time.perf_counter() - started)
+            backend.breaker.release()
+            LLM_BACKEND_REQUESTS.labels(backend.name, "cancelled").inc()
+            raise
+        except Exception as e:
+            backend.failures += 1
+            backend.breaker.record_failure()
+            outcome = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            LLM_BACKEND_REQUESTS.labels(backend.name, outcome).inc()
+            logger.warning("LLM backend %s failed: %s", backend.name, str(e) or type(e).__name__)
+            raise
+        backend.observe(time.perf_counter() - started)
+        backend.breaker.record_success()
+        LLM_BACKEND_REQUESTS.labels(backend.name, "ok").inc()
+        return result
+
+    async def _race(
+        self,
+        start: Callable[[BackendState], Awaitable[T]],
+        discard: Optional[Callable[[T], Awaitable[None]]] = None,
+    ) -> T:
+        """
+        Run ``start`` on the best backend, hedging and falling back as needed.
+
+        Args:
+            start: Sends the request to one backend
+            discard: Releases a result that lost the race
+
+        Returns:
+            The first successful result
+
+        Raises:
+            NoBackendAvailable: If every breaker is open
+            Exception: The last backend's error if all of them failed
+        """
+        candidates = self._ranked()
+        pending: Dict[asyncio.Task, BackendState] = {}
+        hedge: Optional[asyncio.Task] = None
+        hedged = False
+        last_error: Optional[BaseException] = None
+        try:
+            while True:
+                if not pending:
+                    # First attempt, or every attempt so far failed
+                    self._launch(candidates, pending, start)
+                    if not pending:
+                        if last_error is not None:
+                            raise last_error
+                        raise NoBackendAvailable("All LLM backends are unavailable")
+
+                # Only one hedge per request, so a slow provider cannot multiply load
+                timeout = None
+                if not hedged and candidates and len(pending) == 1:
+                    timeout = self._hedge_after(next(iter(pending.values())))
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    hedged = True
+                    hedge = self._launch(candidates, pending, start)
+                    if hedge is not None:
+                        LLM_HEDGES.labels("sent").inc()
+                    continue
+
+                winner = None
+                for task in done:
+                    pending.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                    elif winner is None:
+                        winner = task
+                    elif discard is not None:
+                        await discard(task.result())
+                if winner is not None:
+                    if hedge is not None:
+                        LLM_HEDGES.labels("hedge_won" if winner is hedge else "primary_won").inc()
+                    return winner.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                results = await asyncio.gather(*pending, return_exceptions=True)
+                if discard is not None:
+                    for result in results:
+                        if not isinstance(result, BaseException):
+                            await discard(result)
+
+    def _launch(
+        self,
+        candidates: List[BackendState],
+        pending: Dict[asyncio.Task, BackendState],
+        start: Callable[[BackendState], Awaitable[T]],
+    ) -> Optional[asyncio.Task]:
+        """Start the request on the next candidate whose breaker lets it through."""
+        while candidates:
+            backend = candidates.pop(0)
+            if backend.breaker.acquire():
+                task = asyncio.ensure_future(self._attempt(backend, lambda: start(backend)))
+                pending[task] = backend
+                return task
+        return None
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 150,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """Get a response from the best available backend, raising if all of them fail."""
+        return await self._race(lambda backend: backend.service.complete(messages, max_tokens, timeout))
+
+    async def get_response_async(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 150,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """
+        Get a response from the best available backend.
+
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            max_tokens: Maximum number of tokens in the response
+            timeout: Per-backend deadline in seconds (defaults to each backend's timeout)
+
+        Returns:
+            str: The LLM's response, or the fallback response if every backend failed
+        """
+        try:
+            return await self.coalescer.run(
+                self.request_key(messages, max_tokens),
+                lambda: self.complete(messages, max_tokens, timeout)
+            )
+        except Exception as e:
+            logger.error("Error in LLM router: %s", str(e) or type(e).__name__)
+            return FALLBACK_RESPONSE
+
+    @staticmethod
+    async def _open_stream(deltas: AsyncIterator[str]) -> Tuple[str, AsyncIterator[str]]:
+        # The race is decided by the first chunk
+        try:
+            first = await deltas.__anext__()
+        except StopAsyncIteration:
+            return "", deltas
+        except BaseException:
+            await deltas.aclose()
+            raise
+        return first, deltas
+
+    @staticmethod
+    async def _close_stream(opened: Tuple[str, AsyncIterator[str]]) -> None:
+        await opened[1].aclose()
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 150,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a response from whichever backend sends its first chunk first.
+
+        Hedging and fallback only happen before the first chunk; an error
+        after that is raised to the caller.
+        """
+        first, deltas = await self._race(
+            lambda backend: self._open_stream(backend.service.stream(messages, max_tokens, timeout)),
+            discard=self._close_stream,
+        )
+        try:
+            if first:
+                yield first
+            async for delta in deltas:
+                yield delta
+        finally:
+            await deltas.aclose()
+
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 150,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a response as text deltas, yielding the fallback response if
+        every backend failed before sending anything.
+        """
+        deltas = self.coalescer.stream(
+            self.request_key(messages, max_tokens, stream=True),
+            lambda: self.stream(messages, max_tokens, timeout)
+        )
+        async for delta in with_fallback(deltas):
+            yield delta
+
+    def request_key(self, messages: List[Dict[str, str]], max_tokens: int, stream: bool = False) -> str:
+        # Any backend may answer, so the key covers all of them
+        models = [getattr(backend.service, "model", backend.name) for backend in self.backends]
+        return request_key(models=models, max_tokens=max_tokens, stream=stream, messages=messages)
+
+    def format_conversation_history(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        return self.backends[0].service.format_conversation_history(messages)
+
+    def get_stats(self) -> List[Dict]:
+        """Per-backend health and latency, in ranking order."""
+        stats = []
+        for backend in sorted(self.backends, key=lambda b: math.inf if b.ewma is None else b.ewma):
+            p95 = backend.p95()
+            stats.append({
+                "name": backend.name,
+                "state": backend.breaker.state,
+                "ewma_ms": None if backend.ewma is None else round(backend.ewma * 1000, 1),
+                "p95_ms": None if p95 is None else round(p95 * 1000, 1),
+                "hedge_after_ms": round(self._hedge_after(backend) * 1000, 1),
+                "requests": backend.requests,
+                "failures": backend.failures,
+            })
+        return stats
+
+    async def aclose(self) -> None:
+        """Close every backend."""
+        for backend in self.backends:
+            try:
+                await backend.service.aclose()
+            except Exception as e:
+                logger.error("Error closing LLM backend %s: %s", backend.name, e)
+
+
+def create_llm_service():
+    """
+    Build the LLM client from the environment.
+
+    LLM_BACKENDS is a JSON list of backends, each with ``name``, ``model``
+    and optionally ``base_url`` and ``api_key_env`` (the variable holding
+    its key, GROQ_API_KEY by default), in order of preference. With more
+    than one backend requests are routed and hedged across them; without
+    it a single Groq client is used.
+    """
+    specs = json.loads(os.getenv("LLM_BACKENDS") or "[]")
+    if not specs:
+        return LLMService(api_key=os.getenv("GROQ_API_KEY"))
+    backends = [
+        LLMService(
+            api_key=os.getenv(spec.get("api_key_env", "GROQ_API_KEY")),
+            base_url=spec.get("base_url"),
+            model=spec.get("model"),
+            name=spec.get("name"),
+        )
+        for spec in specs
+    ]
+    if len(backends) == 1:
+        return backends[0]
+    return LLMRouter(backends)
@@ -1,13 +1,75 @@
-import openai
-from typing import List, Dict
+import asyncio
+import time
+from typing import AsyncIterator, List, Dict, Optional
 import os
-from groq import Groq
+import httpx
+from groq import Groq, AsyncGroq
+from app.core.logger import logger
+from app.core.coalescing import RequestCoalescer, request_key
+from app.core.metrics import LLM_REQUEST_SECONDS, LLM_TOKENS
+
+DEFAULT_MODEL = "qwen-2.5-32b"
+FALLBACK_RESPONSE = "I apologize, but I'm having trouble processing your request at the moment. Could you please repeat that?"
+
+
+async def with_fallback(deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Relay a raising delta stream, yielding the fallback response if it fails before sending anything."""
+    sent_any = False
+    try:
+        async for delta in deltas:
+            sent_any = True
+            yield delta
+    except asyncio.TimeoutError:
+        logger.error("LLM stream timed out")
+        if not sent_any:
+            yield FALLBACK_RESPONSE
+    except Exception as e:
+        logger.error("Error in LLM stream: %s", e)
+        if not sent_any:
+            yield FALLBACK_RESPONSE
+    finally:
+        await deltas.aclose()
 
 
 class LLMService:
-    def __init__(self, api_key: str):
-        self.client = Groq(api_key=api_key)
-        
+    def __init__(
+        self,
+        api_key: str,
+        base_url: Optional[str] = None,
+        model: Optional[str] = None,
+        timeout: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        max_connections: Optional[int] = None,
+        http_client: Optional[httpx.AsyncClient] = None,
+        name: Optional[str] = None,
+    ):
+        self.model = model or os.getenv("LLM_MODEL", DEFAULT_MODEL)
+        self.name = name or self.model
+        self.timeout = timeout or float(os.getenv("LLM_TIMEOUT", "20"))
+        max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "256"))
+        max_connections = max_connections or int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+
+        self.client = Groq(api_key=api_key, base_url=base_url, timeout=self.timeout)
+
+        # One pooled HTTP/1.1 keep-alive client shared by every async request,
+        # so concurrent turns reuse connections instead of re-handshaking TLS.
+        self.http_client = http_client or httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+        self.async_client = AsyncGroq(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=self.timeout,
+            http_client=self.http_client,
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Identical concurrent requests share one upstream call
+        self.coalescer = RequestCoalescer(self.name)
+
     def get_response(self, messages: List[Dict[str, str]], max_tokens: int = 150) -> str:
         """
         Get a response from the LLM based on the conversation history.
@@ -21,16 +83,199 @@ class LLMService:
         """
         try:
             response = self.client.chat.completions.create(
-                model="qwen-2.5-32b",
+                model=self.model,
                 messages=messages,
                 max_tokens=max_tokens,
                 temperature=0.7,
             )
             return response.choices[0].message.content
         except Exception as e:
-            print(f"Error in LLM service: {str(e)}")
-            return "I apologize, but I'm having trouble processing your request at the moment. Could you please repeat that?"
+            logger.error("Error in LLM service: %s", e)
+            return FALLBACK_RESPONSE
             
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 150,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """
+        Get a response from the LLM, raising on failure.
+
+        This is the building block for get_response_async and for routing
+        across several backends, which needs to see failures.
+
+        Raises:
+            asyncio.TimeoutError: If the request exceeded its deadline
+            Exception: Any error from the provider
+        """
+        started = None
+        try:
+            async with self._semaphore:
+                started = time.perf_counter()
+                response = await asyncio.wait_for(
+                    self.async_client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=0.7,
+                    ),
+                    timeout=timeout or self.timeout,
+                )
+        except asyncio.TimeoutError:
+            self._record_failure("complete", "timeout", started)
+            raise
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._record_failure("complete", "error", started)
+            raise
+        LLM_REQUEST_SECONDS.labels("complete", "ok").observe(time.perf_counter() - started)
+        self._record_usage(response.usage)
+        return response.choices[0].message.content
+
+    async def get_response_async(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 150,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """
+        Get a response from the LLM without blocking the event loop.
+
+        Requests share a pooled connection and are bounded by the service's
+        concurrency limit; time spent waiting for a slot does not count
+        against the request timeout.
+
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            max_tokens: Maximum number of tokens in the response
+            timeout: Per-request deadline in seconds (defaults to the service timeout)
+
+        Returns:
+            str: The LLM's response
+        """
+        try:
+            return await self.coalescer.run(
+                self.request_key(messages, max_tokens),
+                lambda: self.complete(messages, max_tokens, timeout)
+            )
+        except asyncio.TimeoutError:
+            logger.error("LLM request timed out")
+            return FALLBACK_RESPONSE
+        except Exception as e:
+            logger.error("Error in LLM service: %s", e)
+            return FALLBACK_RESPONSE
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 150,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a response from the LLM as text deltas, raising on failure.
+
+        The timeout applies to the first chunk and to each gap between
+        chunks, so long replies are not cut off while tokens keep flowing.
+
+        Raises:
+            asyncio.TimeoutError: If a chunk did not arrive in time
+            Exception: Any error from the provider
+        """
+        timeout = timeout or self.timeout
+        sent_any = False
+        started = None
+        try:
+            async with self._semaphore:
+                started = time.perf_counter()
+                stream = await asyncio.wait_for(
+                    self.async_client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=0.7,
+                        stream=True,
+                    ),
+                    timeout=timeout,
+                )
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(stream.__anext__(), timeout=timeout)
+                        except StopAsyncIteration:
+                            break
+                        # Groq reports usage on the final chunk
+                        self._record_usage(getattr(getattr(chunk, "x_groq", None), "usage", None))
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            if not sent_any:
+                                LLM_REQUEST_SECONDS.labels("stream", "ok").observe(time.perf_counter() - started)
+                            sent_any = True
+                            yield delta
+                finally:
+                    await stream.close()
+        except asyncio.TimeoutError:
+            if not sent_any:
+                self._record_failure("stream", "timeout", started)
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            raise
+        except Exception:
+            if not sent_any:
+                self._record_failure("stream", "error", started)
+            raise
+
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 150,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a response from the LLM as text deltas.
+
+        If the request fails before anything was sent, the fallback
+        response is yielded instead.
+
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            max_tokens: Maximum number of tokens in the response
+            timeout: Per-chunk deadline in seconds (defaults to the service timeout)
+
+        Yields:
+            str: Successive pieces of the LLM's response
+        """
+        deltas = self.coalescer.stream(
+            self.request_key(messages, max_tokens, stream=True),
+            lambda: self.stream(messages, max_tokens, timeout)
+        )
+        async for delta in with_fallback(deltas):
+            yield delta
+
+    def request_key(self, messages: List[Dict[str, str]], max_tokens: int, stream: bool = False) -> str:
+        """Coalescing key: requests with the same key would get equivalent responses."""
+        return request_key(model=self.model, max_tokens=max_tokens, temperature=0.7, stream=stream, messages=messages)
+
+    @staticmethod
+    def _record_usage(usage) -> None:
+        if usage is None:
+            return
+        LLM_TOKENS.labels("prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+        LLM_TOKENS.labels("completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+    @staticmethod
+    def _record_failure(mode: str, outcome: str, started: Optional[float]) -> None:
+        # Failures while still waiting for a concurrency slot have no latency
+        if started is not None:
+            LLM_REQUEST_SECONDS.labels(mode, outcome).observe(time.perf_counter() - started)
+
+    async def aclose(self) -> None:
+        """Close the pooled async HTTP client."""
+        await self.async_client.close()
+
     def format_conversation_history(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
         """
         Format the conversation history for the LLM.
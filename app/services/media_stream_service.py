@@ -0,0 +1,241 @@
+import asyncio
+import base64
+import io
+import json
+import re
+from typing import Awaitable, Callable, Dict, List, Optional
+import numpy as np
+import soundfile as sf
+from app.services.speech_service import SpeechService
+from app.services.simulation_service import SimulationService
+from app.services.tts_service import TTSService, split_sentences
+from app.services.twilio_service import GREETING
+from app.core.logger import logger, bind_log_context
+
+# Twilio Media Streams carry 8 kHz G.711 mu-law, sent in 20 ms frames
+MULAW_SAMPLE_RATE = 8000
+FRAME_BYTES = 160
+_SENTENCE_BOUNDARY = re.compile(r"[.!?]\s+")
+
+
+def _build_decode_table() -> np.ndarray:
+    table = np.zeros(256, dtype=np.float32)
+    for byte in range(256):
+        value = ~byte & 0xFF
+        exponent = (value >> 4) & 0x07
+        mantissa = value & 0x0F
+        magnitude = ((((mantissa << 3) + 0x84) << exponent) - 0x84)
+        table[byte] = (-magnitude if value & 0x80 else magnitude) / 32768.0
+    return table
+
+
+MULAW_DECODE_TABLE = _build_decode_table()
+
+
+def mulaw_decode(payload: bytes) -> np.ndarray:
+    """Decode mu-law bytes to float32 samples with one table lookup over a zero-copy view."""
+    return MULAW_DECODE_TABLE[np.frombuffer(payload, dtype=np.uint8)]
+
+
+def mulaw_encode(samples: np.ndarray) -> bytes:
+    """Encode float samples in [-1, 1] as mu-law bytes."""
+    pcm = np.clip(np.asarray(samples, dtype=np.float32) * 32768.0, -32768, 32767).astype(np.int32)
+    sign = (pcm < 0).astype(np.int32) << 7
+    magnitude = np.minimum(np.abs(pcm), 32635) + 0x84
+    exponent = np.clip(np.floor(np.log2(magnitude)).astype(np.int32) - 7, 0, 7)
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8).tobytes()
+
+
+def audio_to_frames(audio_data: bytes) -> List[str]:
+    """
+    Convert synthesized audio (WAV, MP3, ...) to base64 mu-law media frames.
+
+    Args:
+        audio_data: Encoded audio from a TTS backend
+
+    Returns:
+        List of base64 payloads of 20 ms each
+    """
+    samples, sample_rate = sf.read(io.BytesIO(audio_data), dtype="float32")
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    if sample_rate != MULAW_SAMPLE_RATE and len(samples):
+        target = int(round(len(samples) * MULAW_SAMPLE_RATE / sample_rate))
+        samples = np.interp(np.linspace(0, len(samples) - 1, target), np.arange(len(samples)), samples)
+    encoded = mulaw_encode(samples)
+    return [
+        base64.b64encode(encoded[i:i + FRAME_BYTES]).decode()
+        for i in range(0, len(encoded), FRAME_BYTES)
+    ]
+
+
+class MediaStreamSession:
+    """
+    One Twilio Media Streams connection.
+
+    Inbound audio is decoded and queued for a listener task that feeds
+    it to a StreamingTranscriber, so transcription never holds up the
+    receive loop (marks in particular); each final transcript starts a
+    reply task that streams the LLM response, speaks
+    it sentence by sentence and sends the audio back as media frames,
+    each sentence followed by a mark that Twilio echoes once it has been
+    played. If the caller starts talking while a reply is in flight or
+    its audio is still playing (barge-in), the reply task is cancelled,
+    which stops the LLM stream and any pending synthesis, and Twilio is
+    told to clear the audio it has buffered.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[Dict], Awaitable[None]],
+        speech_service: SpeechService,
+        simulation_service: SimulationService,
+        tts_service: TTSService,
+    ):
+        self.send = send
+        self.simulation_service = simulation_service
+        self.tts_service = tts_service
+        self.transcriber = speech_service.stream(sample_rate=MULAW_SAMPLE_RATE)
+        self.stream_sid: Optional[str] = None
+        self.call_sid: Optional[str] = None
+        self._reply: Optional[asyncio.Task] = None
+        self._audio: "asyncio.Queue[np.ndarray]" = asyncio.Queue()
+        self._listener: Optional[asyncio.Task] = None
+        # Marks sent after reply audio that Twilio has not played yet
+        self._pending_marks: List[str] = []
+        self.barge_ins = 0
+
+    async def run(self, receive: Callable[[], Awaitable[str]]) -> None:
+        """Handle Media Streams messages until Twilio sends 'stop'."""
+        while True:
+            message = json.loads(await receive())
+            await self.handle(message)
+            if message.get("event") == "stop":
+                return
+
+    async def handle(self, message: Dict) -> None:
+        event = message.get("event")
+        if event == "start":
+            self.stream_sid = message["streamSid"]
+            self.call_sid = message["start"]["callSid"]
+            # Everything logged for the rest of this stream, replies included
+            bind_log_context(call_sid=self.call_sid, stream_sid=self.stream_sid)
+            if await self.simulation_service.ensure_simulation(self.call_sid):
+                self._start_reply(self._speak(GREETING))
+        elif event == "media":
+            media = message["media"]
+            if media.get("track", "inbound") != "inbound":
+                return
+            if self._listener is None:
+                self._listener = asyncio.create_task(self._listen())
+            self._audio.put_nowait(mulaw_decode(base64.b64decode(media["payload"])))
+        elif event == "mark":
+            name = message.get("mark", {}).get("name")
+            if name in self._pending_marks:
+                self._pending_marks.remove(name)
+        elif event == "stop":
+            await self._stop_listening()
+            if self.call_sid:
+                async with self.simulation_service.session(self.call_sid):
+                    self.simulation_service.end_simulation(self.call_sid)
+
+    async def _listen(self) -> None:
+        while True:
+            chunks = [await self._audio.get()]
+            # Catch up in one pass when transcription has fallen behind
+            while not self._audio.empty():
+                chunks.append(self._audio.get_nowait())
+            try:
+                for result in await self.transcriber.feed(np.concatenate(chunks)):
+                    # Only recognized words count as barge-in, not line noise
+                    if self.replying:
+                        await self.barge_in()
+                    if result["type"] == "final":
+                        self._start_reply(self._respond(result["text"]))
+            except Exception as e:
+                logger.error("Error transcribing media stream: %s", e)
+            finally:
+                for _ in chunks:
+                    self._audio.task_done()
+
+    async def wait_listened(self) -> None:
+        """Wait until all audio received so far has been transcribed."""
+        await self._audio.join()
+
+    async def _stop_listening(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        self.transcriber.close()
+
+    @property
+    def replying(self) -> bool:
+        """True while a reply is generated or its audio has not finished playing."""
+        return self._generating or bool(self._pending_marks)
+
+    @property
+    def _generating(self) -> bool:
+        return self._reply is not None and not self._reply.done()
+
+    def _start_reply(self, coroutine) -> None:
+        self._reply = asyncio.create_task(coroutine)
+
+    async def barge_in(self) -> None:
+        """Stop the reply in flight and drop audio Twilio has not played yet."""
+        if self._generating:
+            self._reply.cancel()
+            try:
+                await self._reply
+            except asyncio.CancelledError:
+                pass
+        # Twilio echoes the cleared marks; they no longer hold the session in a reply
+        self._pending_marks.clear()
+        self.barge_ins += 1
+        await self.send({"event": "clear", "streamSid": self.stream_sid})
+
+    async def _respond(self, text: str) -> None:
+        deltas = await self.simulation_service.stream_message(self.call_sid, text)
+        if deltas is None:
+            return
+        buffer = ""
+        try:
+            async for delta in deltas:
+                buffer += delta
+                # Speak every finished sentence; the rest may still be mid-sentence
+                end = max((match.end() for match in _SENTENCE_BOUNDARY.finditer(buffer)), default=0)
+                if end:
+                    for sentence in split_sentences(buffer[:end]):
+                        await self._speak(sentence)
+                    buffer = buffer[end:]
+        finally:
+            # Records whatever was generated, even when cancelled by barge-in
+            await deltas.aclose()
+        if buffer.strip():
+            await self._speak(buffer.strip())
+
+    async def _speak(self, text: str) -> None:
+        try:
+            audio_data, _ = await asyncio.to_thread(self.tts_service.synthesize, text)
+            frames = await asyncio.to_thread(audio_to_frames, audio_data)
+        except Exception as e:
+            logger.error("Error in text-to-speech conversion: %s", e)
+            return
+        for payload in frames:
+            await self.send({"event": "media", "streamSid": self.stream_sid, "media": {"payload": payload}})
+        name = text[:64]
+        self._pending_marks.append(name)
+        await self.send({"event": "mark", "streamSid": self.stream_sid, "mark": {"name": name}})
+
+    async def close(self) -> None:
+        """Cancel any reply and transcription still running when the socket goes away."""
+        await self._stop_listening()
+        if self._generating:
+            self._reply.cancel()
+            try:
+                await self._reply
+            except asyncio.CancelledError:
+                pass
@@ -1,16 +1,90 @@
-from typing import Dict, List
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
+import asyncio
+import importlib.util
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+import numpy as np
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.models.database import Call, Message
 from app.core.logger import logger
 
+# Column order of score arrays returned by analyze_batch
+SCORE_KEYS = ("pos", "neg", "neu", "compound")
+NEUTRAL_SCORES = np.array([0.0, 0.0, 1.0, 0.0])
+
+
+_UNLOADED = object()
+
+
+def load_vader_analyzer():
+    """
+    Build a VADER analyzer from a lexicon already on disk.
+
+    Nothing is downloaded at runtime. The lexicon is taken from
+    SENTIMENT_LEXICON_PATH, then the NLTK data directories (populated at
+    build time with ``python -m nltk.downloader vader_lexicon``), then the
+    copy bundled with the vaderSentiment package.
+
+    Raises:
+        LookupError: If no lexicon is available
+    """
+    import nltk
+    from nltk.sentiment import SentimentIntensityAnalyzer as NLTKAnalyzer
+
+    class SentimentIntensityAnalyzer(NLTKAnalyzer):
+        def make_lex_dict(self):
+            # Tolerate blank lines, such as a trailing newline in a hand-supplied lexicon
+            self.lexicon_file = "\n".join(line for line in self.lexicon_file.splitlines() if line.strip())
+            return super().make_lex_dict()
+
+    path = os.getenv("SENTIMENT_LEXICON_PATH")
+    if path:
+        return SentimentIntensityAnalyzer(lexicon_file=f"file:{os.path.abspath(path)}")
+    try:
+        nltk.data.find("sentiment/vader_lexicon.zip")
+        return SentimentIntensityAnalyzer()
+    except LookupError:
+        pass
+    spec = importlib.util.find_spec("vaderSentiment")
+    if spec and spec.submodule_search_locations:
+        bundled = os.path.join(list(spec.submodule_search_locations)[0], "vader_lexicon.txt")
+        if os.path.exists(bundled):
+            return SentimentIntensityAnalyzer(lexicon_file=f"file:{bundled}")
+    raise LookupError("No VADER lexicon found; install vaderSentiment or set SENTIMENT_LEXICON_PATH")
+
+
+def compound_to_score(compound: float) -> float:
+    """Map a VADER compound score (-1..1) onto the 0-100 sentiment_score scale."""
+    return round((compound + 1) * 50, 2)
+
+
 class SentimentService:
-    def __init__(self):
-        try:
-            nltk.download('vader_lexicon', quiet=True)
-            self.analyzer = SentimentIntensityAnalyzer()
-        except Exception as e:
-            logger.error(f"Error initializing sentiment analyzer: {str(e)}")
-            self.analyzer = None
+    def __init__(self, analyzer=None, cache_size: Optional[int] = None):
+        self.cache_size = cache_size or int(os.getenv("SENTIMENT_CACHE_SIZE", "10000"))
+        self._scores: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        # Loaded on first use (or by warm_up) so constructing the service is free
+        self._analyzer = _UNLOADED if analyzer is None else analyzer
+
+    @property
+    def analyzer(self):
+        if self._analyzer is _UNLOADED:
+            with self._load_lock:
+                if self._analyzer is _UNLOADED:
+                    try:
+                        self._analyzer = load_vader_analyzer()
+                    except Exception as e:
+                        logger.error("Error initializing sentiment analyzer: %s", e)
+                        self._analyzer = None
+        return self._analyzer
+
+    def warm_up(self) -> None:
+        """Load the lexicon ahead of the first message."""
+        self.analyzer
 
     def analyze_text(self, text: str) -> Dict[str, float]:
         """
@@ -22,14 +96,45 @@ class SentimentService:
         Returns:
             Dict with sentiment scores (pos, neg, neu, compound)
         """
+        return dict(zip(SCORE_KEYS, self.analyze_batch([text])[0].tolist()))
+
+    def analyze_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Score many texts at once.
+
+        Scores are memoized per text, so re-analyzing a conversation only
+        scores messages that have not been seen before, and duplicate
+        texts within a batch are scored once.
+
+        Args:
+            texts: Texts to analyze
+
+        Returns:
+            np.ndarray: One row of (pos, neg, neu, compound) per text
+        """
+        scores = []
+        with self._lock:
+            for text in texts:
+                row = self._scores.get(text)
+                if row is None:
+                    row = self._score(text)
+                    self._scores[text] = row
+                    if len(self._scores) > self.cache_size:
+                        self._scores.popitem(last=False)
+                else:
+                    self._scores.move_to_end(text)
+                scores.append(row)
+        return np.array(scores) if scores else np.empty((0, len(SCORE_KEYS)))
+
+    def _score(self, text: str) -> np.ndarray:
         try:
             if not self.analyzer:
-                return {"pos": 0, "neg": 0, "neu": 1, "compound": 0}
-            
-            return self.analyzer.polarity_scores(text)
+                return NEUTRAL_SCORES
+            scores = self.analyzer.polarity_scores(text)
+            return np.array([scores[key] for key in SCORE_KEYS], dtype=float)
         except Exception as e:
-            logger.error(f"Error analyzing sentiment: {str(e)}")
-            return {"pos": 0, "neg": 0, "neu": 1, "compound": 0}
+            logger.error("Error analyzing sentiment: %s", e)
+            return NEUTRAL_SCORES
 
     def get_sentiment_label(self, compound_score: float) -> str:
         """
@@ -67,24 +172,220 @@ class SentimentService:
                     "sentiment_scores": {"pos": 0, "neg": 0, "neu": 1, "compound": 0}
                 }
             
-            # Analyze each message
-            sentiments = [self.analyze_text(msg) for msg in user_messages]
-            
-            # Calculate average scores
-            avg_scores = {
-                "pos": sum(s["pos"] for s in sentiments) / len(sentiments),
-                "neg": sum(s["neg"] for s in sentiments) / len(sentiments),
-                "neu": sum(s["neu"] for s in sentiments) / len(sentiments),
-                "compound": sum(s["compound"] for s in sentiments) / len(sentiments)
-            }
-            
+            avg_scores = dict(zip(SCORE_KEYS, self.analyze_batch(user_messages).mean(axis=0).tolist()))
+
             return {
                 "overall_sentiment": self.get_sentiment_label(avg_scores["compound"]),
                 "sentiment_scores": avg_scores
             }
         except Exception as e:
-            logger.error(f"Error analyzing conversation sentiment: {str(e)}")
+            logger.error("Error analyzing conversation sentiment: %s", e)
             return {
                 "overall_sentiment": "neutral",
                 "sentiment_scores": {"pos": 0, "neg": 0, "neu": 1, "compound": 0}
-            } 
\ No newline at end of file
+            }
+
+    async def backfill(
+        self,
+        session_factory: async_sessionmaker,
+        batch_size: int = 1000,
+        workers: Optional[int] = None,
+    ) -> int:
+        """
+        Score all unscored user messages in the database.
+
+        Messages are read in id-ordered keyset batches. With more than one
+        worker, batches are scored in a process pool while the next ones
+        are being read, keeping up to ``workers`` batches in flight. Each
+        message gets its compound score, and every call that had messages
+        scored gets its sentiment_score recomputed.
+
+        Args:
+            session_factory: Async session factory for the database
+            batch_size: Messages read and scored per batch
+            workers: Worker processes; 1 scores in this process
+
+        Returns:
+            int: Number of messages scored
+        """
+        workers = workers or int(os.getenv("SENTIMENT_BACKFILL_WORKERS", str(os.cpu_count() or 1)))
+        loop = asyncio.get_running_loop()
+        pool = scoring_pool(workers) if workers > 1 else None
+        in_flight: List = []
+        scored = 0
+        last_id = 0
+
+        async def drain(limit: int) -> None:
+            nonlocal scored
+            while len(in_flight) > limit:
+                ids, call_ids, pending = in_flight.pop(0)
+                scored += await self._write_scores(session_factory, ids, call_ids, await pending)
+
+        try:
+            while True:
+                async with session_factory() as session:
+                    rows = (await session.execute(
+                        select(Message.id, Message.call_id, Message.content)
+                        .where(Message.id > last_id, Message.role == "user", Message.sentiment.is_(None))
+                        .order_by(Message.id)
+                        .limit(batch_size)
+                    )).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                ids = [row.id for row in rows]
+                call_ids = {row.call_id for row in rows}
+                texts = [row.content or "" for row in rows]
+                if pool is None:
+                    scored += await self._write_scores(session_factory, ids, call_ids, self.analyze_batch(texts)[:, 3])
+                    continue
+                in_flight.append((ids, call_ids, loop.run_in_executor(pool, score_compounds, texts)))
+                await drain(workers - 1)
+            await drain(0)
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+
+        logger.info("Backfilled sentiment for %s messages", scored)
+        return scored
+
+    @staticmethod
+    async def _write_scores(session_factory: async_sessionmaker, ids, call_ids, compounds) -> int:
+        async with session_factory() as session:
+            async with session.begin():
+                await session.execute(update(Message), [
+                    {"id": message_id, "sentiment": float(compound)}
+                    for message_id, compound in zip(ids, compounds)
+                ])
+                averages = (await session.execute(
+                    select(Message.call_id, func.avg(Message.sentiment))
+                    .where(Message.call_id.in_(call_ids), Message.sentiment.isnot(None))
+                    .group_by(Message.call_id)
+                )).all()
+                for call_id, average in averages:
+                    await session.execute(
+                        update(Call).where(Call.id == call_id).values(sentiment_score=compound_to_score(average))
+                    )
+        return len(ids)
+
+
+class SentimentWorker:
+    """
+    Score messages in the background, off the request path.
+
+    Producers enqueue (key, text) pairs without waiting; a single consumer
+    task drains the queue in batches, scores them with SentimentService in
+    a worker thread and hands each compound score to ``on_score``. When the
+    queue is full new work is dropped rather than slowing callers down.
+    """
+
+    def __init__(
+        self,
+        sentiment_service: SentimentService,
+        on_score: Optional[Callable[[object, float], None]] = None,
+        max_queue: Optional[int] = None,
+        batch_size: Optional[int] = None,
+    ):
+        self.sentiment_service = sentiment_service
+        self.on_score = on_score
+        self.batch_size = batch_size or int(os.getenv("SENTIMENT_BATCH_SIZE", "64"))
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue or int(os.getenv("SENTIMENT_QUEUE_SIZE", "10000")))
+        self._task: Optional[asyncio.Task] = None
+        self.processed = 0
+        self.dropped = 0
+        self._warned_idle = False
+
+    def submit(self, key: object, text: str) -> bool:
+        """Queue a text for scoring; returns False if it was dropped."""
+        if self._task is None and not self._warned_idle:
+            self._warned_idle = True
+            logger.warning("Sentiment worker has not been started; messages are queued but not scored")
+        try:
+            self.queue.put_nowait((key, text))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("Sentiment queue full, dropping message")
+            return False
+
+    async def start(self) -> None:
+        """Start the background consumer."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Finish queued work, waiting at most ``timeout`` seconds, then stop."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Stopping sentiment worker with %s messages unscored", self.queue.qsize())
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def drain(self) -> None:
+        """Wait until everything queued so far has been scored."""
+        await self.queue.join()
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                compounds = await asyncio.to_thread(
+                    self.sentiment_service.analyze_batch, [text for _, text in batch]
+                )
+                for (key, _), compound in zip(batch, compounds[:, 3].tolist()):
+                    if self.on_score:
+                        self.on_score(key, compound)
+                self.processed += len(batch)
+            except Exception as e:
+                logger.error("Error scoring sentiment batch: %s", e)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get queue depth and throughput counters."""
+        return {
+            "queued": self.queue.qsize(),
+            "processed": self.processed,
+            "dropped": self.dropped,
+        }
+
+
+_worker_service: Optional[SentimentService] = None
+
+
+def _init_worker() -> None:
+    global _worker_service
+    _worker_service = SentimentService()
+
+
+def scoring_pool(workers: int) -> ProcessPoolExecutor:
+    """A process pool whose workers each load the lexicon once, for score_compounds."""
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+
+def score_compounds(texts: List[str]) -> np.ndarray:
+    """Compound scores for a batch of texts; runs in a scoring_pool worker."""
+    return _worker_service.analyze_batch(texts)[:, 3]
+
+
+if __name__ == "__main__":
+    from app.models.database import init_async_db
+
+    async def _main() -> None:
+        engine, session_factory = init_async_db(os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./call_center.db"))
+        try:
+            await SentimentService().backfill(session_factory)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(_main())
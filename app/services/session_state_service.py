@@ -0,0 +1,324 @@
+"""
+Shared session state for running SimulationService in several workers.
+
+Live simulations are kept in a backend every worker can reach (in-memory
+for a single process, Redis, or the SQL database). Each saved state has a
+version; writes are compare-and-set against the version the writer last
+saw, so concurrent appends from different workers never overwrite each
+other: the loser reloads, replays its change and tries again. Transfer
+and end events are broadcast so other workers can refresh their copies.
+"""
+import asyncio
+import json
+import os
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from sqlalchemy import select, insert, update, delete, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.models.database import SessionState, SessionEvent
+from app.models.call import MessageRecord, NoteRecord, TagRecord, QualityMetrics
+from app.core.logger import logger
+
+FORMAT_VERSION = 3
+COMPRESS_OVER_BYTES = 512
+_RAW, _ZLIB = b"\x00", b"\x01"
+_ROLES = ("user", "assistant", "system")
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _to_micros(value: Optional[datetime]) -> Optional[int]:
+    if value is None:
+        return None
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(value: Optional[int]) -> Optional[datetime]:
+    return None if value is None else _EPOCH + value * _MICROSECOND
+
+
+def encode_state(simulation) -> bytes:
+    """
+    Serialize a simulation compactly.
+
+    Fields are stored positionally, call start and end as integer
+    microseconds, record timestamps as epoch seconds and roles as small
+    integers; larger states are zlib-compressed.
+    """
+    state = [
+        FORMAT_VERSION,
+        _to_micros(simulation.start_time),
+        _to_micros(simulation.end_time),
+        int(simulation.is_active),
+        int(simulation.is_recording),
+        simulation.status,
+        simulation.transferred_to,
+        simulation.transfer_reason,
+        [
+            [_ROLES.index(m.role) if m.role in _ROLES else m.role, m.content, m.timestamp]
+            + ([m.sentiment] if m.sentiment is not None else [])
+            for m in simulation.messages
+        ],
+        [[n.content, n.timestamp] for n in simulation.notes],
+        [[t.name, t.type, t.timestamp] for t in simulation.tags],
+        simulation.quality_metrics.as_dict(),
+    ]
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    if len(raw) > COMPRESS_OVER_BYTES:
+        return _ZLIB + zlib.compress(raw, 1)
+    return _RAW + raw
+
+
+def decode_state(data: bytes, simulation) -> None:
+    """Load state produced by encode_state into an existing simulation."""
+    raw = zlib.decompress(data[1:]) if data[:1] == _ZLIB else data[1:]
+    (_, start, end, is_active, is_recording, status, transferred_to, transfer_reason,
+     messages, notes, tags, quality_metrics) = json.loads(raw)
+    simulation.start_time = _from_micros(start)
+    simulation.end_time = _from_micros(end)
+    simulation.is_active = bool(is_active)
+    simulation.is_recording = bool(is_recording)
+    simulation.status = status
+    simulation.transferred_to = transferred_to
+    simulation.transfer_reason = transfer_reason
+    # Scored messages carry their sentiment as a fourth element
+    simulation.messages = [
+        MessageRecord(_ROLES[role] if isinstance(role, int) else role, *rest) for role, *rest in messages
+    ]
+    simulation.notes = [NoteRecord(content, ts) for content, ts in notes]
+    simulation.tags = [TagRecord(name, tag_type, ts) for name, tag_type, ts in tags]
+    simulation.quality_metrics = QualityMetrics.from_dict(quality_metrics)
+
+
+class MemorySessionBackend:
+    """Session state for a single process; the default."""
+
+    def __init__(self):
+        self.states: Dict[str, Tuple[bytes, int]] = {}
+        self._subscribers: List[asyncio.Queue] = []
+
+    async def get(self, simulation_id: str) -> Optional[Tuple[bytes, int]]:
+        return self.states.get(simulation_id)
+
+    async def compare_and_set(self, simulation_id: str, data: bytes, expected_version: int) -> Optional[int]:
+        current = self.states.get(simulation_id)
+        if (current[1] if current else 0) != expected_version:
+            return None
+        self.states[simulation_id] = (data, expected_version + 1)
+        return expected_version + 1
+
+    async def delete(self, simulation_id: str) -> None:
+        self.states.pop(simulation_id, None)
+
+    async def publish(self, event: Dict) -> None:
+        for subscriber in self._subscribers:
+            subscriber.put_nowait(event)
+
+    async def subscribe(self) -> AsyncIterator[Dict]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers.remove(queue)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class RedisSessionBackend:
+    """
+    Session state in a Redis-compatible server.
+
+    Each simulation is a hash of version and data with a TTL refreshed on
+    every write; compare-and-set uses WATCH/MULTI, and events go through
+    a pub/sub channel.
+    """
+
+    def __init__(self, url: Optional[str] = None, client=None, prefix: str = "session:",
+                 channel: str = "session-events", ttl: Optional[int] = None):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.channel = channel
+        self.ttl = ttl or int(os.getenv("SESSION_TTL_SECONDS", "86400"))
+
+    async def get(self, simulation_id: str) -> Optional[Tuple[bytes, int]]:
+        version, data = await self.client.hmget(self.prefix + simulation_id, "v", "d")
+        if version is None:
+            return None
+        return data, int(version)
+
+    async def compare_and_set(self, simulation_id: str, data: bytes, expected_version: int) -> Optional[int]:
+        from redis.exceptions import WatchError
+        key = self.prefix + simulation_id
+        async with self.client.pipeline() as pipe:
+            try:
+                await pipe.watch(key)
+                current = await pipe.hget(key, "v")
+                if int(current or 0) != expected_version:
+                    await pipe.unwatch()
+                    return None
+                pipe.multi()
+                pipe.hset(key, mapping={"v": expected_version + 1, "d": data})
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+            except WatchError:
+                return None
+        return expected_version + 1
+
+    async def delete(self, simulation_id: str) -> None:
+        await self.client.delete(self.prefix + simulation_id)
+
+    async def publish(self, event: Dict) -> None:
+        await self.client.publish(self.channel, json.dumps(event))
+
+    async def subscribe(self) -> AsyncIterator[Dict]:
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(self.channel)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield json.loads(message["data"])
+        finally:
+            await pubsub.unsubscribe(self.channel)
+            await pubsub.aclose()
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+class SQLSessionBackend:
+    """
+    Session state in the application database.
+
+    Compare-and-set is a conditional UPDATE on the version column. SQL has
+    no portable pub/sub, so events are appended to a table that every
+    subscriber polls. Publishers and subscribers prune both tables every
+    ``prune_interval`` seconds: events older than ``event_retention`` and,
+    like Redis key expiry, states not written for ``ttl`` seconds.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        poll_interval: Optional[float] = None,
+        ttl: Optional[int] = None,
+        event_retention: Optional[float] = None,
+        prune_interval: Optional[float] = None,
+    ):
+        self.session_factory = session_factory
+        self.poll_interval = poll_interval or float(os.getenv("SESSION_EVENT_POLL_SECONDS", "0.5"))
+        self.ttl = ttl or int(os.getenv("SESSION_TTL_SECONDS", "86400"))
+        self.event_retention = event_retention or float(os.getenv("SESSION_EVENT_RETENTION_SECONDS", "3600"))
+        self.prune_interval = prune_interval or float(os.getenv("SESSION_PRUNE_INTERVAL_SECONDS", "60"))
+        self._next_prune = 0.0
+
+    async def get(self, simulation_id: str) -> Optional[Tuple[bytes, int]]:
+        async with self.session_factory() as session:
+            row = (await session.execute(
+                select(SessionState.data, SessionState.version).where(SessionState.simulation_id == simulation_id)
+            )).first()
+        return (row.data, row.version) if row else None
+
+    async def compare_and_set(self, simulation_id: str, data: bytes, expected_version: int) -> Optional[int]:
+        try:
+            async with self.session_factory() as session:
+                async with session.begin():
+                    if expected_version == 0:
+                        await session.execute(insert(SessionState).values(
+                            simulation_id=simulation_id, version=1, data=data
+                        ))
+                        return 1
+                    result = await session.execute(
+                        update(SessionState)
+                        .where(SessionState.simulation_id == simulation_id, SessionState.version == expected_version)
+                        .values(version=expected_version + 1, data=data, updated_at=datetime.utcnow())
+                    )
+                    return expected_version + 1 if result.rowcount == 1 else None
+        except IntegrityError:
+            # Another worker inserted it first
+            return None
+
+    async def delete(self, simulation_id: str) -> None:
+        async with self.session_factory() as session:
+            async with session.begin():
+                await session.execute(delete(SessionState).where(SessionState.simulation_id == simulation_id))
+
+    async def publish(self, event: Dict) -> None:
+        async with self.session_factory() as session:
+            async with session.begin():
+                await session.execute(insert(SessionEvent).values(payload=event))
+        await self._maybe_prune()
+
+    async def subscribe(self) -> AsyncIterator[Dict]:
+        async with self.session_factory() as session:
+            last_id = await session.scalar(select(func.max(SessionEvent.id))) or 0
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            async with self.session_factory() as session:
+                rows = (await session.execute(
+                    select(SessionEvent.id, SessionEvent.payload)
+                    .where(SessionEvent.id > last_id)
+                    .order_by(SessionEvent.id)
+                )).all()
+            for row in rows:
+                last_id = row.id
+                yield row.payload
+            await self._maybe_prune()
+
+    async def prune(self, now: Optional[datetime] = None) -> Tuple[int, int]:
+        """
+        Delete expired session states and old events.
+
+        Args:
+            now: Current time, for tests
+
+        Returns:
+            Tuple[int, int]: Number of states and events deleted
+        """
+        now = now or datetime.utcnow()
+        async with self.session_factory() as session:
+            async with session.begin():
+                states = await session.execute(
+                    delete(SessionState).where(SessionState.updated_at < now - timedelta(seconds=self.ttl))
+                )
+                events = await session.execute(
+                    delete(SessionEvent).where(SessionEvent.created_at < now - timedelta(seconds=self.event_retention))
+                )
+        if states.rowcount or events.rowcount:
+            logger.info("Pruned %s expired session states and %s old session events", states.rowcount, events.rowcount)
+        return states.rowcount, events.rowcount
+
+    async def _maybe_prune(self) -> None:
+        # Every worker runs this; the interval keeps it to a few deletes a minute
+        if time.monotonic() < self._next_prune:
+            return
+        self._next_prune = time.monotonic() + self.prune_interval
+        try:
+            await self.prune()
+        except Exception as e:
+            logger.error("Error pruning session tables: %s", e)
+
+    async def aclose(self) -> None:
+        pass
+
+
+def create_session_backend(session_factory: Optional[async_sessionmaker] = None):
+    """Build the backend selected by SESSION_BACKEND ('memory', 'redis' or 'sql')."""
+    kind = os.getenv("SESSION_BACKEND", "memory")
+    if kind == "redis":
+        return RedisSessionBackend(os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0"))
+    if kind == "sql":
+        if session_factory is None:
+            raise ValueError("The sql session backend needs a database session factory")
+        return SQLSessionBackend(session_factory)
+    if kind != "memory":
+        logger.error("Unknown SESSION_BACKEND %s, using memory", kind)
+    return MemorySessionBackend()
@@ -1,33 +1,63 @@
-from typing import Dict, Optional, List
+from typing import AsyncIterator, Callable, Dict, Optional, List, Tuple
+from contextlib import asynccontextmanager
 from datetime import datetime
+import asyncio
+import time
+import uuid
 from app.services.llm_service import LLMService
+from app.services.context_service import ContextService
+from app.services.cache_service import ResponseCache
+from app.services.storage_service import SimulationStore, encode_cursor, decode_cursor
+from app.services.sentiment_service import SentimentWorker, compound_to_score
+from app.services.session_state_service import encode_state, decode_state
+from app.models.call import CallSimulation, MessageRecord, NoteRecord, TagRecord
 from app.core.logger import logger
+from app.core.tracing import span
+
+class PendingSync:
+    """Local changes to a simulation not yet saved to the shared session backend."""
+
+    __slots__ = ("changes", "events", "dirty")
+
+    def __init__(self):
+        # Replayable changes, re-applied on top of newer state after a lost race
+        self.changes: List[Callable[[CallSimulation], None]] = []
+        self.events: List[Dict] = []
+        self.dirty = True
 
-class CallSimulation:
-    def __init__(self, simulation_id: str):
-        self.simulation_id = simulation_id
-        self.start_time = datetime.utcnow()
-        self.end_time: Optional[datetime] = None
-        self.messages: List[Dict] = []
-        self.is_active = True
-        self.is_recording = False
-        self.transferred_to = None
-        self.transfer_reason = None
-        self.notes: List[Dict] = []
-        self.tags: List[Dict] = []
-        self.status = "in-progress"
-        self.quality_metrics = {
-            "latency": 0,
-            "packet_loss": 0,
-            "jitter": 0,
-            "quality_score": 100,
-            "sentiment_score": 0,
-            "resolution_time": 0
-        }
 
 class SimulationService:
-    def __init__(self, llm_service: LLMService):
+    def __init__(
+        self,
+        llm_service: LLMService,
+        context_service: Optional[ContextService] = None,
+        response_cache: Optional[ResponseCache] = None,
+        store: Optional[SimulationStore] = None,
+        sentiment_worker: Optional[SentimentWorker] = None,
+        session_backend=None,
+        max_sync_attempts: int = 10,
+        seed: Optional[int] = None
+    ):
         self.llm_service = llm_service
+        self.context_service = context_service or ContextService(llm_service)
+        self.response_cache = response_cache
+        self.store = store
+        self.sentiment_worker = sentiment_worker
+        if sentiment_worker:
+            sentiment_worker.on_score = self._apply_sentiment
+        else:
+            logger.warning("No sentiment worker configured; call sentiment will not be scored")
+        # With a shared session backend, active_simulations is a per-worker
+        # cache that is refreshed from the backend on every request
+        self.session_backend = session_backend
+        self.max_sync_attempts = max_sync_attempts
+        # Makes simulated network conditions reproducible per call and turn
+        self.seed = seed
+        self.worker_id = uuid.uuid4().hex
+        self._pending: Dict[str, PendingSync] = {}
+        self._syncing: Dict[str, asyncio.Task] = {}
+        self._state_locks: Dict[str, asyncio.Lock] = {}
+        self._released: List[str] = []
         self.active_simulations: Dict[str, CallSimulation] = {}
         self.available_agents = [
             {"id": "agent1", "name": "John Smith", "department": "Technical Support"},
@@ -41,12 +71,27 @@ class SimulationService:
             if simulation_id in self.active_simulations:
                 return False
             
-            self.active_simulations[simulation_id] = CallSimulation(simulation_id)
-            logger.info(f"Started simulation {simulation_id}")
+            simulation = CallSimulation(simulation_id)
+            self.active_simulations[simulation_id] = simulation
+            self._touch(simulation)
+            logger.info("Started simulation %s", simulation_id)
             return True
         except Exception as e:
-            logger.error(f"Error starting simulation: {str(e)}")
+            logger.error("Error starting simulation: %s", e)
+            return False
+
+    async def ensure_simulation(self, simulation_id: str) -> bool:
+        """
+        Resume a simulation from memory or the store, or start it if new.
+
+        Returns:
+            bool: True if a new simulation was started
+        """
+        if await self._get_simulation(simulation_id):
             return False
+        started = self.start_simulation(simulation_id)
+        await self.sync_state(simulation_id)
+        return started
 
     def end_simulation(self, simulation_id: str, reason: str = "completed") -> bool:
         """End an active call simulation."""
@@ -55,48 +100,315 @@ class SimulationService:
             if not simulation:
                 return False
             
-            simulation.is_active = False
-            simulation.end_time = datetime.utcnow()
-            simulation.status = reason
-            logger.info(f"Ended simulation {simulation_id} with reason: {reason}")
+            end_time = datetime.utcnow()
+
+            def end(s: CallSimulation) -> None:
+                s.is_active = False
+                s.end_time = end_time
+                s.status = reason
+
+            self._apply(simulation, end, {"type": "ended", "reason": reason})
+            self.context_service.drop(simulation_id)
+            logger.info("Ended simulation %s with reason: %s", simulation_id, reason)
             return True
         except Exception as e:
-            logger.error(f"Error ending simulation: {str(e)}")
+            logger.error("Error ending simulation: %s", e)
             return False
 
-    async def process_message(self, simulation_id: str, message: str) -> Optional[str]:
+    async def process_message(self, simulation_id: str, message: str, timeout: Optional[float] = None) -> Optional[str]:
         """Process a message in the simulation and get AI response."""
         try:
-            simulation = self.active_simulations.get(simulation_id)
+            with span("process_message", {"simulation_id": simulation_id}):
+                simulation = await self._get_simulation(simulation_id)
+                if not simulation or not simulation.is_active:
+                    return None
+
+                self._prepare_turn(simulation, message)
+                messages = await self.context_service.build_messages(simulation_id)
+
+                # Get AI response, serving repeated intents from the cache
+                response = await self.response_cache.get(messages) if self.response_cache else None
+                if response is None:
+                    with span("llm_response"):
+                        response = await self.llm_service.get_response_async(messages, timeout=timeout)
+                    if self.response_cache:
+                        await self.response_cache.set(messages, response)
+
+                # Add AI response to history
+                self._add_message(simulation, "assistant", response)
+                await self.sync_state(simulation_id)
+
+                return response
+        except Exception as e:
+            logger.error("Error processing message: %s", e)
+            return None
+
+    async def stream_message(self, simulation_id: str, message: str) -> Optional[AsyncIterator[str]]:
+        """Process a message and stream the AI response as it is generated."""
+        try:
+            simulation = await self._get_simulation(simulation_id)
             if not simulation or not simulation.is_active:
                 return None
 
-            # Add user message to history
-            simulation.messages.append({
-                "role": "user",
-                "content": message,
-                "timestamp": datetime.utcnow().isoformat()
-            })
-
-            # Simulate network conditions and update metrics
-            self._update_quality_metrics(simulation)
-            self._analyze_sentiment(simulation, message)
-
-            # Get AI response
-            messages = [{"role": m["role"], "content": m["content"]} for m in simulation.messages]
-            response = self.llm_service.get_response(messages)
-
-            # Add AI response to history
-            simulation.messages.append({
-                "role": "assistant",
-                "content": response,
-                "timestamp": datetime.utcnow().isoformat()
-            })
-
-            return response
+            self._prepare_turn(simulation, message)
+            return self._stream_response(simulation)
+        except Exception as e:
+            logger.error("Error processing message: %s", e)
+            return None
+
+    async def _stream_response(self, simulation: CallSimulation) -> AsyncIterator[str]:
+        """Relay LLM deltas and record the full response once the stream ends."""
+        messages = await self.context_service.build_messages(simulation.simulation_id)
+        cached = await self.response_cache.get(messages) if self.response_cache else None
+        if cached is not None:
+            self._add_message(simulation, "assistant", cached)
+            yield cached
+            return
+
+        parts: List[str] = []
+        completed = False
+        try:
+            async for delta in self.llm_service.stream_response(messages):
+                parts.append(delta)
+                yield delta
+            completed = True
+        finally:
+            # Keep whatever was generated even if the client disconnected early
+            if parts:
+                self._add_message(simulation, "assistant", "".join(parts))
+        if completed and self.response_cache:
+            await self.response_cache.set(messages, "".join(parts))
+
+    def _prepare_turn(self, simulation: CallSimulation, message: str) -> None:
+        """Record a user message and update per-turn metrics."""
+        # Add user message to history
+        self._add_message(simulation, "user", message)
+
+        # Simulate network conditions and update metrics
+        self._update_quality_metrics(simulation)
+        self._analyze_sentiment(simulation, len(simulation.messages) - 1)
+
+    def _add_message(self, simulation: CallSimulation, role: str, content: str) -> None:
+        """Append a message to the simulation history."""
+        entry = MessageRecord(role, content, time.time())
+        self._apply(simulation, lambda s: s.messages.append(entry))
+        if simulation.is_active:
+            self.context_service.append(simulation.simulation_id, role, content)
+
+    def _touch(self, simulation: CallSimulation) -> None:
+        """Record activity on a simulation and schedule it for persistence."""
+        simulation.last_activity = time.monotonic()
+        if self.store:
+            self.store.mark_dirty(simulation)
+        if self.session_backend:
+            self._pending.setdefault(simulation.simulation_id, PendingSync()).dirty = True
+            self._schedule_sync(simulation.simulation_id)
+
+    def _apply(
+        self,
+        simulation: CallSimulation,
+        change: Callable[[CallSimulation], None],
+        event: Optional[Dict] = None
+    ) -> None:
+        """
+        Apply a change to a simulation.
+
+        With a shared session backend the change is also kept until it has
+        been saved, so it can be replayed if another worker saved first;
+        changes must therefore only touch the simulation's state. The
+        event, if any, is published once the change is saved.
+        """
+        change(simulation)
+        if self.session_backend:
+            pending = self._pending.setdefault(simulation.simulation_id, PendingSync())
+            pending.changes.append(change)
+            if event:
+                pending.events.append({
+                    **event, "simulation_id": simulation.simulation_id, "worker": self.worker_id
+                })
+        self._touch(simulation)
+
+    def _state_lock(self, simulation_id: str) -> asyncio.Lock:
+        lock = self._state_locks.get(simulation_id)
+        if lock is None:
+            lock = self._state_locks[simulation_id] = asyncio.Lock()
+        return lock
+
+    def _schedule_sync(self, simulation_id: str) -> None:
+        task = self._syncing.get(simulation_id)
+        if task is None or task.done():
+            self._syncing[simulation_id] = asyncio.get_running_loop().create_task(self._sync(simulation_id))
+
+    async def _sync(self, simulation_id: str) -> None:
+        """Save a simulation's local changes to the shared backend with compare-and-set."""
+        try:
+            conflicts = 0
+            while conflicts < self.max_sync_attempts:
+                pending = self._pending.get(simulation_id)
+                simulation = self.active_simulations.get(simulation_id)
+                if pending is None or simulation is None:
+                    return
+                async with self._state_lock(simulation_id):
+                    pending.dirty = False
+                    saved_changes, saved_events = len(pending.changes), len(pending.events)
+                    version = await self.session_backend.compare_and_set(
+                        simulation_id, encode_state(simulation), simulation.version
+                    )
+                    if version is None:
+                        # Another worker saved first: rebase onto its state and retry
+                        conflicts += 1
+                        current = await self.session_backend.get(simulation_id)
+                        if current:
+                            self._install(simulation, *current)
+                        continue
+                    simulation.version = version
+                    del pending.changes[:saved_changes]
+                    events = pending.events[:saved_events]
+                    del pending.events[:saved_events]
+                    if not pending.dirty and not pending.changes:
+                        del self._pending[simulation_id]
+                for event in events:
+                    await self.session_backend.publish(event)
+            logger.error("Gave up saving simulation %s after %s conflicts", simulation_id, self.max_sync_attempts)
         except Exception as e:
-            logger.error(f"Error processing message: {str(e)}")
+            logger.error("Error saving session state: %s", e)
+        finally:
+            self._syncing.pop(simulation_id, None)
+
+    def _install(self, simulation: CallSimulation, data: bytes, version: int) -> None:
+        """Replace a local copy with shared state, keeping unsaved local changes on top."""
+        decode_state(data, simulation)
+        simulation.version = version
+        pending = self._pending.get(simulation.simulation_id)
+        for change in (pending.changes if pending else ()):
+            change(simulation)
+        self.context_service.drop(simulation.simulation_id)
+        if simulation.is_active:
+            for m in simulation.messages:
+                self.context_service.append(simulation.simulation_id, m.role, m.content)
+
+    async def _refresh(self, simulation_id: str) -> Optional[CallSimulation]:
+        """Bring the local copy of a simulation up to date with the shared backend."""
+        async with self._state_lock(simulation_id):
+            current = await self.session_backend.get(simulation_id)
+            simulation = self.active_simulations.get(simulation_id)
+            if current is None:
+                return simulation
+            data, version = current
+            if simulation is None:
+                simulation = self.active_simulations.setdefault(simulation_id, CallSimulation(simulation_id))
+            if version > simulation.version:
+                self._install(simulation, data, version)
+            return simulation
+
+    async def sync_state(self, simulation_id: str) -> None:
+        """Wait until local changes to a simulation are saved to the shared backend."""
+        task = self._syncing.get(simulation_id)
+        if task is not None:
+            await asyncio.shield(task)
+
+    @asynccontextmanager
+    async def session(self, simulation_id: str):
+        """
+        Bring a simulation up to date before a block and save its changes after.
+
+        Wrap calls to the synchronous methods (end_simulation, transfer_call,
+        add_note, ...) in this when several workers share the session state,
+        so they see changes made elsewhere and the caller only gets an answer
+        once the change is visible to every worker.
+        """
+        await self._get_simulation(simulation_id)
+        yield
+        await self.sync_state(simulation_id)
+
+    async def run_event_listener(self) -> None:
+        """Refresh local copies when another worker transfers or ends a call."""
+        if not self.session_backend:
+            return
+        async for event in self.session_backend.subscribe():
+            try:
+                if event.get("worker") == self.worker_id:
+                    continue
+                simulation_id = event.get("simulation_id")
+                if simulation_id in self.active_simulations:
+                    await self._refresh(simulation_id)
+                    logger.info("Simulation %s %s on another worker", simulation_id, event.get("type"))
+            except Exception as e:
+                logger.error("Error handling session event: %s", e)
+
+    async def _get_simulation(self, simulation_id: str) -> Optional[CallSimulation]:
+        """Get a simulation from memory, falling back to the persistent store."""
+        if self.session_backend:
+            simulation = await self._refresh(simulation_id)
+        else:
+            simulation = self.active_simulations.get(simulation_id)
+        if simulation or not self.store:
+            return simulation
+
+        simulation = await self.store.load(simulation_id, CallSimulation)
+        if simulation is None:
             return None
+        # Another request may have loaded it while we were waiting
+        simulation = self.active_simulations.setdefault(simulation_id, simulation)
+        if simulation.transferred_to:
+            simulation.transferred_to = next(
+                (a for a in self.available_agents if a["id"] == simulation.transferred_to["id"]),
+                simulation.transferred_to
+            )
+        if simulation.is_active:
+            for m in simulation.messages:
+                self.context_service.append(simulation_id, m.role, m.content)
+        return simulation
+
+    def evict_idle_simulations(self, max_idle: float, max_idle_active: Optional[float] = None) -> int:
+        """
+        Remove ended simulations that have been idle for max_idle seconds.
+
+        Active simulations idle for ``max_idle_active`` seconds (abandoned
+        calls) are removed too, along with their conversation context, when
+        the store or the shared backend can bring them back on the next
+        request. Simulations with unsaved changes are kept until they have
+        been written.
+        """
+        now = time.monotonic()
+        evicted = 0
+        restorable = self.store is not None or self.session_backend is not None
+        for simulation_id, simulation in list(self.active_simulations.items()):
+            idle = now - simulation.last_activity
+            if simulation.is_active:
+                if max_idle_active is None or idle < max_idle_active or not restorable:
+                    continue
+            elif idle < max_idle:
+                continue
+            if simulation_id in self._pending:
+                continue
+            if self.store:
+                if self.store.is_dirty(simulation_id):
+                    continue
+                self.store.forget(simulation_id)
+                if self.session_backend and not simulation.is_active:
+                    # Persisted, so the shared copy is no longer needed
+                    self._released.append(simulation_id)
+            del self.active_simulations[simulation_id]
+            self._state_locks.pop(simulation_id, None)
+            self.context_service.drop(simulation_id)
+            evicted += 1
+        if evicted:
+            logger.info("Evicted %s idle simulations", evicted)
+        return evicted
+
+    async def run_eviction_loop(
+        self, max_idle: float, interval: float = 60.0, max_idle_active: Optional[float] = None
+    ) -> None:
+        """Periodically evict idle ended and abandoned simulations."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.evict_idle_simulations(max_idle, max_idle_active)
+                while self._released:
+                    await self.session_backend.delete(self._released.pop())
+            except Exception as e:
+                logger.error("Error evicting simulations: %s", e)
 
     def transfer_call(self, simulation_id: str, agent_id: str, reason: str) -> bool:
         """Transfer the call to another agent."""
@@ -109,16 +421,19 @@ class SimulationService:
             if not agent:
                 return False
 
-            simulation.transferred_to = agent
-            simulation.transfer_reason = reason
-            simulation.status = "transferred"
+            def transfer(s: CallSimulation) -> None:
+                s.transferred_to = agent
+                s.transfer_reason = reason
+                s.status = "transferred"
+
+            self._apply(simulation, transfer, {"type": "transferred", "agent_id": agent_id})
             
             # Add transfer note
             self.add_note(simulation_id, f"Call transferred to {agent['name']} ({agent['department']}) - Reason: {reason}")
             
             return True
         except Exception as e:
-            logger.error(f"Error transferring call: {str(e)}")
+            logger.error("Error transferring call: %s", e)
             return False
 
     def add_note(self, simulation_id: str, content: str) -> bool:
@@ -128,13 +443,11 @@ class SimulationService:
             if not simulation:
                 return False
 
-            simulation.notes.append({
-                "content": content,
-                "timestamp": datetime.utcnow().isoformat()
-            })
+            note = NoteRecord(content, time.time())
+            self._apply(simulation, lambda s: s.notes.append(note))
             return True
         except Exception as e:
-            logger.error(f"Error adding note: {str(e)}")
+            logger.error("Error adding note: %s", e)
             return False
 
     def add_tag(self, simulation_id: str, tag_name: str, tag_type: str = "default") -> bool:
@@ -144,14 +457,11 @@ class SimulationService:
             if not simulation:
                 return False
 
-            simulation.tags.append({
-                "name": tag_name,
-                "type": tag_type,
-                "timestamp": datetime.utcnow().isoformat()
-            })
+            tag = TagRecord(tag_name, tag_type, time.time())
+            self._apply(simulation, lambda s: s.tags.append(tag))
             return True
         except Exception as e:
-            logger.error(f"Error adding tag: {str(e)}")
+            logger.error("Error adding tag: %s", e)
             return False
 
     def get_simulation_details(self, simulation_id: str) -> Optional[Dict]:
@@ -161,32 +471,143 @@ class SimulationService:
             if not simulation:
                 return None
 
-            duration = None
-            if simulation.end_time:
-                duration = (simulation.end_time - simulation.start_time).seconds
-            elif simulation.is_active:
-                duration = (datetime.utcnow() - simulation.start_time).seconds
-
-            return {
-                "simulation_id": simulation.simulation_id,
-                "start_time": simulation.start_time.isoformat(),
-                "end_time": simulation.end_time.isoformat() if simulation.end_time else None,
-                "duration": duration,
-                "is_active": simulation.is_active,
-                "is_recording": simulation.is_recording,
-                "status": simulation.status,
-                "transferred_to": simulation.transferred_to,
-                "transfer_reason": simulation.transfer_reason,
-                "message_count": len(simulation.messages),
-                "quality_metrics": simulation.quality_metrics,
-                "messages": simulation.messages,
-                "notes": simulation.notes,
-                "tags": simulation.tags
-            }
+            return self._serialize(simulation)
+        except Exception as e:
+            logger.error("Error getting simulation details: %s", e)
+            return None
+
+    async def find_simulation_details(self, simulation_id: str) -> Optional[Dict]:
+        """Get details about a simulation, reading evicted ones from the store."""
+        try:
+            simulation = self.active_simulations.get(simulation_id)
+            if not simulation and self.store:
+                simulation = await self.store.load(simulation_id, CallSimulation)
+            if not simulation:
+                return None
+
+            return self._serialize(simulation)
         except Exception as e:
-            logger.error(f"Error getting simulation details: {str(e)}")
+            logger.error("Error getting simulation details: %s", e)
             return None
 
+    async def get_all_simulations(self, limit: int = 20, cursor: Optional[str] = None, **filters) -> Dict:
+        """
+        Get one page of simulations, newest first.
+
+        Reads from the persistent store when one is configured; otherwise
+        filters the simulations held in memory.
+
+        Args:
+            limit: Maximum number of simulations to return
+            cursor: Cursor returned with the previous page
+            **filters: status, tag, agent_id, date_from, date_to,
+                min_sentiment, max_sentiment, search
+
+        Returns:
+            Dict with the page of simulations and the cursor for the next page
+        """
+        try:
+            if self.store:
+                return await self.store.list_calls(limit=limit, cursor=cursor, **filters)
+            return self._list_in_memory(limit, cursor, **filters)
+        except Exception as e:
+            logger.error("Error listing simulations: %s", e)
+            return {"calls": [], "next_cursor": None}
+
+    async def iter_simulations(
+        self,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ) -> AsyncIterator[Dict]:
+        """Yield every simulation with its messages, notes and tags for export."""
+        if self.store:
+            async for record in self.store.iter_calls(date_from=date_from, date_to=date_to):
+                yield record
+            return
+
+        for simulation in list(self.active_simulations.values()):
+            if date_from and simulation.start_time < date_from:
+                continue
+            if date_to and simulation.start_time >= date_to:
+                continue
+            record = self._serialize(simulation)
+            record["agent_id"] = (simulation.transferred_to or {}).get("id")
+            yield record
+
+    def _list_in_memory(
+        self,
+        limit: int,
+        cursor: Optional[str],
+        status: Optional[str] = None,
+        tag: Optional[str] = None,
+        agent_id: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        min_sentiment: Optional[float] = None,
+        max_sentiment: Optional[float] = None,
+        search: Optional[str] = None,
+    ) -> Dict:
+        def matches(simulation: CallSimulation) -> bool:
+            tag_names = {t.name for t in simulation.tags}
+            sentiment = simulation.quality_metrics.sentiment_score
+            return (
+                (not status or simulation.status == status)
+                and (not tag or tag in tag_names)
+                and (not agent_id or (simulation.transferred_to or {}).get("id") == agent_id)
+                and (not date_from or simulation.start_time >= date_from)
+                and (not date_to or simulation.start_time < date_to)
+                and (min_sentiment is None or sentiment >= min_sentiment)
+                and (max_sentiment is None or sentiment <= max_sentiment)
+                and (not search or simulation.simulation_id.startswith(search) or search in tag_names)
+            )
+
+        simulations = sorted(
+            (s for s in self.active_simulations.values() if matches(s)),
+            key=lambda s: (s.start_time, s.simulation_id),
+            reverse=True
+        )
+        if cursor:
+            start_time, simulation_id = decode_cursor(cursor)
+            simulations = [s for s in simulations if (s.start_time, s.simulation_id) < (start_time, simulation_id)]
+
+        page = simulations[:limit]
+        next_cursor = None
+        if len(simulations) > limit:
+            next_cursor = encode_cursor(page[-1].start_time, page[-1].simulation_id)
+
+        calls = []
+        for simulation in page:
+            details = self._serialize(simulation)
+            del details["messages"]
+            details["note"] = simulation.notes[-1].content if simulation.notes else None
+            calls.append(details)
+        return {"calls": calls, "next_cursor": next_cursor}
+
+    def _serialize(self, simulation: CallSimulation) -> Dict:
+        """Render a simulation for API responses; the only place timestamps become ISO strings."""
+        duration = None
+        if simulation.end_time:
+            duration = (simulation.end_time - simulation.start_time).seconds
+        elif simulation.is_active:
+            duration = (datetime.utcnow() - simulation.start_time).seconds
+
+        return {
+            "simulation_id": simulation.simulation_id,
+            "start_time": simulation.start_time.isoformat(),
+            "end_time": simulation.end_time.isoformat() if simulation.end_time else None,
+            "duration": duration,
+            "is_active": simulation.is_active,
+            "is_recording": simulation.is_recording,
+            "status": simulation.status,
+            "transferred_to": simulation.transferred_to,
+            "transfer_reason": simulation.transfer_reason,
+            "message_count": len(simulation.messages),
+            "quality_metrics": simulation.quality_metrics.as_dict(),
+            "messages": [m.as_dict() for m in simulation.messages],
+            "notes": [n.as_dict() for n in simulation.notes],
+            "tags": [t.as_dict() for t in simulation.tags]
+        }
+
     def toggle_recording(self, simulation_id: str) -> bool:
         """Toggle call recording status."""
         try:
@@ -194,10 +615,11 @@ class SimulationService:
             if not simulation or not simulation.is_active:
                 return False
 
-            simulation.is_recording = not simulation.is_recording
+            recording = not simulation.is_recording
+            self._apply(simulation, lambda s: setattr(s, "is_recording", recording))
             return simulation.is_recording
         except Exception as e:
-            logger.error(f"Error toggling recording: {str(e)}")
+            logger.error("Error toggling recording: %s", e)
             return False
 
     def _update_quality_metrics(self, simulation: CallSimulation) -> None:
@@ -205,17 +627,22 @@ class SimulationService:
         try:
             import random
             
+            metrics = simulation.quality_metrics
+            rng = random
+            if self.seed is not None:
+                rng = random.Random(f"{self.seed}:{simulation.simulation_id}:{len(simulation.messages)}")
+
             # Simulate network conditions
-            simulation.quality_metrics["latency"] = random.uniform(10, 100)
-            simulation.quality_metrics["packet_loss"] = random.uniform(0, 2)
-            simulation.quality_metrics["jitter"] = random.uniform(0, 20)
+            metrics.latency = rng.uniform(10, 100)
+            metrics.packet_loss = rng.uniform(0, 2)
+            metrics.jitter = rng.uniform(0, 20)
             
             # Calculate quality score
-            latency_score = max(0, 100 - simulation.quality_metrics["latency"])
-            packet_loss_score = max(0, 100 - (simulation.quality_metrics["packet_loss"] * 50))
-            jitter_score = max(0, 100 - (simulation.quality_metrics["jitter"] * 5))
+            latency_score = max(0, 100 - metrics.latency)
+            packet_loss_score = max(0, 100 - (metrics.packet_loss * 50))
+            jitter_score = max(0, 100 - (metrics.jitter * 5))
             
-            simulation.quality_metrics["quality_score"] = (
+            metrics.quality_score = (
                 latency_score * 0.4 +
                 packet_loss_score * 0.4 +
                 jitter_score * 0.2
@@ -223,30 +650,38 @@ class SimulationService:
 
             # Update resolution time
             if simulation.end_time:
-                simulation.quality_metrics["resolution_time"] = (
+                metrics.resolution_time = (
                     simulation.end_time - simulation.start_time
                 ).seconds
         except Exception as e:
-            logger.error(f"Error updating quality metrics: {str(e)}")
-            simulation.quality_metrics["quality_score"] = 100
+            logger.error("Error updating quality metrics: %s", e)
+            simulation.quality_metrics.quality_score = 100
+
+    def _analyze_sentiment(self, simulation: CallSimulation, index: int) -> None:
+        """Queue a user message, by its position in the history, for background sentiment scoring."""
+        if self.sentiment_worker:
+            self.sentiment_worker.submit((simulation, index), simulation.messages[index].content)
+
+    def _apply_sentiment(self, key: Tuple[CallSimulation, int], compound: float) -> None:
+        """
+        Record a message's score and fold it into the conversation's running sentiment.
+
+        The score is kept on the message so the store writes it to
+        Message.sentiment, the same column the backfill fills in.
+        """
+        simulation, index = key
+
+        def fold(s: CallSimulation) -> None:
+            # Messages are only ever appended, so the index holds on every worker's copy
+            if index < len(s.messages):
+                s.messages[index].sentiment = compound
+            metrics = s.quality_metrics
+            metrics.sentiment_trend.append(compound_to_score(compound))
+            trend = metrics.sentiment_trend
+            current = metrics.sentiment_score if len(trend) > 1 else 0
+            metrics.sentiment_score = round(current + (trend[-1] - current) / len(trend), 2)
 
-    def _analyze_sentiment(self, simulation: CallSimulation, message: str) -> None:
-        """Analyze message sentiment and update metrics."""
         try:
-            # Simple sentiment analysis (replace with more sophisticated analysis if needed)
-            positive_words = ["happy", "great", "excellent", "good", "thanks", "helpful"]
-            negative_words = ["bad", "poor", "terrible", "unhappy", "frustrated", "angry"]
-            
-            words = message.lower().split()
-            positive_count = sum(1 for w in words if w in positive_words)
-            negative_count = sum(1 for w in words if w in negative_words)
-            
-            if positive_count + negative_count > 0:
-                sentiment = (positive_count - negative_count) / (positive_count + negative_count)
-                # Convert to 0-100 scale
-                simulation.quality_metrics["sentiment_score"] = (sentiment + 1) * 50
-            else:
-                simulation.quality_metrics["sentiment_score"] = 50
+            self._apply(simulation, fold)
         except Exception as e:
-            logger.error(f"Error analyzing sentiment: {str(e)}")
-            simulation.quality_metrics["sentiment_score"] = 50 
\ No newline at end of file
+            logger.error("Error applying sentiment: %s", e)
@@ -1,47 +1,131 @@
-import whisper
-from gtts import gTTS
-import tempfile
+import asyncio
+import io
 import os
+import threading
+from collections import deque
 import soundfile as sf
 import numpy as np
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple, Union
+from app.services.tts_service import TTSService
+from app.core.logger import logger
+from app.core.metrics import STT_SECONDS
+
+# Whisper expects mono float32 audio at 16 kHz
+SAMPLE_RATE = 16000
+
+_models: Dict[str, object] = {}
+_models_lock = threading.Lock()
+
+
+def get_whisper_model(name: Optional[str] = None):
+    """
+    Load a Whisper model once per process and share it.
+
+    Args:
+        name: Model size, defaults to WHISPER_MODEL or "base"
+
+    Returns:
+        The loaded Whisper model
+    """
+    name = name or os.getenv("WHISPER_MODEL", "base")
+    with _models_lock:
+        if name not in _models:
+            import whisper
+            logger.info("Loading Whisper model %s", name)
+            _models[name] = whisper.load_model(name)
+        return _models[name]
+
+
+def pcm16_to_float(data: bytes) -> np.ndarray:
+    """Convert little-endian 16-bit PCM bytes to float32 samples in [-1, 1]."""
+    return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+
+
+def to_whisper_input(audio: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Downmix to mono and resample to 16 kHz float32."""
+    audio = np.asarray(audio, dtype=np.float32)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    if sample_rate != SAMPLE_RATE and len(audio):
+        target = int(round(len(audio) * SAMPLE_RATE / sample_rate))
+        audio = np.interp(
+            np.linspace(0, len(audio) - 1, target), np.arange(len(audio)), audio
+        ).astype(np.float32)
+    return audio
+
 
 class SpeechService:
-    def __init__(self):
-        self.whisper_model = whisper.load_model("base")
-        
+    def __init__(self, model=None, model_name: Optional[str] = None, pool=None, tts: Optional[TTSService] = None):
+        # With a shared TranscriptionService pool, async transcription runs in
+        # its worker processes and this process never loads a model
+        self.pool = pool
+        self.model_name = model_name
+        self._model = model
+        self.tts = tts or TTSService()
+
+    @property
+    def whisper_model(self):
+        # Loaded on first transcription rather than at construction
+        if self._model is None and self.pool is None:
+            self._model = get_whisper_model(self.model_name)
+        return self._model
+
     def speech_to_text(self, audio_data: bytes) -> str:
         """
         Convert speech to text using Whisper.
         
         Args:
-            audio_data: Raw audio data in bytes
+            audio_data: Encoded audio (WAV, FLAC, OGG) in bytes
             
         Returns:
             str: Transcribed text
         """
         try:
-            # Save audio data to temporary file
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                temp_path = temp_file.name
-                # Convert audio data to numpy array
-                audio_array, sample_rate = sf.read(audio_data)
-                sf.write(temp_path, audio_array, sample_rate)
-            
-            # Transcribe audio
-            result = self.whisper_model.transcribe(temp_path)
-            
-            # Clean up temporary file
-            os.unlink(temp_path)
-            
+            # Decode in memory; no temporary file round trip
+            audio_array, sample_rate = sf.read(io.BytesIO(audio_data), dtype="float32")
+            return self.transcribe_array(audio_array, sample_rate)
+        except Exception as e:
+            logger.error("Error in speech-to-text conversion: %s", e)
+            return ""
+
+    def transcribe_array(self, audio: Union[np.ndarray, bytes], sample_rate: int = SAMPLE_RATE) -> str:
+        """
+        Transcribe an in-memory audio buffer.
+
+        Args:
+            audio: Float samples, or 16-bit PCM bytes
+            sample_rate: Sample rate of the buffer
+
+        Returns:
+            str: Transcribed text
+        """
+        try:
+            if isinstance(audio, (bytes, bytearray, memoryview)):
+                audio = pcm16_to_float(audio)
+            audio = to_whisper_input(audio, sample_rate)
+            if not len(audio):
+                return ""
+            result = self.whisper_model.transcribe(audio, fp16=False)
             return result["text"].strip()
         except Exception as e:
-            print(f"Error in speech-to-text conversion: {str(e)}")
+            logger.error("Error in speech-to-text conversion: %s", e)
             return ""
-            
+
+    async def transcribe_async(self, audio: Union[np.ndarray, bytes], sample_rate: int = SAMPLE_RATE) -> str:
+        """Transcribe a buffer off the event loop, in the pool if there is one."""
+        if self.pool:
+            with STT_SECONDS.labels("pool").time():
+                return await self.pool.transcribe(audio, sample_rate)
+        with STT_SECONDS.labels("thread").time():
+            return await asyncio.to_thread(self.transcribe_array, audio, sample_rate)
+
+    def stream(self, sample_rate: int = SAMPLE_RATE, **kwargs) -> "StreamingTranscriber":
+        """Start a streaming transcription session for one audio source."""
+        return StreamingTranscriber(self, sample_rate=sample_rate, **kwargs)
+
     def text_to_speech(self, text: str) -> Tuple[bytes, str]:
         """
-        Convert text to speech using gTTS.
+        Convert text to speech, served from the phrase cache when possible.
         
         Args:
             text: Text to convert to speech
@@ -50,22 +134,136 @@ class SpeechService:
             Tuple[bytes, str]: Audio data in bytes and content type
         """
         try:
-            # Create temporary file for audio
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_file:
-                temp_path = temp_file.name
-                
-                # Generate speech
-                tts = gTTS(text=text, lang='en')
-                tts.save(temp_path)
-                
-                # Read the generated audio file
-                with open(temp_path, 'rb') as audio_file:
-                    audio_data = audio_file.read()
-                
-                # Clean up temporary file
-                os.unlink(temp_path)
-                
-                return audio_data, 'audio/mpeg'
+            return self.tts.synthesize(text)
+        except Exception as e:
+            logger.error("Error in text-to-speech conversion: %s", e)
+            return b"", self.tts.backend.content_type
+
+
+class StreamingTranscriber:
+    """
+    Incremental transcription of a live audio stream.
+
+    Incoming audio is cut into short frames and classified as speech or
+    silence by RMS energy. While someone is speaking, the last
+    ``partial_window_seconds`` of the segment are re-transcribed every
+    ``partial_ms`` of new speech and emitted as a partial transcript.
+    Partials run in the background, one at a time, and are returned by a
+    later ``feed``, so they never hold up incoming audio. Once
+    ``silence_ms`` of silence follows (or the segment reaches
+    ``max_segment_seconds``) the whole segment is transcribed one last
+    time and emitted as final.
+    """
+
+    def __init__(
+        self,
+        speech_service: SpeechService,
+        sample_rate: int = SAMPLE_RATE,
+        frame_ms: int = 30,
+        energy_threshold: Optional[float] = None,
+        silence_ms: Optional[int] = None,
+        partial_ms: Optional[int] = None,
+        pre_roll_ms: int = 150,
+        max_segment_seconds: float = 15.0,
+        partial_window_seconds: Optional[float] = None,
+    ):
+        self.speech_service = speech_service
+        self.sample_rate = sample_rate
+        self.frame_size = sample_rate * frame_ms // 1000
+        self.energy_threshold = energy_threshold or float(os.getenv("STT_VAD_THRESHOLD", "0.01"))
+        self.silence_samples = sample_rate * (silence_ms or int(os.getenv("STT_SILENCE_MS", "500"))) // 1000
+        self.partial_samples = sample_rate * (partial_ms or int(os.getenv("STT_PARTIAL_MS", "300"))) // 1000
+        self.max_segment_samples = int(sample_rate * max_segment_seconds)
+        window = partial_window_seconds or float(os.getenv("STT_PARTIAL_WINDOW_SECONDS", "5"))
+        self.partial_window_frames = max(1, int(sample_rate * window) // self.frame_size)
+        # Frames kept from just before speech starts so onsets are not clipped
+        self._pre_roll: deque = deque(maxlen=max(1, pre_roll_ms // frame_ms))
+        self._pending = np.empty(0, dtype=np.float32)
+        self._segment: List[np.ndarray] = []
+        self._segment_samples = 0
+        self._silent_samples = 0
+        self._since_partial = 0
+        self._partial: Optional[asyncio.Task] = None
+        self.in_speech = False
+
+    async def feed(self, audio: Union[np.ndarray, bytes]) -> List[Dict[str, str]]:
+        """
+        Add audio and return any transcripts it produced.
+
+        Args:
+            audio: Mono float samples, or 16-bit PCM bytes, at ``sample_rate``
+
+        Returns:
+            List of {"type": "partial" | "final", "text": ...} events
+        """
+        if isinstance(audio, (bytes, bytearray, memoryview)):
+            audio = pcm16_to_float(audio)
+        samples = np.concatenate([self._pending, np.asarray(audio, dtype=np.float32)])
+        usable = len(samples) // self.frame_size * self.frame_size
+        frames = samples[:usable].reshape(-1, self.frame_size)
+        self._pending = samples[usable:]
+        levels = np.sqrt(np.mean(frames ** 2, axis=1)) if len(frames) else []
+
+        events = self._take_partial()
+        for frame, level in zip(frames, levels):
+            is_speech = level >= self.energy_threshold
+            if not self.in_speech:
+                if not is_speech:
+                    self._pre_roll.append(frame)
+                    continue
+                self.in_speech = True
+                self._segment.extend(self._pre_roll)
+                self._segment_samples += len(self._pre_roll) * self.frame_size
+                self._pre_roll.clear()
+
+            self._segment.append(frame)
+            self._segment_samples += self.frame_size
+            if is_speech:
+                # Pauses add nothing new to transcribe
+                self._since_partial += self.frame_size
+            self._silent_samples = 0 if is_speech else self._silent_samples + self.frame_size
+            if self._silent_samples >= self.silence_samples or self._segment_samples >= self.max_segment_samples:
+                event = await self._finish()
+                if event:
+                    events.append(event)
+
+        if self.in_speech and self._since_partial >= self.partial_samples and self._partial is None:
+            self._since_partial = 0
+            window = np.concatenate(self._segment[-self.partial_window_frames:])
+            self._partial = asyncio.ensure_future(self.speech_service.transcribe_async(window, self.sample_rate))
+        return events
+
+    def _take_partial(self) -> List[Dict[str, str]]:
+        """Collect the background partial transcript if it has finished."""
+        if self._partial is None or not self._partial.done():
+            return []
+        task, self._partial = self._partial, None
+        try:
+            text = task.result()
         except Exception as e:
-            print(f"Error in text-to-speech conversion: {str(e)}")
-            return b"", 'audio/mpeg' 
\ No newline at end of file
+            logger.error("Error in partial transcription: %s", e)
+            return []
+        return [{"type": "partial", "text": text}] if text else []
+
+    def close(self) -> None:
+        """Drop any partial transcription still running."""
+        if self._partial is not None:
+            self._partial.cancel()
+            self._partial = None
+
+    async def flush(self) -> List[Dict[str, str]]:
+        """Finalize any segment still in progress, e.g. when the stream ends."""
+        event = await self._finish() if self.in_speech else None
+        return [event] if event else []
+
+    async def _finish(self) -> Optional[Dict[str, str]]:
+        audio = np.concatenate(self._segment)
+        self._segment = []
+        self._segment_samples = 0
+        self._silent_samples = 0
+        self._since_partial = 0
+        self.in_speech = False
+        # The final transcript supersedes any partial still running
+        self.close()
+        text = await self.speech_service.transcribe_async(audio, self.sample_rate)
+        return {"type": "final", "text": text} if text else None
@@ -0,0 +1,494 @@
+import asyncio
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from sqlalchemy import select, insert, update, func, or_, tuple_
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.models.database import Call, Message, Note, Tag
+from app.models.call import MessageRecord, NoteRecord, TagRecord, QualityMetrics, to_epoch, from_epoch
+from app.services.analytics_service import AnalyticsService
+from app.core.logger import logger
+
+
+class PersistedState:
+    """What has already been written for a simulation."""
+
+    __slots__ = ("call_id", "messages", "notes", "tags", "ended", "unscored")
+
+    def __init__(
+        self,
+        call_id: int,
+        messages: int = 0,
+        notes: int = 0,
+        tags: int = 0,
+        ended: bool = False,
+        unscored: Tuple[int, ...] = (),
+    ):
+        self.call_id = call_id
+        self.messages = messages
+        self.notes = notes
+        self.tags = tags
+        self.ended = ended
+        # Written user messages whose sentiment score had not arrived yet
+        self.unscored = unscored
+
+
+def encode_cursor(created_at: datetime, key: Any) -> str:
+    """Encode the sort key of the last row on a page as an opaque cursor."""
+    raw = json.dumps([created_at.isoformat(), key]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, Any]:
+    created_at, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return datetime.fromisoformat(created_at), key
+
+
+class SimulationStore:
+    """
+    Write-behind persistence for call simulations.
+
+    Mutations only mark a simulation dirty; a background task flushes all
+    dirty simulations in one transaction every ``flush_interval`` seconds,
+    or sooner once ``batch_size`` simulations are waiting. Messages, notes
+    and tags are append-only, so each flush inserts just the new rows.
+    The flush that first persists a call as ended also adds it to the
+    analytics rollups.
+
+    With ``shared=True`` other workers write the same simulations, so what
+    is already stored is read back from the database on every flush rather
+    than remembered from this worker's own writes.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        flush_interval: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        shared: bool = False,
+    ):
+        self.session_factory = session_factory
+        self.shared = shared
+        self.flush_interval = flush_interval or float(os.getenv("STORE_FLUSH_INTERVAL", "1.0"))
+        self.batch_size = batch_size or int(os.getenv("STORE_BATCH_SIZE", "200"))
+        self._dirty: Dict[str, object] = {}
+        # The batch being written; still dirty as far as eviction is concerned
+        self._flushing: Dict[str, object] = {}
+        self._flush_lock = asyncio.Lock()
+        self._persisted: Dict[str, PersistedState] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def mark_dirty(self, simulation) -> None:
+        """Schedule a simulation to be written on the next flush."""
+        self._dirty[simulation.simulation_id] = simulation
+        if len(self._dirty) >= self.batch_size:
+            self._wakeup.set()
+
+    def is_dirty(self, simulation_id: str) -> bool:
+        """True until every change to the simulation has been written."""
+        return simulation_id in self._dirty or simulation_id in self._flushing
+
+    def forget(self, simulation_id: str) -> None:
+        """Drop bookkeeping for a simulation that was evicted from memory."""
+        self._persisted.pop(simulation_id, None)
+
+    async def start(self) -> None:
+        """Start the background flush loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flush loop and write out anything still pending."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Write all dirty simulations in a single transaction.
+
+        Returns:
+            int: Number of simulations written
+        """
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+
+            batch, self._dirty = self._dirty, {}
+            self._flushing = batch
+            try:
+                # Snapshot on the event loop so later mutations land in the next flush
+                snapshots = [self._snapshot(simulation) for simulation in batch.values()]
+                written: List[Tuple[str, PersistedState]] = []
+                async with self.session_factory() as session:
+                    async with session.begin():
+                        for snapshot in snapshots:
+                            written.append(await self._write(session, snapshot))
+            except Exception as e:
+                logger.error("Error flushing simulations: %s", e)
+                # Keep newer marks and retry the rest on the next flush
+                for simulation_id, simulation in batch.items():
+                    self._dirty.setdefault(simulation_id, simulation)
+                return 0
+            finally:
+                self._flushing = {}
+
+            for simulation_id, state in written:
+                self._persisted[simulation_id] = state
+            self.flushes += 1
+            return len(written)
+
+    def _snapshot(self, simulation) -> Dict:
+        state = None if self.shared else self._persisted.get(simulation.simulation_id)
+        seen = (state.messages, state.notes, state.tags) if state else (0, 0, 0)
+
+        messages = simulation.messages
+        written_unscored = state.unscored if state else ()
+        # Scores that arrived after their message was written are updated in place
+        rescored = [(i, messages[i].sentiment) for i in written_unscored if messages[i].sentiment is not None]
+        unscored = tuple(
+            i for i in [*written_unscored, *range(seen[0], len(messages))]
+            if messages[i].role == "user" and messages[i].sentiment is None
+        )
+
+        duration = None
+        if simulation.end_time:
+            duration = (simulation.end_time - simulation.start_time).seconds
+
+        return {
+            "simulation_id": simulation.simulation_id,
+            "call_id": state.call_id if state else None,
+            "was_ended": state.ended if state else False,
+            "values": {
+                "simulation_id": simulation.simulation_id,
+                "status": simulation.status,
+                "duration": duration,
+                "created_at": simulation.start_time,
+                "ended_at": simulation.end_time,
+                "agent_id": simulation.transferred_to["id"] if simulation.transferred_to else None,
+                "transfer_reason": simulation.transfer_reason,
+                "quality_metrics": simulation.quality_metrics.as_dict(),
+                "message_count": len(simulation.messages),
+                "sentiment_score": simulation.quality_metrics.sentiment_score,
+            },
+            "messages": messages[seen[0]:],
+            "rescored": rescored,
+            "unscored": unscored,
+            "notes": simulation.notes[seen[1]:],
+            "tags": simulation.tags[seen[2]:],
+            "counts": (len(messages), len(simulation.notes), len(simulation.tags)),
+        }
+
+    async def _write(self, session, snapshot: Dict) -> Tuple[str, PersistedState]:
+        call_id = snapshot["call_id"]
+        was_ended = snapshot["was_ended"]
+        values = snapshot["values"]
+
+        if call_id is None:
+            # The row may already exist if another worker or a previous
+            # process wrote this simulation
+            row = (await session.execute(
+                select(Call.id, Call.ended_at).where(Call.simulation_id == snapshot["simulation_id"])
+            )).first()
+            if row:
+                call_id, was_ended = row.id, row.ended_at is not None
+                # Skip whatever the other writer already stored
+                for key, model in (("messages", Message), ("notes", Note), ("tags", Tag)):
+                    stored = await session.scalar(
+                        select(func.count()).select_from(model).where(model.call_id == call_id)
+                    )
+                    snapshot[key] = snapshot[key][stored:]
+        if call_id is None:
+            call_id = await session.scalar(insert(Call).values(**values).returning(Call.id))
+        else:
+            await session.execute(update(Call).where(Call.id == call_id).values(**values))
+        self.rows_written += 1
+
+        if snapshot["messages"]:
+            await session.execute(insert(Message), [
+                {
+                    "call_id": call_id, "role": m.role, "content": m.content,
+                    "created_at": from_epoch(m.timestamp), "sentiment": m.sentiment,
+                }
+                for m in snapshot["messages"]
+            ])
+        if snapshot["rescored"]:
+            ids = (await session.scalars(
+                select(Message.id).where(Message.call_id == call_id).order_by(Message.id)
+            )).all()
+            await session.execute(update(Message), [
+                {"id": ids[index], "sentiment": sentiment}
+                for index, sentiment in snapshot["rescored"] if index < len(ids)
+            ])
+        if snapshot["notes"]:
+            await session.execute(insert(Note), [
+                {"call_id": call_id, "content": n.content, "created_at": from_epoch(n.timestamp)}
+                for n in snapshot["notes"]
+            ])
+        if snapshot["tags"]:
+            await session.execute(insert(Tag), [
+                {"call_id": call_id, "name": t.name, "type": t.type, "created_at": from_epoch(t.timestamp)}
+                for t in snapshot["tags"]
+            ])
+        self.rows_written += len(snapshot["messages"]) + len(snapshot["notes"]) + len(snapshot["tags"])
+
+        ended = values["ended_at"] is not None
+        if ended and not was_ended:
+            await AnalyticsService.record_call(session, values)
+
+        return snapshot["simulation_id"], PersistedState(
+            call_id, *snapshot["counts"], ended=ended, unscored=snapshot["unscored"]
+        )
+
+    async def load(self, simulation_id: str, simulation_factory) -> Optional[object]:
+        """
+        Rebuild a simulation from the database.
+
+        Args:
+            simulation_id: Simulation to load
+            simulation_factory: Callable creating an empty simulation for an id
+
+        Returns:
+            The restored simulation, or None if it was never persisted
+        """
+        try:
+            async with self.session_factory() as session:
+                call = await session.scalar(select(Call).where(Call.simulation_id == simulation_id))
+                if call is None:
+                    return None
+                messages = (await session.scalars(
+                    select(Message).where(Message.call_id == call.id).order_by(Message.id)
+                )).all()
+                notes = (await session.scalars(
+                    select(Note).where(Note.call_id == call.id).order_by(Note.id)
+                )).all()
+                tags = (await session.scalars(
+                    select(Tag).where(Tag.call_id == call.id).order_by(Tag.id)
+                )).all()
+
+            simulation = simulation_factory(simulation_id)
+            simulation.start_time = call.created_at
+            simulation.end_time = call.ended_at
+            simulation.is_active = call.ended_at is None
+            simulation.status = call.status
+            simulation.transfer_reason = call.transfer_reason
+            if call.agent_id:
+                simulation.transferred_to = {"id": call.agent_id}
+            if call.quality_metrics:
+                simulation.quality_metrics = QualityMetrics.from_dict(call.quality_metrics)
+            simulation.messages = [
+                MessageRecord(m.role, m.content, to_epoch(m.created_at), m.sentiment) for m in messages
+            ]
+            simulation.notes = [NoteRecord(n.content, to_epoch(n.created_at)) for n in notes]
+            simulation.tags = [TagRecord(t.name, t.type, to_epoch(t.created_at)) for t in tags]
+            self._persisted[simulation_id] = PersistedState(
+                call.id, len(messages), len(notes), len(tags), ended=call.ended_at is not None,
+                unscored=tuple(i for i, m in enumerate(messages) if m.role == "user" and m.sentiment is None)
+            )
+            return simulation
+        except Exception as e:
+            logger.error("Error loading simulation: %s", e)
+            return None
+
+    async def list_calls(
+        self,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        status: Optional[str] = None,
+        tag: Optional[str] = None,
+        agent_id: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        min_sentiment: Optional[float] = None,
+        max_sentiment: Optional[float] = None,
+        search: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        List persisted calls, newest first, using keyset pagination.
+
+        Each page is a bounded index range scan that starts after the
+        cursor, so the cost does not grow with the size of the history.
+
+        Args:
+            limit: Maximum number of calls to return
+            cursor: Cursor returned with the previous page
+            status: Only calls with this status
+            tag: Only calls carrying this tag
+            agent_id: Only calls transferred to this agent
+            date_from: Only calls started at or after this time
+            date_to: Only calls started before this time
+            min_sentiment: Minimum sentiment score (0-100)
+            max_sentiment: Maximum sentiment score (0-100)
+            search: Simulation id prefix or exact tag name
+
+        Returns:
+            Dict with the page of calls and the cursor for the next page
+        """
+        query = select(Call).where(Call.simulation_id.isnot(None))
+        if status:
+            query = query.where(Call.status == status)
+        if agent_id:
+            query = query.where(Call.agent_id == agent_id)
+        if date_from:
+            query = query.where(Call.created_at >= date_from)
+        if date_to:
+            query = query.where(Call.created_at < date_to)
+        if min_sentiment is not None:
+            query = query.where(Call.sentiment_score >= min_sentiment)
+        if max_sentiment is not None:
+            query = query.where(Call.sentiment_score <= max_sentiment)
+        if tag:
+            query = query.where(Call.id.in_(select(Tag.call_id).where(Tag.name == tag)))
+        if search:
+            query = query.where(or_(
+                Call.simulation_id.startswith(search, autoescape=True),
+                Call.id.in_(select(Tag.call_id).where(Tag.name == search))
+            ))
+        if cursor:
+            created_at, call_id = decode_cursor(cursor)
+            query = query.where(tuple_(Call.created_at, Call.id) < tuple_(created_at, call_id))
+        query = query.order_by(Call.created_at.desc(), Call.id.desc()).limit(limit + 1)
+
+        async with self.session_factory() as session:
+            calls = (await session.scalars(query)).all()
+            has_more = len(calls) > limit
+            calls = calls[:limit]
+
+            call_ids = [call.id for call in calls]
+            tags: Dict[int, List[Dict]] = {call_id: [] for call_id in call_ids}
+            notes: Dict[int, str] = {}
+            if call_ids:
+                for t in (await session.scalars(
+                    select(Tag).where(Tag.call_id.in_(call_ids)).order_by(Tag.id)
+                )).all():
+                    tags[t.call_id].append({"name": t.name, "type": t.type})
+                # Latest note per call; ascending order lets later notes overwrite
+                for n in (await session.scalars(
+                    select(Note).where(Note.call_id.in_(call_ids)).order_by(Note.id)
+                )).all():
+                    notes[n.call_id] = n.content
+
+        next_cursor = encode_cursor(calls[-1].created_at, calls[-1].id) if has_more else None
+        return {
+            "calls": [
+                {
+                    "simulation_id": call.simulation_id,
+                    "start_time": call.created_at.isoformat(),
+                    "end_time": call.ended_at.isoformat() if call.ended_at else None,
+                    "duration": call.duration,
+                    "is_active": call.ended_at is None,
+                    "status": call.status,
+                    "agent_id": call.agent_id,
+                    "transfer_reason": call.transfer_reason,
+                    "message_count": call.message_count or 0,
+                    "quality_metrics": call.quality_metrics or {},
+                    "tags": tags[call.id],
+                    "note": notes.get(call.id),
+                }
+                for call in calls
+            ],
+            "next_cursor": next_cursor,
+        }
+
+    async def iter_calls(
+        self,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        batch_size: int = 200,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield persisted calls with their messages, notes and tags.
+
+        Calls are read in id-ordered keyset batches, and child rows are
+        fetched per batch with a streamed ``yield_per`` query, so memory
+        stays bounded by the batch size. Each batch uses its own pooled
+        session, so a slow consumer does not pin a database connection.
+
+        Args:
+            date_from: Only calls started at or after this time
+            date_to: Only calls started before this time
+            batch_size: Number of calls fetched per round trip
+
+        Yields:
+            Dict describing one call
+        """
+        last_id = 0
+        while True:
+            query = select(Call).where(Call.simulation_id.isnot(None), Call.id > last_id)
+            if date_from:
+                query = query.where(Call.created_at >= date_from)
+            if date_to:
+                query = query.where(Call.created_at < date_to)
+            query = query.order_by(Call.id).limit(batch_size)
+
+            async with self.session_factory() as session:
+                calls = (await session.scalars(query)).all()
+                if not calls:
+                    return
+                call_ids = [call.id for call in calls]
+                children: Dict[int, Dict[str, List[Dict]]] = {
+                    call_id: {"messages": [], "notes": [], "tags": []} for call_id in call_ids
+                }
+
+                messages = await session.stream_scalars(
+                    select(Message).where(Message.call_id.in_(call_ids)).order_by(Message.id),
+                    execution_options={"yield_per": 1000}
+                )
+                async for m in messages:
+                    children[m.call_id]["messages"].append(
+                        {"role": m.role, "content": m.content, "timestamp": m.created_at.isoformat()}
+                    )
+                for n in (await session.scalars(
+                    select(Note).where(Note.call_id.in_(call_ids)).order_by(Note.id)
+                )).all():
+                    children[n.call_id]["notes"].append(
+                        {"content": n.content, "timestamp": n.created_at.isoformat()}
+                    )
+                for t in (await session.scalars(
+                    select(Tag).where(Tag.call_id.in_(call_ids)).order_by(Tag.id)
+                )).all():
+                    children[t.call_id]["tags"].append(
+                        {"name": t.name, "type": t.type, "timestamp": t.created_at.isoformat()}
+                    )
+
+            for call in calls:
+                yield {
+                    "simulation_id": call.simulation_id,
+                    "start_time": call.created_at.isoformat(),
+                    "end_time": call.ended_at.isoformat() if call.ended_at else None,
+                    "duration": call.duration,
+                    "status": call.status,
+                    "agent_id": call.agent_id,
+                    "transfer_reason": call.transfer_reason,
+                    "quality_metrics": call.quality_metrics or {},
+                    **children[call.id],
+                }
+            last_id = call_ids[-1]
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get write-behind queue and throughput counters."""
+        return {
+            "dirty": len(self._dirty),
+            "tracked": len(self._persisted),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+        }
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+from app.services.speech_service import SpeechService, SAMPLE_RATE, get_whisper_model
+from app.core.logger import logger
+
+
+def _init_worker(model_name: Optional[str]) -> None:
+    # Load the model when the worker starts, not on its first request
+    get_whisper_model(model_name)
+
+
+def _transcribe_batch(model_name: Optional[str], items: List[Tuple[np.ndarray, int]]) -> List[str]:
+    speech_service = SpeechService(model=get_whisper_model(model_name))
+    return [speech_service.transcribe_array(audio, sample_rate) for audio, sample_rate in items]
+
+
+class TranscriptionService:
+    """
+    Shared Whisper worker pool for concurrent calls.
+
+    Each worker process holds one warm model. Requests from all calls go
+    through one queue; a dispatcher groups whatever arrives within
+    ``batch_window_ms`` into micro-batches of up to ``max_batch`` segments,
+    so a busy box pays one inter-process round trip per batch rather than
+    per segment. At most one batch per worker is in flight, which keeps the
+    backlog in the queue where it can be measured.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        model_name: Optional[str] = None,
+        max_batch: Optional[int] = None,
+        batch_window_ms: Optional[float] = None,
+        executor: Optional[Executor] = None,
+    ):
+        self.workers = workers or int(os.getenv("STT_WORKERS", str(os.cpu_count() or 1)))
+        self.model_name = model_name
+        self.max_batch = max_batch or int(os.getenv("STT_MAX_BATCH", "8"))
+        self.batch_window = (batch_window_ms if batch_window_ms is not None
+                             else float(os.getenv("STT_BATCH_WINDOW_MS", "20"))) / 1000
+        self.executor = executor
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._batches: set = set()
+        self._latencies: deque = deque(maxlen=1000)
+        self.processed = 0
+        self.batches = 0
+        self.errors = 0
+
+    async def start(self) -> None:
+        """Start the worker processes and the dispatcher."""
+        if self._dispatcher is not None:
+            return
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker, initargs=(self.model_name,)
+            )
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        logger.info("Started transcription pool with %s workers", self.workers)
+
+    async def stop(self) -> None:
+        """Stop dispatching, finish in-flight batches and shut the workers down."""
+        if self._dispatcher is None:
+            return
+        self._dispatcher.cancel()
+        try:
+            await self._dispatcher
+        except asyncio.CancelledError:
+            pass
+        self._dispatcher = None
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+        while not self.queue.empty():
+            self.queue.get_nowait()[2].cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = None
+
+    async def transcribe(self, audio: Union[np.ndarray, bytes], sample_rate: int = SAMPLE_RATE) -> str:
+        """
+        Queue a segment for transcription and wait for the text.
+
+        Args:
+            audio: Float samples, or 16-bit PCM bytes
+            sample_rate: Sample rate of the segment
+
+        Returns:
+            str: Transcribed text, empty on failure
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((audio, sample_rate, future, time.perf_counter()))
+        return await future
+
+    async def _dispatch(self) -> None:
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = [await self.queue.get()]
+            except asyncio.CancelledError:
+                self._slots.release()
+                raise
+            # Give concurrent calls a moment to join the batch
+            if self.queue.qsize() < self.max_batch - 1 and self.batch_window:
+                await asyncio.sleep(self.batch_window)
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: List[Tuple]) -> None:
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, _transcribe_batch, self.model_name,
+                [(audio, sample_rate) for audio, sample_rate, _, _ in batch]
+            )
+        except Exception as e:
+            logger.error("Error in transcription batch: %s", e)
+            self.errors += 1
+            results = [""] * len(batch)
+        finally:
+            self._slots.release()
+
+        done_at = time.perf_counter()
+        for (_, _, future, queued_at), text in zip(batch, results):
+            self._latencies.append(done_at - queued_at)
+            if not future.done():
+                future.set_result(text)
+        self.processed += len(batch)
+        self.batches += 1
+
+    def get_stats(self) -> Dict[str, float]:
+        """Get queue depth, batching and latency metrics."""
+        latencies = np.array(self._latencies) * 1000 if self._latencies else np.zeros(1)
+        return {
+            "queue_depth": self.queue.qsize(),
+            "in_flight_batches": len(self._batches),
+            "processed": self.processed,
+            "batches": self.batches,
+            "errors": self.errors,
+            "average_batch_size": round(self.processed / self.batches, 2) if self.batches else 0,
+            "latency_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "latency_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        }
@@ -0,0 +1,318 @@
+import asyncio
+import hashlib
+import io
+import os
+import re
+import shlex
+import struct
+import subprocess
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import soundfile as sf
+from app.core.logger import logger
+from app.core.metrics import TTS_SECONDS
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# RIFF and data sizes of a WAV stream whose length is not known up front
+_UNKNOWN_SIZE = 0xFFFFFFFF
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences so each can be synthesized and played on its own."""
+    return [s for s in (part.strip() for part in _SENTENCE_END.split(text)) if s]
+
+
+class GTTSBackend:
+    """Google Translate TTS, synthesized straight into memory."""
+
+    content_type = "audio/mpeg"
+    extension = "mp3"
+    # MP3 frames can be played back to back, so clips concatenate into one stream
+    concatenable = True
+
+    def __init__(self, lang: str = "en"):
+        self.lang = lang
+        self.name = f"gtts:{lang}"
+
+    def synthesize(self, text: str) -> bytes:
+        from gtts import gTTS
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=self.lang).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class CommandBackend:
+    """
+    Local TTS engine run as a command that reads text on stdin and writes
+    WAV audio to stdout, e.g. ``espeak-ng --stdout`` or ``piper --output_file -``.
+    """
+
+    content_type = "audio/wav"
+    extension = "wav"
+    # Each clip has its own header; players stop after the first one
+    concatenable = False
+
+    def __init__(self, command: str, timeout: float = 30.0):
+        self.command = shlex.split(command)
+        self.timeout = timeout
+        self.name = f"command:{command}"
+
+    def synthesize(self, text: str) -> bytes:
+        result = subprocess.run(
+            self.command, input=text.encode(), capture_output=True, check=True, timeout=self.timeout
+        )
+        return result.stdout
+
+
+def wav_stream_header(sample_rate: int, channels: int) -> bytes:
+    """16-bit PCM WAV header for a stream of unknown length."""
+    block_align = channels * 2
+    return (
+        b"RIFF" + struct.pack("<I", _UNKNOWN_SIZE) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, 16)
+        + b"data" + struct.pack("<I", _UNKNOWN_SIZE)
+    )
+
+
+def create_backend():
+    """Build the backend selected by TTS_BACKEND ('gtts' or 'command')."""
+    if os.getenv("TTS_BACKEND", "gtts") == "command":
+        return CommandBackend(os.getenv("TTS_COMMAND", "espeak-ng --stdout"))
+    return GTTSBackend(os.getenv("TTS_LANG", "en"))
+
+
+class AudioCache:
+    """
+    Content-addressed store for synthesized audio.
+
+    Recent clips are kept in a byte-bounded in-memory LRU; every clip is
+    also written to ``directory`` so it survives restarts and can be sent
+    straight from disk. The directory is bounded too: once it grows past
+    ``max_disk_bytes`` the least recently used files (by mtime, which
+    disk reads refresh) are deleted down to 90% of the limit.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        max_memory_bytes: Optional[int] = None,
+        max_disk_bytes: Optional[int] = None,
+    ):
+        self.directory = directory or os.getenv("TTS_CACHE_DIR", "tts_cache")
+        self.max_memory_bytes = max_memory_bytes or int(os.getenv("TTS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+        self.max_disk_bytes = max_disk_bytes or int(os.getenv("TTS_CACHE_MAX_DISK_BYTES", str(512 * 1024 * 1024)))
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        # Estimate of the directory size; None until it has been scanned
+        self._disk_bytes: Optional[int] = None
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+
+    def path(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    def get(self, key: str, extension: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+        path = self.path(key, extension)
+        if not self.touch(path):
+            return None
+        try:
+            with open(path, "rb") as audio_file:
+                data = audio_file.read()
+        except FileNotFoundError:
+            return None
+        self._remember(key, data)
+        return data
+
+    @staticmethod
+    def touch(path: str) -> bool:
+        """Mark a cached file as recently used; False if it is not on disk."""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def put(self, key: str, extension: str, data: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key, extension)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as audio_file:
+            audio_file.write(data)
+        # Atomic, so concurrent readers never see a partial file
+        os.replace(temp_path, path)
+        self._remember(key, data)
+        with self._disk_lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(data)
+            if self._disk_bytes is None or self._disk_bytes > self.max_disk_bytes:
+                self._prune()
+
+    def _prune(self) -> None:
+        """
+        Rescan the directory and delete the least recently used files.
+
+        The running size estimate only covers this process's writes, so
+        the directory is scanned again before anything is deleted; other
+        workers sharing it are accounted for then.
+        """
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        if total > self.max_disk_bytes:
+            target = self.max_disk_bytes * 0.9
+            for _, size, path in sorted(files):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evictions += 1
+            logger.info("Pruned TTS cache directory to %d bytes", total)
+        self._disk_bytes = total
+
+    def _remember(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+
+class TTSService:
+    """Cached text-to-speech on top of a pluggable synthesis backend."""
+
+    def __init__(self, backend=None, cache: Optional[AudioCache] = None):
+        self.backend = backend or create_backend()
+        self.cache = cache or AudioCache()
+        self.hits = 0
+        self.misses = 0
+
+    def cache_key(self, text: str) -> str:
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{self.backend.name}\n{normalized}".encode()).hexdigest()
+
+    def synthesize(self, text: str) -> Tuple[bytes, str]:
+        """
+        Get audio for a text, synthesizing it only on a cache miss.
+
+        Args:
+            text: Text to speak
+
+        Returns:
+            Tuple[bytes, str]: Audio data and content type
+        """
+        key = self.cache_key(text)
+        data = self.cache.get(key, self.backend.extension)
+        if data is not None:
+            self.hits += 1
+            return data, self.backend.content_type
+
+        self.misses += 1
+        with TTS_SECONDS.labels(self.backend.name).time():
+            data = self.backend.synthesize(text)
+        if data:
+            self.cache.put(key, self.backend.extension, data)
+        return data, self.backend.content_type
+
+    def synthesize_file(self, text: str) -> Tuple[str, str]:
+        """
+        Get the on-disk path of the audio for a text, for serving with FileResponse.
+
+        Returns:
+            Tuple[str, str]: Path to the cached audio file and content type
+        """
+        key = self.cache_key(text)
+        path = self.cache.path(key, self.backend.extension)
+        if self.cache.touch(path):
+            self.hits += 1
+            return path, self.backend.content_type
+        data = self.synthesize(text)[0]
+        if not data:
+            raise RuntimeError("Speech synthesis returned no audio")
+        if not os.path.exists(path):
+            # Pruned from disk while still held in memory
+            self.cache.put(key, self.backend.extension, data)
+        return path, self.backend.content_type
+
+    async def stream(self, text: str) -> AsyncIterator[bytes]:
+        """
+        Synthesize a reply sentence by sentence.
+
+        The first sentence is yielded as soon as it is ready, while the
+        next one is already being synthesized, so playback can start long
+        before the whole reply has been converted. Clips from backends
+        whose format does not concatenate (WAV) are decoded and re-encoded
+        as one open-ended 16-bit PCM WAV stream.
+
+        Yields:
+            bytes: Audio for one sentence
+        """
+        if self.backend.concatenable:
+            async for data in self._stream_clips(text):
+                yield data
+            return
+        stream_format = None
+        async for data in self._stream_clips(text):
+            try:
+                samples, sample_rate = await asyncio.to_thread(sf.read, io.BytesIO(data), dtype="int16", always_2d=True)
+            except Exception as e:
+                logger.error("Error decoding synthesized audio: %s", e)
+                continue
+            if stream_format is None:
+                stream_format = (sample_rate, samples.shape[1])
+                yield wav_stream_header(*stream_format)
+            elif (sample_rate, samples.shape[1]) != stream_format:
+                logger.error("Skipping TTS clip at %s Hz, the stream is %s Hz", sample_rate, stream_format[0])
+                continue
+            yield samples.tobytes()
+
+    async def _stream_clips(self, text: str) -> AsyncIterator[bytes]:
+        """Synthesize each sentence, the next one while the current one is sent."""
+        sentences = split_sentences(text)
+        if not sentences:
+            return
+        pending = asyncio.create_task(asyncio.to_thread(self.synthesize, sentences[0]))
+        try:
+            for index in range(len(sentences)):
+                try:
+                    data, _ = await pending
+                except Exception as e:
+                    logger.error("Error in text-to-speech conversion: %s", e)
+                    data = b""
+                if index + 1 < len(sentences):
+                    pending = asyncio.create_task(asyncio.to_thread(self.synthesize, sentences[index + 1]))
+                if data:
+                    yield data
+        finally:
+            pending.cancel()
+
+    def get_stats(self) -> Dict[str, float]:
+        """Get cache hit and memory usage counters."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0,
+            "memory_bytes": self.cache._memory_bytes,
+        }
@@ -1,27 +1,109 @@
 from twilio.rest import Client
-from twilio.twiml.voice_response import VoiceResponse, Gather
-from typing import Optional
+from twilio.http import AsyncHttpClient
+from twilio.http.response import Response as TwilioResponse
+from twilio.request_validator import RequestValidator
+from twilio.twiml.voice_response import VoiceResponse, Gather, Connect
+from typing import Dict, Mapping, Optional, Tuple
+from xml.sax.saxutils import escape
+import logging
+import os
+import httpx
+from app.core.logger import logger
+
+GREETING = "Hello! Thank you for calling. How can I help you today?"
+
+
+class HttpxTwilioClient(AsyncHttpClient):
+    """Async Twilio HTTP client backed by a pooled, keep-alive httpx client."""
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None, timeout: float = 10.0):
+        super().__init__(logger=logging.getLogger("twilio.http_client"), is_async=True, timeout=timeout)
+        self.client = client or httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=20)
+        )
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Dict[str, object]] = None,
+        data: Optional[Dict[str, object]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        auth: Optional[Tuple[str, str]] = None,
+        timeout: Optional[float] = None,
+        allow_redirects: bool = False,
+    ) -> TwilioResponse:
+        response = await self.client.request(
+            method.upper(),
+            url,
+            params=params,
+            data=data,
+            headers=headers,
+            auth=auth,
+            timeout=timeout or self.timeout,
+            follow_redirects=allow_redirects,
+        )
+        return TwilioResponse(response.status_code, response.text, response.headers)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
 
 class TwilioService:
-    def __init__(self, account_sid: str, auth_token: str, phone_number: str):
-        self.client = Client(account_sid, auth_token)
+    def __init__(
+        self,
+        account_sid: Optional[str],
+        auth_token: Optional[str],
+        phone_number: Optional[str],
+        base_url: Optional[str] = None,
+        http_client: Optional[httpx.AsyncClient] = None
+    ):
+        # Webhook URLs handed to Twilio must be absolute and publicly reachable
+        self.base_url = (base_url or os.getenv("PUBLIC_BASE_URL", "http://localhost:8000")).rstrip("/")
+        self.stream_url = f"{self.base_url.replace('http', 'ws', 1)}/api/voice/media-stream"
         self.phone_number = phone_number
-        
-    def create_twiml_response(self, message: Optional[str] = None) -> str:
+        self.http_client = HttpxTwilioClient(http_client)
+        self.client = Client(account_sid, auth_token, http_client=self.http_client) if account_sid and auth_token else None
+        self.validator = RequestValidator(auth_token) if auth_token else None
+
+        # Everything after the optional message is the same on every turn,
+        # so render it once and splice the message in per request
+        head, self._twiml_tail = self._render().split("<Response>", 1)
+        self._twiml_head = head + "<Response>"
+        self.greeting_twiml = self.create_twiml_response(GREETING)
+        self.reprompt_twiml = self.create_twiml_response()
+        self.media_stream_twiml = self._render_media_stream()
+
+    def validate_request(self, path: str, params: Mapping[str, str], signature: str, url: Optional[str] = None) -> bool:
         """
-        Create a TwiML response for Twilio.
-        
+        Check a webhook's X-Twilio-Signature.
+
+        Twilio signs the public URL it was given, so the signature is
+        checked against ``base_url`` rather than the URL the request
+        arrived on, which differs behind a proxy.
+
         Args:
-            message: Optional message to speak
-            
+            path: Request path, with the query string if any
+            params: POSTed form fields
+            signature: X-Twilio-Signature header value
+            url: Full signed URL instead of ``base_url`` and ``path``, e.g. ``stream_url``
+
         Returns:
-            str: TwiML response
+            bool: True if Twilio sent the request; always False without an auth token
         """
+        if self.validator is None:
+            logger.error("Rejecting Twilio webhook: TWILIO_AUTH_TOKEN is not set")
+            return False
+        return self.validator.validate(url or f"{self.base_url}{path}", dict(params), signature or "")
+
+    @staticmethod
+    def _render(message: Optional[str] = None) -> str:
         response = VoiceResponse()
-        
+
         if message:
             response.say(message)
-            
+
         # Gather speech input
         gather = Gather(
             input='speech',
@@ -30,33 +112,62 @@ class TwilioService:
             language='en-US',
             speechTimeout='auto'
         )
-        
+
         gather.say("Please speak after the tone.")
         response.append(gather)
-        
+
         # Add a fallback message
         response.say("I didn't catch that. Please try again.")
         response.redirect('/api/voice/handle-call')
-        
+
+        return str(response)
+
+    def _render_media_stream(self) -> str:
+        # Hand the call's audio to our Media Streams WebSocket
+        response = VoiceResponse()
+        connect = Connect()
+        connect.stream(url=self.stream_url)
+        response.append(connect)
         return str(response)
-        
-    def make_call(self, to_number: str) -> str:
+
+    def create_twiml_response(self, message: Optional[str] = None) -> str:
+        """
+        Create a TwiML response for Twilio.
+
+        Args:
+            message: Optional message to speak
+
+        Returns:
+            str: TwiML response
+        """
+        if not message:
+            return self._twiml_head + self._twiml_tail
+        return f"{self._twiml_head}<Say>{escape(message)}</Say>{self._twiml_tail}"
+
+    async def make_call(self, to_number: str) -> str:
         """
         Initiate a call to a phone number.
-        
+
         Args:
             to_number: The phone number to call
-            
+
         Returns:
             str: Call SID
         """
         try:
-            call = self.client.calls.create(
+            if not self.client:
+                raise RuntimeError("Twilio credentials are not configured")
+            call = await self.client.calls.create_async(
                 to=to_number,
                 from_=self.phone_number,
-                url='http://your-domain.com/api/voice/handle-call'  # Replace with your domain
+                url=f"{self.base_url}/api/voice/handle-call",
+                status_callback=f"{self.base_url}/api/voice/status"
             )
             return call.sid
         except Exception as e:
-            print(f"Error making call: {str(e)}")
-            return "" 
\ No newline at end of file
+            logger.error("Error making call: %s", e)
+            return ""
+
+    async def aclose(self) -> None:
+        """Close pooled HTTP connections."""
+        await self.http_client.aclose()
@@ -0,0 +1,87 @@
+import os
+from typing import Optional
+from app.services.simulation_service import SimulationService
+from app.services.twilio_service import TwilioService
+from app.core.logger import logger
+
+# Twilio CallStatus values after which the call is over
+TERMINAL_CALL_STATUSES = {"completed", "busy", "failed", "no-answer", "canceled"}
+
+
+class VoiceService:
+    """
+    Drive phone calls through the simulation conversation loop.
+
+    Each call is a simulation keyed by its Twilio CallSid, so history,
+    persistence, sentiment and analytics work exactly as for simulated
+    calls. Replies are returned as TwiML built from precomputed fragments.
+    """
+
+    def __init__(
+        self,
+        simulation_service: SimulationService,
+        twilio_service: TwilioService,
+        llm_timeout: Optional[float] = None,
+        media_streams: Optional[bool] = None
+    ):
+        self.simulation_service = simulation_service
+        self.twilio_service = twilio_service
+        # Stream call audio over a WebSocket instead of Gather turn-taking
+        self.media_streams = (media_streams if media_streams is not None
+                              else os.getenv("VOICE_MEDIA_STREAMS", "false").lower() == "true")
+        # Twilio abandons a webhook after 15 seconds, so answer well before that
+        self.llm_timeout = llm_timeout or float(os.getenv("VOICE_LLM_TIMEOUT", "8"))
+
+    async def handle_call(self, call_sid: str) -> str:
+        """
+        Answer a call, greeting the caller only on the first request.
+
+        Twilio redirects back here whenever a Gather times out. With
+        media streams enabled the call is connected to the WebSocket,
+        which greets the caller itself.
+
+        Returns:
+            str: TwiML response
+        """
+        if self.media_streams:
+            return self.twilio_service.media_stream_twiml
+        if await self.simulation_service.ensure_simulation(call_sid):
+            logger.info("Answered call %s", call_sid)
+            return self.twilio_service.greeting_twiml
+        return self.twilio_service.reprompt_twiml
+
+    async def process_speech(self, call_sid: str, speech: str) -> Optional[str]:
+        """
+        Reply to a caller's transcribed speech.
+
+        Args:
+            call_sid: Twilio CallSid
+            speech: Twilio's SpeechResult
+
+        Returns:
+            str: TwiML response, or None if the call has already ended
+        """
+        speech = speech.strip()
+        if not speech:
+            return self.twilio_service.reprompt_twiml
+
+        await self.simulation_service.ensure_simulation(call_sid)
+        response = await self.simulation_service.process_message(call_sid, speech, timeout=self.llm_timeout)
+        if response is None:
+            return None
+        return self.twilio_service.create_twiml_response(response)
+
+    async def handle_status(self, call_sid: str, call_status: str) -> bool:
+        """
+        End the call's simulation once Twilio reports it finished.
+
+        Calls that never connected (busy, no-answer) are recorded too.
+
+        Returns:
+            bool: True if the simulation was ended
+        """
+        if call_status not in TERMINAL_CALL_STATUSES:
+            return False
+        await self.simulation_service.ensure_simulation(call_sid)
+        async with self.simulation_service.session(call_sid):
+            return self.simulation_service.end_simulation(call_sid, reason=call_status)
@@ -0,0 +1 @@
+# Load tests and micro-benchmarks, run with python -m benchmarks.simulation_benchmark
@@ -0,0 +1,465 @@
+"""
+Reproducible load test and micro-benchmarks for the simulation API.
+
+The load test drives /api/simulate/start, /message and /end in-process
+through an ASGI transport, with the LLM replaced by a stub of fixed
+latency, so results measure this application rather than the network or
+the model provider. Results are written as JSON and can be compared
+against a previous run to catch regressions between releases:
+
+    python -m benchmarks.simulation_benchmark --calls 200 --concurrency 50 \\
+        --output results.json --baseline previous.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+import httpx
+import numpy as np
+from app.services.llm_service import LLMService
+
+MESSAGES = [
+    "Hi, I was charged twice for my last order.",
+    "The order number is 48213.",
+    "Can you refund the duplicate charge?",
+    "Thanks, that is really helpful!",
+]
+
+# Metrics checked against a baseline: name -> True if higher is better
+REGRESSION_METRICS = {
+    "throughput_rps": True,
+    "latency_ms.message.p95": False,
+    "latency_ms.message.p99": False,
+    "loop_lag_ms.p99": False,
+}
+
+
+class StubLLMService:
+    """Stands in for LLMService with a fixed, slightly jittered latency."""
+
+    format_conversation_history = LLMService.format_conversation_history
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.1, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def _delay(self) -> float:
+        return self.latency * (1 + self.random.uniform(-self.jitter, self.jitter))
+
+    async def get_response_async(self, messages, max_tokens: int = 150, timeout: Optional[float] = None) -> str:
+        self.calls += 1
+        await asyncio.sleep(self._delay())
+        return f"Thanks for letting me know. I can help with: {messages[-1]['content']}"
+
+    async def stream_response(self, messages, max_tokens: int = 150):
+        self.calls += 1
+        await asyncio.sleep(self._delay())
+        for word in f"Thanks for letting me know. I can help with: {messages[-1]['content']}".split(" "):
+            yield word + " "
+
+    async def aclose(self) -> None:
+        pass
+
+
+class LoopLagMonitor:
+    """Measure how late the event loop wakes a task that sleeps on a fixed interval."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - expected))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> List[float]:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        return self.lags
+
+
+def summarize(values_ms: Sequence[float]) -> Dict[str, float]:
+    """Count, mean, p50/p95/p99 and max of a list of milliseconds."""
+    if not len(values_ms):
+        return {"count": 0}
+    values = np.asarray(values_ms, dtype=float)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": len(values),
+        "mean": round(float(values.mean()), 3),
+        "p50": round(float(p50), 3),
+        "p95": round(float(p95), 3),
+        "p99": round(float(p99), 3),
+        "max": round(float(values.max()), 3),
+    }
+
+
+def rss_bytes() -> int:
+    """Current resident set size, falling back to the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+async def run_load(
+    app,
+    calls: int = 200,
+    concurrency: int = 50,
+    messages_per_call: int = 3,
+    stream: bool = False,
+) -> Dict:
+    """
+    Drive whole simulated calls through the API at a fixed concurrency.
+
+    Args:
+        app: ASGI application exposing the /api/simulate endpoints
+        calls: Number of calls to simulate
+        concurrency: Calls in flight at once
+        messages_per_call: Caller messages per call
+        stream: Use the streaming message endpoint
+
+    Returns:
+        Dict with throughput, per-endpoint latency, event-loop lag and RSS
+    """
+    latencies: Dict[str, List[float]] = {"start": [], "message": [], "end": []}
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    message_path = "/api/simulate/message/stream" if stream else "/api/simulate/message"
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def timed(endpoint: str, path: str, payload: Optional[Dict] = None) -> Optional[httpx.Response]:
+            nonlocal errors
+            started = time.perf_counter()
+            response = await client.post(path, json=payload)
+            latencies[endpoint].append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                errors += 1
+                return None
+            return response
+
+        async def call(index: int) -> None:
+            async with semaphore:
+                response = await timed("start", "/api/simulate/start")
+                if response is None:
+                    return
+                simulation_id = response.json()["simulation_id"]
+                for turn in range(messages_per_call):
+                    # Vary the text so the response cache does not serve every turn
+                    message = f"{MESSAGES[turn % len(MESSAGES)]} (call {index})"
+                    await timed("message", message_path, {"simulation_id": simulation_id, "message": message})
+                await timed("end", "/api/simulate/end", {"simulation_id": simulation_id})
+
+        # Warm up imports, connection setup and the database before measuring
+        await call(-1)
+        for values in latencies.values():
+            values.clear()
+
+        monitor = LoopLagMonitor()
+        rss_before = rss_bytes()
+        monitor.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(call(index) for index in range(calls)))
+        elapsed = time.perf_counter() - started
+        lags = await monitor.stop()
+        rss_after = rss_bytes()
+
+    requests = sum(len(values) for values in latencies.values())
+    return {
+        "calls": calls,
+        "concurrency": concurrency,
+        "messages_per_call": messages_per_call,
+        "stream": stream,
+        "requests": requests,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2),
+        "calls_per_second": round(calls / elapsed, 2),
+        "latency_ms": {endpoint: summarize(values) for endpoint, values in latencies.items()},
+        "loop_lag_ms": summarize([lag * 1000 for lag in lags]),
+        "rss_bytes": {"before": rss_before, "after": rss_after, "growth": rss_after - rss_before},
+    }
+
+
+def _time_per_call(function, number: int) -> float:
+    """Best-of-five microseconds per call."""
+    return round(min(timeit.repeat(function, number=number, repeat=5)) / number * 1e6, 3)
+
+
+def run_micro(number: int = 1000) -> Dict[str, Dict]:
+    """
+    Time hot helpers in isolation.
+
+    Returns:
+        Dict of benchmark name -> microseconds per call
+    """
+    from app.services.sentiment_service import SentimentService
+    from app.services.simulation_service import CallSimulation, SimulationService
+    from app.services.twilio_service import TwilioService, GREETING
+
+    results: Dict[str, Dict] = {}
+
+    analyzer = SentimentService().analyzer
+    sentiment_service = SentimentService(analyzer=analyzer)
+    texts = [f"{MESSAGES[i % len(MESSAGES)]} #{i}" for i in range(number)]
+    # Every text is unseen the first time, then served from the memo
+    cold = timeit.timeit(lambda: sentiment_service.analyze_batch(texts), number=1)
+    warm = min(timeit.repeat(lambda: sentiment_service.analyze_batch(texts), number=1, repeat=5))
+    results["sentiment"] = {
+        "analyzer": type(analyzer).__name__ if analyzer else None,
+        "cold_batch_us_per_text": round(cold / number * 1e6, 3),
+        "warm_batch_us_per_text": round(warm / number * 1e6, 3),
+        "analyze_text_us": _time_per_call(lambda: sentiment_service.analyze_text(texts[0]), number),
+    }
+
+    simulation_service = SimulationService(StubLLMService())
+    simulation = CallSimulation("bench")
+    results["update_quality_metrics"] = {
+        "us_per_call": _time_per_call(lambda: simulation_service._update_quality_metrics(simulation), number),
+    }
+
+    twilio_service = TwilioService(None, None, None)
+    results["twiml"] = {
+        "precomputed_us": _time_per_call(lambda: twilio_service.create_twiml_response(GREETING), number),
+        "voice_response_us": _time_per_call(lambda: TwilioService._render(GREETING), number),
+    }
+
+    results["auth"] = _run_auth(number)
+    return results
+
+
+def _run_auth(number: int) -> Dict[str, float]:
+    """Per-request cost of resolving a bearer token, with and without the verified-token cache."""
+    from app.core import auth
+
+    saved = auth.user_store, auth.token_cache
+    auth.user_store, auth.token_cache = auth.UserStore(), auth.TokenCache()
+    try:
+        auth.user_store.add("benchmark", "unused-hash")
+        token = auth.create_access_token({"sub": "benchmark"})
+
+        def verify():
+            auth.token_cache.clear()
+            auth.resolve_token(token)
+
+        return {
+            "jwt_verify_us": _time_per_call(verify, number),
+            "cached_us": _time_per_call(lambda: auth.resolve_token(token), number),
+        }
+    finally:
+        auth.user_store, auth.token_cache = saved
+
+
+class _DictCallSimulation:
+    """The earlier representation of a call, kept only to measure against."""
+
+    def __init__(self, simulation_id: str):
+        self.simulation_id = simulation_id
+        self.start_time = datetime.utcnow()
+        self.end_time = None
+        self.messages: List[Dict] = []
+        self.is_active = True
+        self.is_recording = False
+        self.transferred_to = None
+        self.transfer_reason = None
+        self.notes: List[Dict] = []
+        self.tags: List[Dict] = []
+        self.status = "in-progress"
+        self.last_activity = time.monotonic()
+        self.version = 0
+        self.quality_metrics = {
+            "latency": 0, "packet_loss": 0, "jitter": 0, "quality_score": 100,
+            "sentiment_score": 50, "sentiment_trend": [], "resolution_time": 0,
+        }
+
+
+def _build_dict_call(index: int, messages: int) -> _DictCallSimulation:
+    simulation = _DictCallSimulation(f"call-{index}")
+    for turn in range(messages):
+        simulation.messages.append({
+            "role": "user" if turn % 2 == 0 else "assistant",
+            "content": f"{MESSAGES[turn % len(MESSAGES)]} #{index}",
+            "timestamp": datetime.utcnow().isoformat(),
+        })
+        simulation.quality_metrics["sentiment_trend"] = simulation.quality_metrics["sentiment_trend"] + [50.0]
+    simulation.notes.append({"content": f"note #{index}", "timestamp": datetime.utcnow().isoformat()})
+    simulation.tags.append({"name": "billing", "type": "default", "timestamp": datetime.utcnow().isoformat()})
+    return simulation
+
+
+def _build_record_call(index: int, messages: int):
+    from app.models.call import CallSimulation, MessageRecord, NoteRecord, TagRecord
+
+    simulation = CallSimulation(f"call-{index}")
+    for turn in range(messages):
+        simulation.messages.append(MessageRecord(
+            "user" if turn % 2 == 0 else "assistant", f"{MESSAGES[turn % len(MESSAGES)]} #{index}", time.time()
+        ))
+        simulation.quality_metrics.sentiment_trend.append(50.0)
+    simulation.notes.append(NoteRecord(f"note #{index}", time.time()))
+    simulation.tags.append(TagRecord("billing", "default", time.time()))
+    return simulation
+
+
+def _bytes_per_call(build, calls: int, messages: int) -> int:
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        held = [build(index, messages) for index in range(calls)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del held
+    return round((after - before) / calls)
+
+
+def run_memory(calls: int = 1000, messages: int = 20) -> Dict[str, int]:
+    """
+    Measure the memory held per live call, with dict records and with slotted records.
+
+    Each call gets ``messages`` messages, one note and one tag; message
+    text is generated per call so both layouts pay for their own strings.
+    """
+    dicts = _bytes_per_call(_build_dict_call, calls, messages)
+    records = _bytes_per_call(_build_record_call, calls, messages)
+    return {
+        "messages_per_call": messages,
+        "dict_bytes_per_call": dicts,
+        "record_bytes_per_call": records,
+        "saving": round(1 - records / dicts, 3),
+    }
+
+
+def _lookup(results: Dict, dotted: str) -> Optional[float]:
+    value = results
+    for key in dotted.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float = 0.2) -> List[str]:
+    """
+    Find load metrics that got worse than the baseline by more than ``tolerance``.
+
+    Returns:
+        List of human-readable regression descriptions
+    """
+    regressions = []
+    for metric, higher_is_better in REGRESSION_METRICS.items():
+        current = _lookup(results.get("load", {}), metric)
+        previous = _lookup(baseline.get("load", {}), metric)
+        if not current or not previous:
+            continue
+        change = (current - previous) / previous
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{metric}: {previous} -> {current} ({change:+.1%})")
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _benchmark_app(args) -> Dict:
+    # Configure before app.main is imported: a throwaway database, and no
+    # response cache unless asked for, so every turn reaches the stub LLM
+    database = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    database.close()
+    os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{database.name}")
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    os.environ["RESPONSE_CACHE_ENABLED"] = "true" if args.cache else "false"
+
+    from app import main
+
+    stub = StubLLMService(latency=args.llm_latency_ms / 1000, seed=args.seed)
+    main.services.register("llm_service", lambda services: stub)
+    try:
+        async with main.app.router.lifespan_context(main.app):
+            return await run_load(main.app, args.calls, args.concurrency, args.messages, args.stream)
+    finally:
+        os.unlink(database.name)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the call simulation API")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=3, help="Caller messages per call")
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--stream", action="store_true", help="Use the streaming message endpoint")
+    parser.add_argument("--cache", action="store_true", help="Leave the response cache enabled")
+    parser.add_argument("--micro-iterations", type=int, default=1000)
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--skip-memory", action="store_true")
+    parser.add_argument("--memory-calls", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Previous results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    results = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        }
+    }
+    if not args.skip_load:
+        results["load"] = asyncio.run(_benchmark_app(args))
+    if not args.skip_micro:
+        results["micro"] = run_micro(args.micro_iterations)
+    if not args.skip_memory:
+        results["memory"] = run_memory(args.memory_calls, max(args.messages * 2, 1))
+
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+    print(json.dumps({key: value for key, value in results.items() if key != "meta"}, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
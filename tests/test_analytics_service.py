@@ -0,0 +1,171 @@
+from datetime import datetime, timedelta
+import asyncio
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, func
+from app.models.database import init_async_db, create_tables, CallRollup
+from app.services import analytics_service as analytics_module
+from app.services.analytics_service import AnalyticsService, bucket_start, sentiment_label
+from app.services.simulation_service import SimulationService
+from app.services.storage_service import SimulationStore
+
+
+class StubLLMService:
+    async def get_response_async(self, messages, max_tokens=150, timeout=None):
+        return "Thank you, happy to help"
+
+    def format_conversation_history(self, messages):
+        return [{"role": "system", "content": "system prompt"}] + messages
+
+
+@pytest_asyncio.fixture
+async def session_factory(tmp_path):
+    engine, session_factory = init_async_db(f"sqlite+aiosqlite:///{tmp_path}/test.db")
+    await create_tables(engine)
+    yield session_factory
+    await engine.dispose()
+
+
+@pytest.fixture
+def store(session_factory):
+    return SimulationStore(session_factory, flush_interval=60)
+
+
+@pytest.fixture
+def simulation_service(store):
+    return SimulationService(StubLLMService(), store=store)
+
+
+@pytest.fixture
+def analytics_service(session_factory):
+    return AnalyticsService(session_factory, cache_ttl=0)
+
+
+def start_call(simulation_service, simulation_id, start_time):
+    simulation_service.start_simulation(simulation_id)
+    simulation = simulation_service.active_simulations[simulation_id]
+    simulation.start_time = start_time
+    return simulation
+
+
+def test_sentiment_label():
+    assert sentiment_label(80) == "positive"
+    assert sentiment_label(50) == "neutral"
+    assert sentiment_label(10) == "negative"
+    assert sentiment_label(None) == "negative"
+
+
+def test_bucket_start():
+    timestamp = datetime(2024, 1, 1, 13, 45, 30, 120)
+    assert bucket_start(timestamp, "minute") == datetime(2024, 1, 1, 13, 45)
+    assert bucket_start(timestamp, "hour") == datetime(2024, 1, 1, 13)
+    assert bucket_start(timestamp, "day") == datetime(2024, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_rollups_updated_when_calls_end(simulation_service, store, analytics_service):
+    # Mid-hour, so calls started five minutes earlier fall in the same hour bucket
+    now = datetime.utcnow().replace(minute=30)
+    for i in range(3):
+        start_call(simulation_service, f"sim-{i}", now - timedelta(minutes=5))
+        await simulation_service.process_message(f"sim-{i}", "thank you, great help")
+    simulation_service.transfer_call("sim-0", "agent1", "billing")
+    await store.flush()
+
+    # Nothing is rolled up until a call ends
+    dashboard = await analytics_service.get_dashboard(now=now)
+    assert dashboard["stats"]["total_calls"] == 0
+
+    for i in range(3):
+        simulation_service.end_simulation(f"sim-{i}")
+    await store.flush()
+    # Later flushes of an ended call must not count it again
+    simulation_service.add_note("sim-1", "follow up")
+    await store.flush()
+
+    dashboard = await analytics_service.get_dashboard(now=now)
+    assert dashboard["stats"]["total_calls"] == 3
+    assert dashboard["stats"]["total_messages"] == 6
+    assert dashboard["stats"]["transfer_rate"] == round(1 / 3, 4)
+    assert sum(dashboard["sentiment"].values()) == 3
+    assert dashboard["calls_over_time"]["values"][-1] == 3
+    assert len(dashboard["calls_over_time"]["labels"]) == 24
+
+
+@pytest.mark.asyncio
+async def test_rollup_buckets(simulation_service, store, analytics_service, session_factory):
+    for i, start_time in enumerate([
+        datetime(2024, 1, 1, 9, 0), datetime(2024, 1, 1, 9, 0, 30),
+        datetime(2024, 1, 1, 9, 30), datetime(2024, 1, 2, 9, 0),
+    ]):
+        start_call(simulation_service, f"sim-{i}", start_time)
+        simulation_service.end_simulation(f"sim-{i}")
+    await store.flush()
+
+    minutes = await analytics_service.get_timeseries("minute")
+    assert [(m["bucket_start"], m["call_count"]) for m in minutes] == [
+        ("2024-01-01T09:00:00", 2), ("2024-01-01T09:30:00", 1), ("2024-01-02T09:00:00", 1)
+    ]
+    hours = await analytics_service.get_timeseries("hour", since=datetime(2024, 1, 1, 12))
+    assert [h["call_count"] for h in hours] == [1]
+    days = await analytics_service.get_timeseries("day")
+    assert [d["call_count"] for d in days] == [3, 1]
+
+    async with session_factory() as session:
+        assert await session.scalar(select(func.count()).select_from(CallRollup)) == 7
+
+    with pytest.raises(ValueError):
+        await analytics_service.get_timeseries("week")
+
+
+@pytest.mark.asyncio
+async def test_restarted_store_does_not_double_count(simulation_service, store, session_factory, analytics_service):
+    start_call(simulation_service, "sim-1", datetime(2024, 1, 1))
+    simulation_service.end_simulation("sim-1")
+    await store.flush()
+
+    restarted = SimulationService(StubLLMService(), store=SimulationStore(session_factory))
+    # Loading the ended call restores its rolled-up state
+    assert await restarted.process_message("sim-1", "hello?") is None
+    assert restarted.add_note("sim-1", "reviewed")
+    assert await restarted.store.flush() == 1
+
+    days = await analytics_service.get_timeseries("day")
+    assert days[0]["call_count"] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("upsert", [True, False])
+async def test_concurrent_calls_share_new_bucket(session_factory, analytics_service, monkeypatch, upsert):
+    if not upsert:
+        # Dialects without ON CONFLICT retry the update after a failed insert
+        monkeypatch.setattr(analytics_module, "UPSERT_DIALECTS", {})
+    now = datetime(2024, 1, 1, 12, 30)
+    values = {"created_at": now, "duration": 10, "message_count": 2, "sentiment_score": 80}
+
+    async def end_call():
+        async with session_factory() as session:
+            async with session.begin():
+                await AnalyticsService.record_call(session, values)
+
+    await asyncio.gather(*(end_call() for _ in range(4)))
+
+    buckets = await analytics_service.get_timeseries("minute", since=now)
+    assert len(buckets) == 1
+    assert buckets[0]["call_count"] == 4
+    assert buckets[0]["total_duration"] == 40
+    assert buckets[0]["positive_count"] == 4
+
+
+@pytest.mark.asyncio
+async def test_dashboard_is_cached(simulation_service, store, session_factory):
+    analytics_service = AnalyticsService(session_factory, cache_ttl=60)
+    assert (await analytics_service.get_dashboard())["stats"]["total_calls"] == 0
+
+    start_call(simulation_service, "sim-1", datetime.utcnow())
+    simulation_service.end_simulation("sim-1")
+    await store.flush()
+
+    assert (await analytics_service.get_dashboard())["stats"]["total_calls"] == 0
+    analytics_service._cache.clear()
+    assert (await analytics_service.get_dashboard())["stats"]["total_calls"] == 1
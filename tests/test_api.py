@@ -1,6 +1,9 @@
 import pytest
+from fastapi import WebSocketDisconnect
 from fastapi.testclient import TestClient
-from app.main import app
+from twilio.request_validator import RequestValidator
+from app.main import app, services
+from app.core import auth
 import json
 from datetime import datetime
 
@@ -54,28 +57,96 @@ def test_make_call_authorized(auth_headers):
     )
     assert response.status_code in [200, 500]  # 500 if Twilio credentials are not set
 
-def test_handle_call():
+@pytest.fixture
+def twilio_signature(monkeypatch):
+    # Sign webhooks as Twilio would, with a known auth token
+    validator = RequestValidator("test-auth-token")
+    monkeypatch.setattr(services.twilio_service, "validator", validator)
+
+    def sign(path, data):
+        return {"X-Twilio-Signature": validator.compute_signature(services.twilio_service.base_url + path, data)}
+    return sign
+
+def test_handle_call(twilio_signature):
+    data = {
+        "CallSid": "test_call_123",
+        "From": "+1234567890",
+        "To": "+0987654321"
+    }
     response = client.post(
         "/api/voice/handle-call",
-        data={
-            "CallSid": "test_call_123",
-            "From": "+1234567890",
-            "To": "+0987654321"
-        }
+        data=data,
+        headers=twilio_signature("/api/voice/handle-call", data)
     )
     assert response.status_code == 200
     assert response.headers["content-type"] == "application/xml"
     assert "<Response>" in response.text
 
-def test_process_speech():
+def test_process_speech(twilio_signature):
+    data = {
+        "CallSid": "test_call_123",
+        "SpeechResult": "This is a test message"
+    }
     response = client.post(
         "/api/voice/process-speech",
-        data={
-            "CallSid": "test_call_123",
-            "SpeechResult": "This is a test message"
-        }
+        data=data,
+        headers=twilio_signature("/api/voice/process-speech", data)
     )
     assert response.status_code in [200, 404]  # 404 if call not found
     if response.status_code == 200:
         assert response.headers["content-type"] == "application/xml"
-        assert "<Response>" in response.text 
\ No newline at end of file
+        assert "<Response>" in response.text 
+
+def test_forged_webhook_is_rejected(twilio_signature):
+    data = {"CallSid": "test_call_123", "CallStatus": "completed"}
+    headers = twilio_signature("/api/voice/status", data)
+    forged = {**data, "CallSid": "someone_elses_call"}
+    for path in ["/api/voice/handle-call", "/api/voice/process-speech", "/api/voice/status"]:
+        assert client.post(path, data=forged, headers=headers).status_code == 403
+        assert client.post(path, data=data).status_code == 403
+    assert client.post("/api/voice/status", data=data, headers=headers).status_code == 204
+
+def test_unsigned_media_stream_is_rejected(twilio_signature):
+    for headers in [{}, {"X-Twilio-Signature": "forged"}]:
+        with pytest.raises(WebSocketDisconnect) as error:
+            with client.websocket_connect("/api/voice/media-stream", headers=headers):
+                pass
+        assert error.value.code == 1008
+
+@pytest.fixture
+def token_headers(monkeypatch):
+    # A known user with a freshly minted token, independent of the login env vars
+    store = auth.UserStore()
+    store.add("history-viewer", "unused-hash")
+    monkeypatch.setattr(auth, "user_store", store)
+    return {"Authorization": f"Bearer {auth.create_access_token({'sub': 'history-viewer'})}"}
+
+def test_call_listing_requires_auth(token_headers):
+    assert client.get("/api/calls").status_code == 401
+    assert client.post("/api/calls/filter", json={}).status_code == 401
+
+    with client:
+        response = client.get("/api/calls?limit=5", headers=token_headers)
+        assert response.status_code == 200
+        assert "calls" in response.json()
+        response = client.post("/api/calls/filter", json={"date_filter": "all"}, headers=token_headers)
+        assert response.status_code == 200
+
+
+def test_call_details_require_auth(token_headers):
+    assert client.get("/api/simulate/unknown-call/details").status_code == 401
+
+    with client:
+        response = client.get("/api/simulate/unknown-call/details", headers=token_headers)
+        assert response.status_code == 404
+
+def test_tts_requires_auth():
+    assert client.get("/api/tts?text=hello").status_code == 401
+
+def test_call_export_requires_auth(token_headers):
+    assert client.get("/api/calls/export").status_code == 401
+
+    with client:
+        response = client.get("/api/calls/export", headers=token_headers)
+        assert response.status_code == 200
+        assert response.headers["content-disposition"].startswith("attachment")
@@ -0,0 +1,71 @@
+import time
+from datetime import timedelta
+import pytest
+from fastapi import HTTPException
+from app.core import auth
+from app.core.auth import UserStore, TokenCache, User, create_access_token, get_password_hash, resolve_token
+
+
+@pytest.fixture
+def users(monkeypatch):
+    store = UserStore({"admin": get_password_hash("s3cret")})
+    monkeypatch.setattr(auth, "user_store", store)
+    monkeypatch.setattr(auth, "token_cache", TokenCache(max_size=2))
+    return store
+
+
+def test_authenticate_checks_the_password_hash(users):
+    assert users.authenticate("admin", "s3cret").username == "admin"
+    assert users.authenticate("admin", "wrong") is None
+    assert users.authenticate("nobody", "s3cret") is None
+
+
+def test_plain_password_from_env_is_hashed_on_first_login(monkeypatch):
+    monkeypatch.setenv("API_USERNAME", "admin")
+    monkeypatch.delenv("API_PASSWORD_HASH", raising=False)
+    monkeypatch.setenv("API_PASSWORD", "s3cret")
+    store = UserStore.from_env()
+    assert store._users["admin"][1] is None
+    assert store.authenticate("admin", "wrong") is None
+    assert store.authenticate("admin", "s3cret").username == "admin"
+    assert store._users["admin"][1] not in (None, "s3cret")
+
+
+def test_token_resolves_before_any_login(monkeypatch):
+    # A fresh worker, or one restarted since the token was issued
+    monkeypatch.setenv("API_USERNAME", "admin")
+    monkeypatch.delenv("API_PASSWORD_HASH", raising=False)
+    monkeypatch.setenv("API_PASSWORD", "s3cret")
+    monkeypatch.setattr(auth, "user_store", UserStore.from_env())
+    monkeypatch.setattr(auth, "token_cache", TokenCache())
+    assert resolve_token(create_access_token({"sub": "admin"})).username == "admin"
+
+
+def test_verified_tokens_are_cached(users):
+    token = create_access_token({"sub": "admin"})
+    user = resolve_token(token)
+    assert resolve_token(token) is user
+    assert (auth.token_cache.hits, auth.token_cache.misses) == (1, 1)
+
+
+def test_invalid_tokens_are_rejected(users):
+    for token in ["not-a-jwt", create_access_token({"sub": "nobody"}),
+                  create_access_token({"sub": "admin"}, expires_delta=timedelta(seconds=-1))]:
+        with pytest.raises(HTTPException) as error:
+            resolve_token(token)
+        assert error.value.status_code == 401
+
+
+def test_token_cache_is_bounded_and_honours_expiry():
+    cache = TokenCache(max_size=2)
+    user = User(username="admin")
+    cache.put("a", user, time.time() + 60)
+    cache.put("b", user, time.time() + 60)
+    cache.get("a")
+    cache.put("c", user, time.time() + 60)
+    # "b" was least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") is user
+
+    cache.put("old", user, time.time() - 1)
+    assert cache.get("old") is None
@@ -0,0 +1,87 @@
+import asyncio
+import time
+import uuid
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from benchmarks.simulation_benchmark import (
+    StubLLMService, LoopLagMonitor, summarize, compare, run_load, run_micro, run_memory
+)
+from app.services.simulation_service import SimulationService
+
+
+@pytest.fixture
+def app():
+    simulation_service = SimulationService(StubLLMService(latency=0.001))
+    app = FastAPI()
+
+    @app.post("/api/simulate/start")
+    async def start():
+        simulation_id = str(uuid.uuid4())
+        simulation_service.start_simulation(simulation_id)
+        return {"simulation_id": simulation_id}
+
+    @app.post("/api/simulate/message")
+    async def message(request: Request):
+        data = await request.json()
+        response = await simulation_service.process_message(data["simulation_id"], data["message"])
+        if not response:
+            raise HTTPException(status_code=404)
+        return {"response": response}
+
+    @app.post("/api/simulate/end")
+    async def end(request: Request):
+        data = await request.json()
+        simulation_service.end_simulation(data["simulation_id"])
+        return {"status": "success"}
+
+    return app
+
+
+def test_summarize():
+    stats = summarize(list(range(1, 101)))
+    assert stats["count"] == 100
+    assert stats["p50"] == 50.5
+    assert stats["p99"] == 99.01
+    assert stats["max"] == 100
+    assert summarize([]) == {"count": 0}
+
+
+def test_compare_flags_regressions():
+    baseline = {"load": {"throughput_rps": 1000, "latency_ms": {"message": {"p95": 50, "p99": 60}}}}
+    results = {"load": {"throughput_rps": 700, "latency_ms": {"message": {"p95": 55, "p99": 90}}}}
+    regressions = compare(results, baseline, tolerance=0.2)
+    assert [r.split(":")[0] for r in regressions] == ["throughput_rps", "latency_ms.message.p99"]
+    assert compare(baseline, baseline) == []
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_sees_blocking_call():
+    monitor = LoopLagMonitor(interval=0.005)
+    monitor.start()
+    await asyncio.sleep(0.02)
+    time.sleep(0.05)
+    await asyncio.sleep(0.02)
+    assert max(await monitor.stop()) >= 0.04
+
+
+@pytest.mark.asyncio
+async def test_run_load(app):
+    results = await run_load(app, calls=10, concurrency=4, messages_per_call=2)
+    assert results["errors"] == 0
+    assert results["requests"] == 40
+    assert results["latency_ms"]["message"]["count"] == 20
+    assert results["latency_ms"]["start"]["p99"] >= results["latency_ms"]["start"]["p50"]
+    assert results["throughput_rps"] > 0
+    assert set(results["rss_bytes"]) == {"before", "after", "growth"}
+
+
+def test_run_micro():
+    results = run_micro(number=10)
+    assert set(results) == {"sentiment", "update_quality_metrics", "twiml", "auth"}
+    assert results["twiml"]["precomputed_us"] > 0
+    assert 0 < results["auth"]["cached_us"] < results["auth"]["jwt_verify_us"]
+
+
+def test_run_memory():
+    results = run_memory(calls=200, messages=10)
+    assert 0 < results["record_bytes_per_call"] < results["dict_bytes_per_call"]
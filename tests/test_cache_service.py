@@ -0,0 +1,133 @@
+import pytest
+from app.services.cache_service import (
+    ResponseCache,
+    InMemoryCacheBackend,
+    RedisCacheBackend,
+    normalize_text,
+)
+from app.services.llm_service import FALLBACK_RESPONSE
+from app.services.context_service import SUMMARY_PREFIX, OMITTED_NOTE
+
+SYSTEM = {"role": "system", "content": "system prompt"}
+
+
+class FakeRedis:
+    """Minimal async stand-in for a Redis client."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value.encode()
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+
+def bag_of_words(text):
+    vocabulary = ["hours", "open", "opening", "time", "password", "reset", "what", "are", "your"]
+    words = text.split()
+    return [float(words.count(word)) for word in vocabulary]
+
+
+def turn(text):
+    return [SYSTEM, {"role": "user", "content": text}]
+
+
+def test_normalize_text():
+    assert normalize_text("  What ARE your hours?! ") == "what are your hours"
+
+
+@pytest.mark.asyncio
+async def test_exact_hit_after_normalization():
+    cache = ResponseCache()
+    assert await cache.get(turn("What are your hours?")) is None
+    await cache.set(turn("What are your hours?"), "9 to 5")
+    assert await cache.get(turn("what are your hours")) == "9 to 5"
+    assert cache.get_stats()["hits"] == 1
+    assert cache.get_stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_system_prompt_is_part_of_key():
+    cache = ResponseCache()
+    await cache.set(turn("hello"), "hi")
+    other = [{"role": "system", "content": "other prompt"}, {"role": "user", "content": "hello"}]
+    assert await cache.get(other) is None
+
+
+@pytest.mark.asyncio
+async def test_later_turns_are_not_shared():
+    cache = ResponseCache(suffix_messages=2)
+    first = [SYSTEM, {"role": "user", "content": "hi"}, {"role": "assistant", "content": "Your order 48213 shipped."},
+             {"role": "user", "content": "yes"}]
+    second = [SYSTEM, {"role": "user", "content": "hello"}, {"role": "assistant", "content": "Your order 48213 shipped."},
+              {"role": "user", "content": "Yes."}]
+    await cache.set(first, "I have refunded order 48213 to your card ending 1234.")
+    assert await cache.get(second) is None
+    assert await cache.get(first) is None
+    assert cache.get_stats()["skipped"] == 2
+
+
+@pytest.mark.asyncio
+async def test_summarized_conversations_are_not_cached():
+    cache = ResponseCache()
+    messages = [SYSTEM, {"role": "system", "content": SUMMARY_PREFIX + "Caller Jane, order 48213."},
+                {"role": "user", "content": "yes"}]
+    await cache.set(messages, "Refund issued to Jane.")
+    assert await cache.get([SYSTEM, {"role": "system", "content": SUMMARY_PREFIX + "Caller Bob."},
+                            {"role": "user", "content": "yes"}]) is None
+    assert await cache.get(turn("yes")) is None
+    omitted = [SYSTEM, {"role": "system", "content": OMITTED_NOTE.format(count=12)}, {"role": "user", "content": "yes"}]
+    await cache.set(omitted, "Refund issued.")
+    assert await cache.get(omitted) is None
+
+
+@pytest.mark.asyncio
+async def test_fallback_is_not_cached():
+    cache = ResponseCache()
+    await cache.set(turn("hello"), FALLBACK_RESPONSE)
+    assert await cache.get(turn("hello")) is None
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction():
+    cache = ResponseCache(backend=InMemoryCacheBackend(max_entries=2))
+    await cache.set(turn("one"), "1")
+    await cache.set(turn("two"), "2")
+    assert await cache.get(turn("one")) == "1"
+    await cache.set(turn("three"), "3")
+    assert await cache.get(turn("two")) is None
+    assert await cache.get(turn("one")) == "1"
+    assert cache.get_stats()["evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_ttl_expiry():
+    cache = ResponseCache(ttl=1)
+    await cache.set(turn("hello"), "hi")
+    key = next(iter(cache.backend.entries))
+    expires_at, value = cache.backend.entries[key]
+    cache.backend.entries[key] = (expires_at - 2, value)
+    assert await cache.get(turn("hello")) is None
+
+
+@pytest.mark.asyncio
+async def test_semantic_tier():
+    cache = ResponseCache(embedder=bag_of_words, similarity_threshold=0.8)
+    await cache.set(turn("what are your opening hours"), "9 to 5")
+    assert await cache.get(turn("what are your hours")) == "9 to 5"
+    assert await cache.get(turn("reset password")) is None
+    assert cache.get_stats()["semantic_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_backend():
+    redis = FakeRedis()
+    cache = ResponseCache(backend=RedisCacheBackend(client=redis))
+    await cache.set(turn("hello"), "hi")
+    assert all(key.startswith("llm-cache:") for key in redis.data)
+    assert await cache.get(turn("Hello!")) == "hi"
@@ -0,0 +1,120 @@
+import asyncio
+import numpy as np
+import pytest
+from app.services.simulation_service import SimulationService
+from app.services.call_generator_service import CallGenerator, CallBatch, DEFAULT_SCRIPTS, summarize
+
+
+class StubLLMService:
+    def __init__(self):
+        self.calls = 0
+
+    async def get_response_async(self, messages, max_tokens=150, timeout=None):
+        self.calls += 1
+        await asyncio.sleep(0)
+        return f"echo: {messages[-1]['content']}"
+
+    def format_conversation_history(self, messages):
+        return [{"role": "system", "content": "system prompt"}] + messages
+
+
+class StubCallerLLM:
+    """Plays a caller that hangs up on its third line."""
+
+    async def get_response_async(self, messages, max_tokens=150, timeout=None):
+        lines = sum(1 for message in messages if message["role"] == "assistant")
+        return "Thanks, GOODBYE" if lines == 2 else f"caller line {lines}"
+
+
+async def generate(calls=30, seed=1, **kwargs):
+    kwargs.setdefault("score_workers", 1)
+    service = SimulationService(StubLLMService(), seed=seed)
+    return service, await CallGenerator(service, concurrency=8, seed=seed, **kwargs).run(calls)
+
+
+@pytest.mark.asyncio
+async def test_columns_line_up():
+    service, batch = await generate()
+    calls, messages = batch.calls, batch.messages
+    assert calls["call_index"].tolist() == list(range(30))
+    assert calls["completed"].all()
+    assert set(calls["caller"]) <= {script["name"] for script in DEFAULT_SCRIPTS}
+    assert len(messages["content"]) == 2 * calls["turns"].sum()
+    assert (messages["role"][::2] == "user").all()
+    assert (messages["content"][1::2] == np.char.add("echo: ", messages["content"][::2])).all()
+    assert np.isnan(messages["response_ms"][::2]).all()
+    assert (messages["response_ms"][1::2] >= 0).all()
+    assert np.isfinite(calls["caller_sentiment"]).all()
+    assert ((calls["quality_score"] >= 0) & (calls["quality_score"] <= 100)).all()
+    # Finished calls are not kept in memory
+    assert service.active_simulations == {}
+    assert summarize(batch)["completed"] == 30
+
+
+@pytest.mark.asyncio
+async def test_same_seed_reproduces_calls():
+    _, first = await generate(seed=5)
+    _, second = await generate(seed=5)
+    _, other = await generate(seed=6)
+    for column in ("caller", "quality_score", "caller_sentiment"):
+        assert (first.calls[column] == second.calls[column]).all()
+    assert (first.messages["content"] == second.messages["content"]).all()
+    assert (first.messages["sentiment"] == second.messages["sentiment"]).all()
+    assert first.messages["content"].tolist() != other.messages["content"].tolist()
+
+
+@pytest.mark.asyncio
+async def test_persona_callers():
+    callers = [{"name": "persona", "persona": "You want to cancel your subscription."}]
+    _, batch = await generate(calls=5, callers=callers, caller_llm=StubCallerLLM())
+    assert batch.calls["turns"].tolist() == [3] * 5
+    assert batch.messages["content"][4] == "Thanks, GOODBYE"
+
+
+def test_persona_callers_need_an_llm():
+    with pytest.raises(ValueError):
+        CallGenerator(SimulationService(StubLLMService()), callers=[{"name": "p", "persona": "Angry."}])
+
+
+@pytest.mark.asyncio
+async def test_failed_calls_are_marked():
+    class FailingSimulationService(SimulationService):
+        async def process_message(self, simulation_id, message, timeout=None):
+            return None
+
+    batch = await CallGenerator(FailingSimulationService(StubLLMService()), score_workers=1).run(3)
+    assert not batch.calls["completed"].any()
+    assert batch.calls["turns"].tolist() == [0, 0, 0]
+
+
+@pytest.mark.asyncio
+async def test_calls_that_raise_release_their_context():
+    class RaisingSimulationService(SimulationService):
+        async def process_message(self, simulation_id, message, timeout=None):
+            self.context_service.append(simulation_id, "user", message)
+            raise RuntimeError("model unavailable")
+
+    service = RaisingSimulationService(StubLLMService())
+    batch = await CallGenerator(service, score_workers=1).run(3)
+    assert len(batch.calls["call_index"]) == 0
+    assert service.active_simulations == {}
+    assert service.context_service.contexts == {}
+
+
+@pytest.mark.asyncio
+async def test_npz_round_trip(tmp_path):
+    _, batch = await generate(calls=5)
+    paths = batch.write(str(tmp_path / "run.npz"))
+    restored = CallBatch.read(paths[0])
+    assert restored.calls.keys() == batch.calls.keys()
+    assert (restored.messages["content"] == batch.messages["content"]).all()
+    assert np.array_equal(restored.messages["response_ms"], batch.messages["response_ms"], equal_nan=True)
+
+
+@pytest.mark.asyncio
+async def test_parquet_output(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    _, batch = await generate(calls=5)
+    calls_path, messages_path = batch.write(str(tmp_path / "run.parquet"))
+    assert pq.read_table(calls_path).num_rows == 5
+    assert pq.read_table(messages_path).num_rows == len(batch.messages["content"])
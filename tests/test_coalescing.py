@@ -0,0 +1,167 @@
+import asyncio
+import pytest
+from app.core.coalescing import RequestCoalescer, request_key
+from app.core.metrics import COALESCED_REQUESTS
+
+
+class Upstream:
+    """Counts calls and answers once released."""
+
+    def __init__(self):
+        self.calls = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def call(self, value="answer"):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return value
+
+    async def stream(self, chunks=("a", "b", "c"), fail=False):
+        self.calls += 1
+        for chunk in chunks:
+            await self.release.wait()
+            yield chunk
+        if fail:
+            raise RuntimeError("upstream failed")
+
+
+def test_request_key_ignores_dict_order():
+    assert request_key(model="m", messages=[{"role": "user", "content": "hi"}]) == request_key(
+        messages=[{"content": "hi", "role": "user"}], model="m"
+    )
+    assert request_key(model="m", max_tokens=150) != request_key(model="m", max_tokens=100)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_upstream_call():
+    coalescer = RequestCoalescer("test", max_waiters=100, enabled=True)
+    upstream = Upstream()
+    joined = COALESCED_REQUESTS.labels("test", "joined").value
+
+    waiters = asyncio.gather(*[coalescer.run("key", upstream.call) for _ in range(10)])
+    await asyncio.sleep(0)
+    upstream.release.set()
+    assert await waiters == ["answer"] * 10
+    assert upstream.calls == 1
+    assert COALESCED_REQUESTS.labels("test", "joined").value == joined + 9
+    assert coalescer.get_stats() == {"in_flight": 0, "leaders": 1, "saved": 9, "overflows": 0}
+
+    # Finished flights are not reused
+    assert await coalescer.run("key", upstream.call) == "answer"
+    assert upstream.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_different_keys_are_not_shared():
+    coalescer = RequestCoalescer("test", enabled=True)
+    upstream = Upstream()
+    upstream.release.set()
+    assert await asyncio.gather(
+        coalescer.run("a", lambda: upstream.call("a")), coalescer.run("b", lambda: upstream.call("b"))
+    ) == ["a", "b"]
+    assert upstream.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_waiter_limit_starts_new_flight():
+    coalescer = RequestCoalescer("test", max_waiters=3, enabled=True)
+    upstream = Upstream()
+    waiters = asyncio.gather(*[coalescer.run("key", upstream.call) for _ in range(7)])
+    await asyncio.sleep(0)
+    upstream.release.set()
+    assert await waiters == ["answer"] * 7
+    assert upstream.calls == 3
+    assert coalescer.overflows == 2
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter():
+    coalescer = RequestCoalescer("test", enabled=True)
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream failed")
+
+    results = await asyncio.gather(*[coalescer.run("key", failing) for _ in range(3)], return_exceptions=True)
+    assert calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_one_caller_giving_up_does_not_cancel_the_others():
+    coalescer = RequestCoalescer("test", enabled=True)
+    upstream = Upstream()
+    first = asyncio.ensure_future(coalescer.run("key", upstream.call))
+    second = asyncio.ensure_future(coalescer.run("key", upstream.call))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    upstream.release.set()
+    assert await second == "answer"
+    assert upstream.cancelled == 0
+
+    # Once everyone has given up, the upstream call is cancelled
+    upstream.release.clear()
+    third = asyncio.ensure_future(coalescer.run("key", upstream.call))
+    await asyncio.sleep(0)
+    third.cancel()
+    await asyncio.sleep(0.01)
+    assert upstream.cancelled == 1
+    assert coalescer.get_stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_is_fanned_out():
+    coalescer = RequestCoalescer("test", enabled=True)
+    first_sent, finish = asyncio.Event(), asyncio.Event()
+    calls = 0
+
+    async def upstream():
+        nonlocal calls
+        calls += 1
+        yield "a"
+        first_sent.set()
+        await finish.wait()
+        yield "b"
+        yield "c"
+
+    async def collect():
+        return [chunk async for chunk in coalescer.stream("key", upstream)]
+
+    early = asyncio.ensure_future(collect())
+    await first_sent.wait()
+    # Joins after the first chunk and still gets all of them
+    late = asyncio.ensure_future(collect())
+    await asyncio.sleep(0)
+    finish.set()
+    assert await early == await late == ["a", "b", "c"]
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_error_after_chunks():
+    coalescer = RequestCoalescer("test", enabled=True)
+    upstream = Upstream()
+    upstream.release.set()
+    received = []
+    with pytest.raises(RuntimeError):
+        async for chunk in coalescer.stream("key", lambda: upstream.stream(fail=True)):
+            received.append(chunk)
+    assert received == ["a", "b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_disabled_calls_upstream_every_time():
+    coalescer = RequestCoalescer("test", enabled=False)
+    upstream = Upstream()
+    upstream.release.set()
+    await asyncio.gather(*[coalescer.run("key", upstream.call) for _ in range(3)])
+    assert upstream.calls == 3
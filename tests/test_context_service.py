@@ -0,0 +1,94 @@
+import asyncio
+import pytest
+from app.services.context_service import ContextService, estimate_tokens
+
+
+class SummarizingLLM:
+    def __init__(self):
+        self.summary_requests = []
+
+    async def get_response_async(self, messages, max_tokens=150, timeout=None):
+        self.summary_requests.append(messages)
+        return f"summary #{len(self.summary_requests)}"
+
+    def format_conversation_history(self, messages):
+        return [{"role": "system", "content": "system prompt"}] + messages
+
+
+@pytest.fixture
+def llm_service():
+    return SummarizingLLM()
+
+
+@pytest.fixture
+def context_service(llm_service):
+    return ContextService(llm_service, max_tokens=100, summary_trigger_tokens=40)
+
+
+def prompt_tokens(messages):
+    return sum(estimate_tokens(m["content"]) for m in messages)
+
+
+@pytest.mark.asyncio
+async def test_short_conversation_is_sent_verbatim(context_service):
+    context_service.append("c1", "user", "hello")
+    context_service.append("c1", "assistant", "hi, how can I help?")
+    messages = await context_service.build_messages("c1")
+    assert [m["content"] for m in messages] == ["system prompt", "hello", "hi, how can I help?"]
+
+
+@pytest.mark.asyncio
+async def test_prompt_size_stays_bounded(context_service, llm_service):
+    sizes = []
+    for turn in range(200):
+        context_service.append("c1", "user", f"turn {turn} " + "x" * 60)
+        messages = await context_service.build_messages("c1")
+        sizes.append(prompt_tokens(messages))
+        # Let background summarization run between turns
+        await asyncio.sleep(0)
+
+    assert max(sizes[50:]) <= 2 * max(sizes[:10]) + 100
+    assert llm_service.summary_requests
+    assert messages[1]["content"].startswith("Summary of the earlier conversation: summary #")
+    assert messages[-1]["content"].startswith("turn 199 ")
+
+
+@pytest.mark.asyncio
+async def test_summary_is_incremental(context_service, llm_service):
+    for turn in range(20):
+        context_service.append("c1", "user", "y" * 80)
+        await context_service.build_messages("c1")
+        await asyncio.sleep(0)
+
+    assert len(llm_service.summary_requests) >= 2
+    last_request = llm_service.summary_requests[-1][-1]["content"]
+    assert "Current summary:\nsummary #" in last_request
+
+
+def test_drop_releases_context(context_service):
+    context_service.append("c1", "user", "hello")
+    context_service.drop("c1")
+    assert "c1" not in context_service.contexts
+
+
+class FailingLLM(SummarizingLLM):
+    async def get_response_async(self, messages, max_tokens=150, timeout=None):
+        self.summary_requests.append(messages)
+        raise RuntimeError("LLM is down")
+
+
+@pytest.mark.asyncio
+async def test_pending_is_bounded_when_summaries_fail():
+    llm_service = FailingLLM()
+    context_service = ContextService(llm_service, max_tokens=100, summary_trigger_tokens=40, max_summary_failures=2)
+    for turn in range(200):
+        context_service.append("c1", "user", f"turn {turn} " + "x" * 60)
+        messages = await context_service.build_messages("c1")
+        await asyncio.sleep(0)
+
+    context = context_service.contexts["c1"]
+    assert context.pending_tokens < 40 + estimate_tokens("x" * 70) * 2
+    assert context.omitted > 150
+    assert messages[1]["content"].endswith("earlier messages were omitted because they could not be summarized.")
+    assert messages[-1]["content"].startswith("turn 199 ")
+    assert prompt_tokens(messages) < 300
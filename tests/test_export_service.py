@@ -0,0 +1,75 @@
+import csv
+import gzip
+import io
+import json
+import pytest
+from app.services.export_service import ExportService, CSV_COLUMNS
+
+
+def make_record(i, messages=2):
+    return {
+        "simulation_id": f"sim-{i}",
+        "start_time": "2024-01-01T00:00:00",
+        "end_time": "2024-01-01T00:05:00",
+        "duration": 300,
+        "status": "completed",
+        "agent_id": None,
+        "transfer_reason": None,
+        "quality_metrics": {"quality_score": 90, "sentiment_score": 60},
+        "messages": [
+            {"role": "user" if j % 2 == 0 else "assistant", "content": f"message, {j}", "timestamp": "2024-01-01T00:01:00"}
+            for j in range(messages)
+        ],
+        "notes": [{"content": "follow up", "timestamp": "2024-01-01T00:02:00"}],
+        "tags": [{"name": "billing", "type": "warning", "timestamp": "2024-01-01T00:03:00"}],
+    }
+
+
+async def records(count, messages=2):
+    for i in range(count):
+        yield make_record(i, messages)
+
+
+async def collect(stream):
+    return b"".join([chunk async for chunk in stream])
+
+
+@pytest.mark.asyncio
+async def test_csv_export_has_one_row_per_message():
+    data = await collect(ExportService().stream(records(3), fmt="csv"))
+    rows = list(csv.reader(io.StringIO(data.decode())))
+    assert rows[0] == CSV_COLUMNS
+    assert len(rows) == 1 + 3 * 2
+    assert rows[1][CSV_COLUMNS.index("tags")] == "billing:warning"
+    assert rows[2][CSV_COLUMNS.index("content")] == "message, 1"
+
+
+@pytest.mark.asyncio
+async def test_csv_export_keeps_calls_without_messages():
+    data = await collect(ExportService().stream(records(1, messages=0), fmt="csv"))
+    rows = list(csv.reader(io.StringIO(data.decode())))
+    assert len(rows) == 2
+    assert rows[1][0] == "sim-0"
+
+
+@pytest.mark.asyncio
+async def test_ndjson_export():
+    data = await collect(ExportService().stream(records(2), fmt="ndjson"))
+    lines = [json.loads(line) for line in data.decode().splitlines()]
+    assert [line["simulation_id"] for line in lines] == ["sim-0", "sim-1"]
+    assert lines[0]["notes"][0]["content"] == "follow up"
+
+
+@pytest.mark.asyncio
+async def test_gzip_export_is_chunked():
+    service = ExportService(flush_bytes=1024)
+    chunks = [chunk async for chunk in service.stream(records(200), fmt="ndjson", compress=True)]
+    assert len(chunks) > 1
+    lines = gzip.decompress(b"".join(chunks)).decode().splitlines()
+    assert len(lines) == 200
+
+
+@pytest.mark.asyncio
+async def test_unsupported_format():
+    with pytest.raises(ValueError):
+        await collect(ExportService().stream(records(1), fmt="xml"))
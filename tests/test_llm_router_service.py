@@ -0,0 +1,205 @@
+import asyncio
+import json
+import time
+import pytest
+from app.services.llm_service import LLMService, FALLBACK_RESPONSE
+from app.services.llm_router_service import LLMRouter, CircuitBreaker, NoBackendAvailable, create_llm_service
+from app.core.metrics import LLM_BACKEND_REQUESTS, LLM_HEDGES
+
+
+class FakeBackend:
+    """LLM backend with injected latency and failures."""
+
+    def __init__(self, name: str, delay: float = 0.0, fail: bool = False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = 0
+        self.closed_streams = 0
+
+    async def _wait(self):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise RuntimeError(f"{self.name} is down")
+
+    async def complete(self, messages, max_tokens=150, timeout=None):
+        await self._wait()
+        return f"{self.name}: {messages[-1]['content']}"
+
+    async def stream(self, messages, max_tokens=150, timeout=None):
+        try:
+            await self._wait()
+            for word in (self.name, messages[-1]["content"]):
+                yield word + " "
+        finally:
+            self.closed_streams += 1
+
+    def format_conversation_history(self, messages):
+        return [{"role": "system", "content": self.name}] + messages
+
+    async def aclose(self):
+        pass
+
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def router(*backends, **kwargs):
+    kwargs.setdefault("hedge_delay", 0.05)
+    kwargs.setdefault("failure_threshold", 2)
+    kwargs.setdefault("reset_timeout", 0.1)
+    return LLMRouter(list(backends), **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged():
+    primary, secondary = FakeBackend("primary"), FakeBackend("secondary")
+    llm = router(primary, secondary)
+    assert await llm.get_response_async(MESSAGES) == "primary: hello"
+    assert secondary.calls == 0
+
+
+@pytest.mark.asyncio
+async def test_hedge_wins_and_loser_is_cancelled():
+    primary, secondary = FakeBackend("primary", delay=1.0), FakeBackend("secondary", delay=0.01)
+    llm = router(primary, secondary)
+    sent = LLM_HEDGES.labels("sent").value
+    won = LLM_HEDGES.labels("hedge_won").value
+
+    started = time.perf_counter()
+    assert await llm.get_response_async(MESSAGES) == "secondary: hello"
+    assert time.perf_counter() - started < 0.5
+    assert primary.cancelled == 1
+    assert LLM_HEDGES.labels("sent").value == sent + 1
+    assert LLM_HEDGES.labels("hedge_won").value == won + 1
+    assert LLM_BACKEND_REQUESTS.labels("primary", "cancelled").value >= 1
+
+    # The loser's latency counts, so the faster backend is now tried first
+    assert [backend.name for backend in llm._ranked()] == ["secondary", "primary"]
+
+
+@pytest.mark.asyncio
+async def test_hedge_delay_follows_p95():
+    backend = FakeBackend("primary")
+    llm = router(backend, FakeBackend("secondary"), min_samples=10, min_hedge_delay=0.001, max_hedge_delay=1.0)
+    state = llm.backends[0]
+    assert llm._hedge_after(state) == 0.05
+    for latency in [0.01] * 18 + [0.2, 0.3]:
+        state.observe(latency)
+    assert llm._hedge_after(state) == 0.2
+    state.observe(5.0)
+    assert llm._hedge_after(state) == 0.3
+    for _ in range(100):
+        state.observe(5.0)
+    assert llm._hedge_after(state) == 1.0
+
+
+@pytest.mark.asyncio
+async def test_failure_falls_back_to_next_backend():
+    primary, secondary = FakeBackend("primary", fail=True), FakeBackend("secondary", delay=0.01)
+    llm = router(primary, secondary, hedge_delay=1.0)
+    assert await llm.complete(MESSAGES) == "secondary: hello"
+    assert primary.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_all_backends_failing_returns_fallback():
+    llm = router(FakeBackend("primary", fail=True), FakeBackend("secondary", fail=True))
+    with pytest.raises(RuntimeError):
+        await llm.complete(MESSAGES)
+    assert await llm.get_response_async(MESSAGES) == FALLBACK_RESPONSE
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_and_recovers():
+    primary, secondary = FakeBackend("primary", fail=True), FakeBackend("secondary")
+    llm = router(primary, secondary)
+    # The primary has been the fastest until now
+    llm.backends[0].observe(0.0)
+    for _ in range(2):
+        assert await llm.complete(MESSAGES) == "secondary: hello"
+    assert llm.backends[0].breaker.state == CircuitBreaker.OPEN
+
+    # Open: the primary is skipped entirely
+    await llm.complete(MESSAGES)
+    assert primary.calls == 2
+
+    # After the reset timeout a single trial goes through and closes it again
+    primary.fail = False
+    await asyncio.sleep(0.15)
+    assert await llm.complete(MESSAGES) == "primary: hello"
+    assert llm.backends[0].breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_allows_one_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.acquire()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.acquire()
+    # A cancelled trial gives its slot back
+    breaker.release()
+    assert breaker.acquire()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+@pytest.mark.asyncio
+async def test_no_backend_available():
+    llm = router(FakeBackend("primary"), reset_timeout=60)
+    llm.backends[0].breaker.record_failure()
+    llm.backends[0].breaker.record_failure()
+    with pytest.raises(NoBackendAvailable):
+        await llm.complete(MESSAGES)
+
+
+@pytest.mark.asyncio
+async def test_stream_hedges_on_first_chunk():
+    primary, secondary = FakeBackend("primary", delay=1.0), FakeBackend("secondary", delay=0.01)
+    llm = router(primary, secondary)
+    deltas = [delta async for delta in llm.stream_response(MESSAGES)]
+    assert "".join(deltas) == "secondary hello "
+    assert primary.cancelled == 1
+    # Both generators were closed
+    assert primary.closed_streams == secondary.closed_streams == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_falls_back():
+    llm = router(FakeBackend("primary", fail=True), FakeBackend("secondary", fail=True))
+    assert [delta async for delta in llm.stream_response(MESSAGES)] == [FALLBACK_RESPONSE]
+
+
+@pytest.mark.asyncio
+async def test_stats():
+    llm = router(FakeBackend("primary"), FakeBackend("secondary"))
+    await llm.complete(MESSAGES)
+    stats = llm.get_stats()
+    assert stats[0]["name"] == "primary"
+    assert stats[0]["requests"] == 1
+    assert stats[0]["state"] == "closed"
+    assert stats[1]["ewma_ms"] is None
+    assert llm.format_conversation_history(MESSAGES)[0]["content"] == "primary"
+
+
+def test_create_llm_service(monkeypatch):
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+    monkeypatch.setenv("BACKUP_API_KEY", "backup-key")
+    monkeypatch.delenv("LLM_BACKENDS", raising=False)
+    assert isinstance(create_llm_service(), LLMService)
+
+    monkeypatch.setenv("LLM_BACKENDS", json.dumps([
+        {"name": "groq-qwen", "model": "qwen-2.5-32b"},
+        {"name": "backup", "model": "llama-3.1-8b", "base_url": "http://backup.test", "api_key_env": "BACKUP_API_KEY"},
+    ]))
+    llm = create_llm_service()
+    assert isinstance(llm, LLMRouter)
+    assert [backend.name for backend in llm.backends] == ["groq-qwen", "backup"]
+    assert llm.backends[1].service.model == "llama-3.1-8b"
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import httpx
+import pytest
+from app.services.llm_service import LLMService, FALLBACK_RESPONSE
+from app.core.metrics import LLM_REQUEST_SECONDS, LLM_TOKENS
+
+
+class FakeGroq:
+    """In-process stand-in for the Groq chat completions endpoint."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = []
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        self.requests.append(body)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        reply = f"echo: {body['messages'][-1]['content']}"
+        if body.get("stream"):
+            return httpx.Response(
+                200,
+                headers={"content-type": "text/event-stream"},
+                content=self._sse(body["model"], reply)
+            )
+        return httpx.Response(200, json={
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+        })
+
+    @staticmethod
+    def _sse(model: str, reply: str) -> bytes:
+        events = []
+        for word in reply.split(" "):
+            chunk = {
+                "id": "chatcmpl-test",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]
+            }
+            events.append(f"data: {json.dumps(chunk)}\n\n")
+        events.append("data: [DONE]\n\n")
+        return "".join(events).encode()
+
+
+def make_service(fake: FakeGroq, **kwargs) -> LLMService:
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(fake))
+    return LLMService(
+        api_key="test-key",
+        base_url="http://fake-groq.local",
+        http_client=http_client,
+        **kwargs
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_response_async():
+    fake = FakeGroq()
+    service = make_service(fake)
+    response = await service.get_response_async([{"role": "user", "content": "hello"}])
+    assert response == "echo: hello"
+    assert fake.requests[0]["max_tokens"] == 150
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit():
+    fake = FakeGroq(delay=0.05)
+    service = make_service(fake, max_concurrency=4)
+    responses = await asyncio.gather(*[
+        service.get_response_async([{"role": "user", "content": str(i)}])
+        for i in range(20)
+    ])
+    assert responses == [f"echo: {i}" for i in range(20)]
+    assert fake.max_in_flight == 4
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_timeout_returns_fallback():
+    fake = FakeGroq(delay=1.0)
+    service = make_service(fake)
+    response = await service.get_response_async(
+        [{"role": "user", "content": "hello"}],
+        timeout=0.05
+    )
+    assert response == FALLBACK_RESPONSE
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_stream_response():
+    fake = FakeGroq()
+    service = make_service(fake)
+    deltas = [
+        delta async for delta in
+        service.stream_response([{"role": "user", "content": "hello there"}])
+    ]
+    assert deltas == ["echo: ", "hello ", "there "]
+    assert fake.requests[0]["stream"] is True
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_stream_timeout_yields_fallback():
+    fake = FakeGroq(delay=1.0)
+    service = make_service(fake)
+    deltas = [
+        delta async for delta in
+        service.stream_response([{"role": "user", "content": "hello"}], timeout=0.05)
+    ]
+    assert deltas == [FALLBACK_RESPONSE]
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_latency_and_tokens_are_recorded():
+    service = make_service(FakeGroq())
+    latency = LLM_REQUEST_SECONDS.labels("complete", "ok")
+    requests_before = latency.count
+    tokens_before = LLM_TOKENS.labels("completion").value
+
+    await service.get_response_async([{"role": "user", "content": "hi"}])
+
+    assert latency.count == requests_before + 1
+    assert LLM_TOKENS.labels("completion").value == tokens_before + 1
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_identical_requests_are_coalesced():
+    fake = FakeGroq(delay=0.05)
+    service = make_service(fake)
+    messages = [{"role": "user", "content": "hello"}]
+    responses = await asyncio.gather(*[service.get_response_async(list(messages)) for _ in range(10)])
+    assert responses == ["echo: hello"] * 10
+    assert len(fake.requests) == 1
+    assert service.coalescer.get_stats()["saved"] == 9
+
+    streams = await asyncio.gather(*[
+        asyncio.ensure_future(_collect(service.stream_response(messages))) for _ in range(5)
+    ])
+    assert streams == ["echo: hello "] * 5
+    assert len(fake.requests) == 2
+    await service.aclose()
+
+
+async def _collect(deltas) -> str:
+    return "".join([delta async for delta in deltas])
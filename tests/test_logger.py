@@ -0,0 +1,92 @@
+import json
+import logging
+import logging.handlers
+import queue
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.core.logger import (
+    setup_logger, log_context, bind_log_context, _log_context,
+    ContextFilter, SamplingFilter, JsonFormatter, LazyQueueHandler, CorrelationMiddleware
+)
+
+
+def make_record(msg="Started simulation %s", args=("sim-1",), level=logging.INFO, **extra):
+    record = logging.LogRecord("call_center", level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_correlation_ids():
+    record = make_record()
+    with log_context(simulation_id="sim-1"):
+        with log_context(call_sid="CA1"):
+            ContextFilter().filter(record)
+        assert _log_context.get() == {"simulation_id": "sim-1"}
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Started simulation sim-1"
+    assert entry["level"] == "INFO"
+    assert entry["simulation_id"] == "sim-1"
+    assert entry["call_sid"] == "CA1"
+
+
+def test_sampling_only_drops_debug():
+    sampler = SamplingFilter(0.0)
+    assert not sampler.filter(make_record(level=logging.DEBUG))
+    assert sampler.filter(make_record(level=logging.DEBUG, sample_rate=1.0))
+    assert sampler.filter(make_record(level=logging.INFO))
+
+
+def test_queue_handler_defers_formatting():
+    class Expensive:
+        renders = 0
+
+        def __str__(self):
+            Expensive.renders += 1
+            return "expensive"
+
+    log_queue = queue.SimpleQueue()
+    LazyQueueHandler(log_queue).handle(make_record("Value %s", (Expensive(),)))
+    record = log_queue.get_nowait()
+    assert Expensive.renders == 0
+    assert record.getMessage() == "Value expensive"
+
+
+def test_setup_logger_writes_json_to_rotating_file(tmp_path, monkeypatch):
+    log_dir = tmp_path / "logs"
+    monkeypatch.setenv("LOG_DIR", str(log_dir))
+    monkeypatch.setenv("LOG_ROTATION", "size")
+    test_logger = setup_logger("call_center.test_rotation")
+    test_logger.propagate = False
+    assert setup_logger("call_center.test_rotation") is test_logger
+    # Nothing touches the disk until the first record is written
+    assert not log_dir.exists()
+
+    bind_log_context(call_sid="CA9")
+    test_logger.info("Answered call %s", "CA9")
+    # Stopping drains the queue; restart so the exit hook can stop it again
+    test_logger.listener.stop()
+    test_logger.listener.start()
+
+    file_handler = test_logger.listener.handlers[-1]
+    assert isinstance(file_handler, logging.handlers.RotatingFileHandler)
+    file_handler.close()
+    entry = json.loads((log_dir / "app.log").read_text().splitlines()[-1])
+    assert entry["message"] == "Answered call CA9"
+    assert entry["call_sid"] == "CA9"
+
+
+def test_correlation_middleware_sets_request_id():
+    app = FastAPI()
+    app.add_middleware(CorrelationMiddleware)
+
+    @app.get("/context")
+    async def context():
+        return _log_context.get()
+
+    client = TestClient(app)
+    response = client.get("/context", headers={"X-Request-ID": "req-42"})
+    assert response.json() == {"request_id": "req-42"}
+    assert response.headers["x-request-id"] == "req-42"
+    generated = client.get("/context")
+    assert generated.json()["request_id"] == generated.headers["x-request-id"]
@@ -0,0 +1,264 @@
+import asyncio
+import base64
+import io
+import json
+import numpy as np
+import pytest
+import soundfile as sf
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+from app.services.media_stream_service import (
+    MediaStreamSession, audio_to_frames, mulaw_decode, mulaw_encode, FRAME_BYTES, MULAW_SAMPLE_RATE
+)
+from app.services.simulation_service import SimulationService
+from app.services.speech_service import SpeechService
+from app.services.tts_service import TTSService, AudioCache
+
+
+class FakePool:
+    """Transcribes any audio as the same phrase."""
+
+    def __init__(self, text="I need help"):
+        self.text = text
+        self.calls = 0
+
+    async def transcribe(self, audio, sample_rate):
+        self.calls += 1
+        return self.text
+
+
+class BlockingPool(FakePool):
+    """Transcribes only once released, like a busy Whisper pool."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+
+    async def transcribe(self, audio, sample_rate):
+        await self.release.wait()
+        return await super().transcribe(audio, sample_rate)
+
+
+class WavBackend:
+    name = "wav"
+    content_type = "audio/wav"
+    extension = "wav"
+
+    def __init__(self):
+        self.calls = []
+
+    def synthesize(self, text):
+        self.calls.append(text)
+        buffer = io.BytesIO()
+        sf.write(buffer, np.full(1600, 0.1, dtype=np.float32), 16000, format="WAV")
+        return buffer.getvalue()
+
+
+class StreamingLLMService:
+    def __init__(self, deltas, block_after=None):
+        self.deltas = deltas
+        self.block_after = block_after
+        self.blocked = asyncio.Event()
+        self.closed = False
+
+    def format_conversation_history(self, messages):
+        return [{"role": "system", "content": "system prompt"}] + messages
+
+    async def stream_response(self, messages):
+        try:
+            for index, delta in enumerate(self.deltas):
+                if index == self.block_after:
+                    self.blocked.set()
+                    await asyncio.Event().wait()
+                yield delta
+        finally:
+            self.closed = True
+
+
+def media_event(samples):
+    return {
+        "event": "media",
+        "streamSid": "MZ1",
+        "media": {"track": "inbound", "payload": base64.b64encode(mulaw_encode(samples)).decode()},
+    }
+
+
+START = {"event": "start", "streamSid": "MZ1", "start": {"callSid": "CA1", "streamSid": "MZ1"}}
+STOP = {"event": "stop", "streamSid": "MZ1"}
+SPEECH = np.full(FRAME_BYTES, 0.2, dtype=np.float32)
+SILENCE = np.zeros(FRAME_BYTES, dtype=np.float32)
+
+
+def utterance(speech_frames=10, silence_frames=30):
+    return [media_event(SPEECH)] * speech_frames + [media_event(SILENCE)] * silence_frames
+
+
+async def say(session, events):
+    """Send media as it would arrive live, letting transcription keep up."""
+    for event in events:
+        await session.handle(event)
+        await session.wait_listened()
+
+
+@pytest.fixture
+def backend():
+    return WavBackend()
+
+
+@pytest.fixture
+def tts_service(backend, tmp_path):
+    return TTSService(backend=backend, cache=AudioCache(directory=str(tmp_path)))
+
+
+@pytest.fixture
+def speech_service(tts_service):
+    return SpeechService(pool=FakePool(), tts=tts_service)
+
+
+def test_mulaw_round_trip():
+    samples = np.linspace(-0.9, 0.9, 1000, dtype=np.float32)
+    decoded = mulaw_decode(mulaw_encode(samples))
+    assert decoded.dtype == np.float32
+    # G.711 keeps roughly 3% relative error across the range
+    assert np.all(np.abs(decoded - samples) <= 0.03 * np.abs(samples) + 0.002)
+    assert mulaw_encode(np.zeros(4)) == b"\xff" * 4
+
+
+def test_audio_to_frames_resamples_to_8khz(backend):
+    frames = audio_to_frames(backend.synthesize("hi"))
+    # 0.1 s at 16 kHz becomes 800 mu-law samples: five 20 ms frames
+    assert [len(base64.b64decode(frame)) for frame in frames] == [FRAME_BYTES] * 5
+    assert MULAW_SAMPLE_RATE == 8000
+
+
+def test_media_stream_over_websocket(speech_service, tts_service, backend):
+    llm_service = StreamingLLMService(["Sure. ", "I can help", " with that."])
+    simulation_service = SimulationService(llm_service)
+    app = FastAPI()
+
+    @app.websocket("/media")
+    async def media(websocket: WebSocket):
+        await websocket.accept()
+        session = MediaStreamSession(websocket.send_json, speech_service, simulation_service, tts_service)
+        await session.run(websocket.receive_text)
+        await session.close()
+
+    def receive_until_mark(websocket):
+        events = []
+        while not events or events[-1]["event"] != "mark":
+            events.append(websocket.receive_json())
+        return events
+
+    with TestClient(app).websocket_connect("/media") as websocket:
+        websocket.send_text(json.dumps(START))
+        greeting = receive_until_mark(websocket)
+        assert [e["event"] for e in greeting] == ["media"] * 5 + ["mark"]
+        assert all(e["streamSid"] == "MZ1" for e in greeting)
+
+        for event in utterance():
+            websocket.send_text(json.dumps(event))
+        # The reply is spoken sentence by sentence as the LLM streams it
+        assert receive_until_mark(websocket)[-1]["mark"]["name"] == "Sure."
+        assert receive_until_mark(websocket)[-1]["mark"]["name"] == "I can help with that."
+        websocket.send_text(json.dumps(STOP))
+
+    details = simulation_service.get_simulation_details("CA1")
+    assert [m["content"] for m in details["messages"]] == ["I need help", "Sure. I can help with that."]
+    assert details["status"] == "completed"
+    assert backend.calls[1:] == ["Sure.", "I can help with that."]
+
+
+@pytest.mark.asyncio
+async def test_barge_in_cancels_reply(speech_service, tts_service):
+    llm_service = StreamingLLMService(["Sure. ", "Let me explain at length."], block_after=1)
+    simulation_service = SimulationService(llm_service)
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    session = MediaStreamSession(send, speech_service, simulation_service, tts_service)
+    await session.handle(START)
+    await session._reply
+    # Twilio has played the greeting
+    await session.handle({"event": "mark", "streamSid": "MZ1", "mark": sent[-1]["mark"]})
+    await say(session, utterance())
+    await asyncio.wait_for(llm_service.blocked.wait(), 1)
+    assert session.replying
+
+    # Caller talks over the reply long enough for a partial transcript
+    await say(session, utterance(speech_frames=20, silence_frames=0))
+
+    assert not session.replying
+    assert session.barge_ins == 1
+    assert llm_service.closed
+    assert sent[-1] == {"event": "clear", "streamSid": "MZ1"}
+    # The interrupted reply keeps only what was generated before the barge-in
+    messages = simulation_service.get_simulation_details("CA1")["messages"]
+    assert [m["content"] for m in messages] == ["I need help", "Sure. "]
+    await session.close()
+
+
+@pytest.mark.asyncio
+async def test_barge_in_while_audio_is_playing(speech_service, tts_service):
+    simulation_service = SimulationService(StreamingLLMService(["Sure, one moment."]))
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    def mark_echo(message):
+        return {"event": "mark", "streamSid": "MZ1", "mark": message["mark"]}
+
+    session = MediaStreamSession(send, speech_service, simulation_service, tts_service)
+    await session.handle(START)
+    await session._reply
+    # Every frame was sent, but Twilio is still playing the greeting
+    assert session.replying
+    await session.handle(mark_echo(sent[-1]))
+    assert not session.replying
+
+    await say(session, utterance())
+    await session._reply
+    assert sent[-1]["mark"]["name"] == "Sure, one moment."
+    assert session.replying
+
+    # The caller talks before the reply's mark comes back
+    await say(session, utterance(speech_frames=20, silence_frames=0))
+    assert session.barge_ins == 1
+    assert sent[-1] == {"event": "clear", "streamSid": "MZ1"}
+    assert not session.replying
+
+    # The echo of the cleared mark is ignored
+    await session.handle({"event": "mark", "streamSid": "MZ1", "mark": {"name": "Sure, one moment."}})
+    assert not session.replying
+    await session.close()
+
+
+@pytest.mark.asyncio
+async def test_transcription_does_not_block_receiving(tts_service):
+    pool = BlockingPool()
+    simulation_service = SimulationService(StreamingLLMService(["Sure."]))
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    session = MediaStreamSession(send, SpeechService(pool=pool, tts=tts_service), simulation_service, tts_service)
+    await session.handle(START)
+    await session._reply
+    greeting_mark = sent[-1]["mark"]
+
+    # Speech keeps being received while the pool is busy, and the greeting's mark gets through
+    for event in utterance(speech_frames=20, silence_frames=0):
+        await asyncio.wait_for(session.handle(event), 0.1)
+    await asyncio.wait_for(session.wait_listened(), 0.1)
+    await session.handle({"event": "mark", "streamSid": "MZ1", "mark": greeting_mark})
+    assert not session.replying
+
+    pool.release.set()
+    await say(session, utterance(speech_frames=5, silence_frames=0))
+    assert pool.calls >= 1
+    # The greeting had finished playing, so this is not a barge-in
+    assert session.barge_ins == 0
+    await session.close()
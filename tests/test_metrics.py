@@ -0,0 +1,85 @@
+import threading
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.core.metrics import Registry, Counter, Gauge, Histogram, MetricsMiddleware, HTTP_REQUEST_SECONDS
+
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+
+def test_counter_and_gauge_render(registry):
+    requests = Counter("requests_total", "Requests", ["route"], registry=registry)
+    requests.labels("/a").inc()
+    requests.labels("/a").inc(2)
+    requests.labels('/b"c').inc()
+    Gauge("depth", "Queue depth", function=lambda: 7, registry=registry)
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{route="/a"} 3',
+        'requests_total{route="/b\\"c"} 1',
+        "# HELP depth Queue depth",
+        "# TYPE depth gauge",
+        "depth 7",
+    ]
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    latency = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value)
+
+    assert registry.render().splitlines()[2:] == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 3.65",
+        "latency_seconds_count 4",
+    ]
+
+
+def test_updates_from_many_threads_are_not_lost(registry):
+    counter = Counter("events_total", "Events", registry=registry)
+
+    def work():
+        for _ in range(10000):
+            counter.inc()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter._default.value == 80000
+
+
+def test_broken_callback_does_not_break_scrape(registry):
+    Gauge("broken", "Broken", function=lambda: 1 / 0, registry=registry)
+    Gauge("ok", "Fine", function=lambda: 1, registry=registry)
+    assert registry.render().endswith("ok 1\n")
+
+
+def test_duplicate_names_are_rejected(registry):
+    Counter("dup_total", "Once", registry=registry)
+    with pytest.raises(ValueError):
+        Counter("dup_total", "Twice", registry=registry)
+
+
+def test_middleware_labels_by_route_template():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        return {"id": item_id}
+
+    child = HTTP_REQUEST_SECONDS.labels("GET", "/items/{item_id}", 200)
+    before = child.count
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+    assert child.count == before + 2
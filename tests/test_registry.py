@@ -0,0 +1,93 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from app.core.registry import ServiceRegistry
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "5"))
+
+
+class Service:
+    def __init__(self, name, closed, dependency=None):
+        self.name = name
+        self.closed = closed
+        self.dependency = dependency
+        self.warmed = False
+
+    def warm_up(self):
+        self.warmed = True
+
+    async def aclose(self):
+        self.closed.append(self.name)
+
+
+@pytest.fixture
+def closed():
+    return []
+
+
+@pytest.fixture
+def registry(closed):
+    registry = ServiceRegistry()
+    registry.register("database", lambda s: Service("database", closed), close=Service.aclose)
+    registry.register("calls", lambda s: Service("calls", closed, s.database), warm=True, close=Service.aclose)
+    registry.register("reports", lambda s: Service("reports", closed), close=Service.aclose)
+    return registry
+
+
+def test_services_are_built_on_first_use(registry):
+    assert registry.peek("calls") is None
+    calls = registry.calls
+    assert registry.calls is calls
+    assert calls.dependency is registry.database
+    assert registry.status() == {"database": True, "calls": True, "reports": False}
+    with pytest.raises(AttributeError):
+        registry.missing
+
+
+@pytest.mark.asyncio
+async def test_warm_up_builds_warm_services_and_sets_ready(registry):
+    assert not registry.ready
+    await registry.warm_up()
+    assert registry.ready
+    assert registry.peek("calls").warmed
+    assert not registry.is_loaded("reports")
+
+
+@pytest.mark.asyncio
+async def test_close_runs_in_reverse_creation_order(registry, closed):
+    registry.calls
+    await registry.aclose()
+    # Only built services are closed, dependents first
+    assert closed == ["calls", "database"]
+    assert registry.status() == {"database": False, "calls": False, "reports": False}
+
+
+def test_importing_the_app_is_fast_and_builds_nothing(tmp_path):
+    script = (
+        "import json, os, sys, time\n"
+        "started = time.perf_counter()\n"
+        "import app.main\n"
+        "elapsed = time.perf_counter() - started\n"
+        "print(json.dumps({'elapsed': elapsed, 'services': app.main.services.status(),"
+        " 'nltk': 'nltk' in sys.modules, 'logs': os.path.exists(os.environ['LOG_DIR'])}))\n"
+    )
+    env = {
+        **os.environ,
+        "PYTHONPATH": REPO_ROOT,
+        "LOG_DIR": str(tmp_path / "logs"),
+        "DATABASE_URL": f"sqlite+aiosqlite:///{tmp_path}/test.db",
+        "GROQ_API_KEY": "test",
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=REPO_ROOT, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert report["elapsed"] < IMPORT_BUDGET_SECONDS
+    assert not any(report["services"].values())
+    assert not report["nltk"]
+    assert not report["logs"]
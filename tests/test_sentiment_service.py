@@ -1,4 +1,7 @@
 import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from app.models.database import init_async_db, create_tables, Call, Message
 from app.services.sentiment_service import SentimentService
 
 @pytest.fixture
@@ -23,6 +26,16 @@ def test_analyze_text_neutral(sentiment_service):
     assert abs(result["compound"]) < 0.05
     assert result["neu"] > result["pos"] and result["neu"] > result["neg"]
 
+def test_lexicon_is_loaded_lazily_from_disk(tmp_path, monkeypatch):
+    lexicon = tmp_path / "lexicon.txt"
+    lexicon.write_text("great\t3.1\t0.5\t[3, 3]\nawful\t-3.4\t0.5\t[-3, -4]\n")
+    monkeypatch.setenv("SENTIMENT_LEXICON_PATH", str(lexicon))
+
+    service = SentimentService()
+    service.warm_up()
+    assert service.analyze_text("a great call")["compound"] > 0
+    assert service.analyze_text("an awful call")["compound"] < 0
+
 def test_get_sentiment_label(sentiment_service):
     assert sentiment_service.get_sentiment_label(0.5) == "positive"
     assert sentiment_service.get_sentiment_label(-0.5) == "negative"
@@ -47,4 +60,91 @@ def test_analyze_empty_conversation(sentiment_service):
     assert result["overall_sentiment"] == "neutral"
     assert result["sentiment_scores"]["neu"] == 1
     assert result["sentiment_scores"]["pos"] == 0
-    assert result["sentiment_scores"]["neg"] == 0 
\ No newline at end of file
+    assert result["sentiment_scores"]["neg"] == 0 
+
+class CountingAnalyzer:
+    """Deterministic stand-in for VADER that records what it scores."""
+
+    def __init__(self):
+        self.calls = []
+
+    def polarity_scores(self, text):
+        self.calls.append(text)
+        compound = 0.5 if "happy" in text else -0.5 if "terrible" in text else 0.0
+        pos, neg = max(compound, 0), max(-compound, 0)
+        return {"pos": pos, "neg": neg, "neu": 1 - pos - neg, "compound": compound}
+
+
+@pytest.fixture
+def counting_service():
+    return SentimentService(analyzer=CountingAnalyzer())
+
+
+def test_analyze_batch(counting_service):
+    scores = counting_service.analyze_batch(["happy", "terrible", "okay", "happy"])
+    assert scores.shape == (4, 4)
+    assert list(scores[:, 3]) == [0.5, -0.5, 0.0, 0.5]
+    assert counting_service.analyzer.calls == ["happy", "terrible", "okay"]
+    assert counting_service.analyze_batch([]).shape == (0, 4)
+
+
+def test_analyze_conversation_is_incremental(counting_service):
+    messages = [{"role": "user", "content": "I am happy"}, {"role": "assistant", "content": "Great"}]
+    counting_service.analyze_conversation(messages)
+    messages.append({"role": "user", "content": "this is terrible"})
+    result = counting_service.analyze_conversation(messages)
+
+    assert counting_service.analyzer.calls == ["I am happy", "this is terrible"]
+    assert result["sentiment_scores"]["compound"] == 0.0
+    assert result["overall_sentiment"] == "neutral"
+
+
+def test_score_cache_is_bounded():
+    service = SentimentService(analyzer=CountingAnalyzer(), cache_size=2)
+    service.analyze_batch(["a", "b", "c"])
+    service.analyze_batch(["a"])
+    assert service.analyzer.calls == ["a", "b", "c", "a"]
+
+
+@pytest_asyncio.fixture
+async def session_factory(tmp_path):
+    engine, session_factory = init_async_db(f"sqlite+aiosqlite:///{tmp_path}/test.db")
+    await create_tables(engine)
+    async with session_factory() as session:
+        async with session.begin():
+            for i in range(3):
+                call = Call(simulation_id=f"sim-{i}", status="completed")
+                session.add(call)
+                await session.flush()
+                session.add_all([
+                    Message(call_id=call.id, role="user", content="I am happy"),
+                    Message(call_id=call.id, role="assistant", content="Glad to help"),
+                    Message(call_id=call.id, role="user", content="happy" if i else "terrible"),
+                ])
+    yield session_factory
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_backfill(counting_service, session_factory):
+    assert await counting_service.backfill(session_factory, batch_size=4, workers=1) == 6
+    # Already scored messages are skipped
+    assert await counting_service.backfill(session_factory, workers=1) == 0
+
+    async with session_factory() as session:
+        messages = (await session.scalars(select(Message).order_by(Message.id))).all()
+        calls = (await session.scalars(select(Call).order_by(Call.id))).all()
+    assert [m.sentiment for m in messages if m.role == "assistant"] == [None, None, None]
+    assert [c.sentiment_score for c in calls] == [50.0, 75.0, 75.0]
+
+
+@pytest.mark.asyncio
+async def test_backfill_with_worker_processes(session_factory):
+    service = SentimentService(analyzer=CountingAnalyzer())
+    assert await service.backfill(session_factory, batch_size=2, workers=2) == 6
+
+    async with session_factory() as session:
+        unscored = (await session.scalars(
+            select(Message).where(Message.role == "user", Message.sentiment.is_(None))
+        )).all()
+    assert unscored == []
@@ -0,0 +1,221 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, update, func
+from app.models.database import init_async_db, create_tables, Message, SessionState, SessionEvent
+from app.services.storage_service import SimulationStore
+from app.models.call import MessageRecord, NoteRecord, TagRecord
+from app.services.simulation_service import SimulationService, CallSimulation
+from app.services.session_state_service import (
+    encode_state, decode_state, MemorySessionBackend, RedisSessionBackend, SQLSessionBackend
+)
+
+
+class StubLLMService:
+    async def get_response_async(self, messages, max_tokens=150, timeout=None):
+        return f"echo: {messages[-1]['content']}"
+
+    def format_conversation_history(self, messages):
+        return [{"role": "system", "content": "system prompt"}] + messages
+
+
+class SlowLLMService(StubLLMService):
+    """Answers only once released, so two workers can be made to race."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+
+    async def get_response_async(self, messages, max_tokens=150, timeout=None):
+        await self.release.wait()
+        return await super().get_response_async(messages)
+
+
+@pytest_asyncio.fixture
+async def session_factory(tmp_path):
+    engine, session_factory = init_async_db(f"sqlite+aiosqlite:///{tmp_path}/test.db")
+    await create_tables(engine)
+    yield session_factory
+    await engine.dispose()
+
+
+@pytest.fixture
+def backend():
+    return MemorySessionBackend()
+
+
+def workers(backend, llm_service=None):
+    return [SimulationService(llm_service or StubLLMService(), session_backend=backend) for _ in range(2)]
+
+
+def test_state_round_trip():
+    simulation = CallSimulation("sim-1")
+    for i in range(20):
+        simulation.messages.append(MessageRecord("user", f"message {i}", 1714557600.123456 + i))
+    simulation.messages[0].sentiment = -0.25
+    simulation.notes.append(NoteRecord("note", 1714557601.0))
+    simulation.tags.append(TagRecord("vip", "default", 1714557602.0))
+    simulation.quality_metrics.sentiment_trend = [55.0, 60.5]
+    simulation.transferred_to = {"id": "agent1", "name": "John Smith"}
+    simulation.status = "transferred"
+
+    data = encode_state(simulation)
+    # Long histories are compressed
+    assert data[:1] == b"\x01"
+
+    restored = CallSimulation("sim-1")
+    decode_state(data, restored)
+    assert restored.start_time == simulation.start_time
+    assert restored.messages == simulation.messages
+    assert restored.notes == simulation.notes
+    assert restored.tags == simulation.tags
+    assert restored.transferred_to == simulation.transferred_to
+    assert restored.status == "transferred"
+    assert restored.quality_metrics == simulation.quality_metrics
+
+
+@pytest.mark.asyncio
+async def test_memory_compare_and_set(backend):
+    assert await backend.compare_and_set("sim-1", b"a", 0) == 1
+    assert await backend.compare_and_set("sim-1", b"b", 0) is None
+    assert await backend.compare_and_set("sim-1", b"b", 1) == 2
+    assert await backend.get("sim-1") == (b"b", 2)
+
+
+@pytest.mark.asyncio
+async def test_sql_compare_and_set_and_events(session_factory):
+    backend = SQLSessionBackend(session_factory, poll_interval=0.01)
+    events = backend.subscribe()
+    listening = asyncio.ensure_future(events.__anext__())
+    await asyncio.sleep(0.05)
+
+    assert await backend.compare_and_set("sim-1", b"a", 0) == 1
+    assert await backend.compare_and_set("sim-1", b"b", 0) is None
+    assert await backend.compare_and_set("sim-1", b"b", 1) == 2
+    assert await backend.compare_and_set("sim-1", b"c", 1) is None
+    assert await backend.get("sim-1") == (b"b", 2)
+
+    await backend.publish({"type": "ended", "simulation_id": "sim-1"})
+    assert await asyncio.wait_for(listening, 1) == {"type": "ended", "simulation_id": "sim-1"}
+    await events.aclose()
+
+    await backend.delete("sim-1")
+    assert await backend.get("sim-1") is None
+
+
+@pytest.mark.asyncio
+async def test_sql_backend_prunes_old_rows(session_factory):
+    backend = SQLSessionBackend(session_factory, ttl=3600, event_retention=60, prune_interval=60)
+    assert await backend.compare_and_set("sim-old", b"a", 0) == 1
+    assert await backend.compare_and_set("sim-new", b"b", 0) == 1
+    # The first publish prunes straight away, before anything is old
+    await backend.publish({"type": "ended", "simulation_id": "sim-old"})
+
+    async with session_factory() as session:
+        async with session.begin():
+            await session.execute(
+                update(SessionState).where(SessionState.simulation_id == "sim-old")
+                .values(updated_at=datetime.utcnow() - timedelta(hours=2))
+            )
+            await session.execute(update(SessionEvent).values(created_at=datetime.utcnow() - timedelta(minutes=5)))
+
+    # Within the interval publishing does not prune again
+    await backend.publish({"type": "ended", "simulation_id": "sim-new"})
+    async with session_factory() as session:
+        assert await session.scalar(select(func.count()).select_from(SessionEvent)) == 2
+
+    assert await backend.prune() == (1, 1)
+    assert await backend.get("sim-old") is None
+    assert await backend.get("sim-new") == (b"b", 1)
+    async with session_factory() as session:
+        payloads = (await session.scalars(select(SessionEvent.payload))).all()
+    assert payloads == [{"type": "ended", "simulation_id": "sim-new"}]
+
+
+@pytest.mark.asyncio
+async def test_redis_compare_and_set():
+    fakeredis = pytest.importorskip("fakeredis")
+    backend = RedisSessionBackend(client=fakeredis.FakeAsyncRedis(), ttl=60)
+
+    assert await backend.compare_and_set("sim-1", b"a", 0) == 1
+    assert await backend.compare_and_set("sim-1", b"b", 0) is None
+    assert await backend.compare_and_set("sim-1", b"b", 1) == 2
+    assert await backend.get("sim-1") == (b"b", 2)
+    assert await backend.client.ttl("session:sim-1") == 60
+    await backend.aclose()
+
+
+@pytest.mark.asyncio
+async def test_conversation_continues_on_another_worker(backend):
+    first, second = workers(backend)
+    first.start_simulation("sim-1")
+    await first.sync_state("sim-1")
+
+    assert await first.process_message("sim-1", "hello") == "echo: hello"
+    # The second worker has never seen this call, and still has the full context
+    assert await second.process_message("sim-1", "again") == "echo: again"
+    assert await first.process_message("sim-1", "third") == "echo: third"
+
+    details = await second.find_simulation_details("sim-1")
+    await second._get_simulation("sim-1")
+    assert [m.content for m in second.active_simulations["sim-1"].messages] == [
+        "hello", "echo: hello", "again", "echo: again", "third", "echo: third"
+    ]
+    assert details["simulation_id"] == "sim-1"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_appends_are_not_lost(backend):
+    llm_service = SlowLLMService()
+    first, second = workers(backend, llm_service)
+    first.start_simulation("sim-1")
+    await first.sync_state("sim-1")
+
+    replies = asyncio.gather(first.process_message("sim-1", "one"), second.process_message("sim-1", "two"))
+    await asyncio.sleep(0.01)
+    llm_service.release.set()
+    assert await replies == ["echo: one", "echo: two"]
+
+    await first._get_simulation("sim-1")
+    await second._get_simulation("sim-1")
+    for worker in (first, second):
+        contents = [m.content for m in worker.active_simulations["sim-1"].messages]
+        assert sorted(contents) == ["echo: one", "echo: two", "one", "two"]
+    data, version = await backend.get("sim-1")
+    assert first.active_simulations["sim-1"].version == second.active_simulations["sim-1"].version == version
+
+
+@pytest.mark.asyncio
+async def test_end_is_broadcast_to_other_workers(backend):
+    first, second = workers(backend)
+    first.start_simulation("sim-1")
+    await first.sync_state("sim-1")
+    await second.process_message("sim-1", "hello")
+
+    listener = asyncio.create_task(second.run_event_listener())
+    await asyncio.sleep(0)
+    async with first.session("sim-1"):
+        first.end_simulation("sim-1", reason="completed")
+    await asyncio.sleep(0.01)
+
+    simulation = second.active_simulations["sim-1"]
+    assert not simulation.is_active
+    assert simulation.status == "completed"
+    assert await second.process_message("sim-1", "still there?") is None
+    listener.cancel()
+
+
+@pytest.mark.asyncio
+async def test_shared_stores_do_not_duplicate_rows(backend, session_factory):
+    first, second = workers(backend)
+    for worker in (first, second):
+        worker.store = SimulationStore(session_factory, flush_interval=60, shared=True)
+    first.start_simulation("sim-1")
+    await first.process_message("sim-1", "hello")
+    await first.store.flush()
+    await second.process_message("sim-1", "again")
+    await second.store.flush()
+    await first.store.flush()
+
+    async with session_factory() as session:
+        assert await session.scalar(select(func.count()).select_from(Message)) == 4
@@ -0,0 +1,173 @@
+import threading
+from datetime import datetime, timedelta
+import pytest
+from app.services.simulation_service import SimulationService
+from app.services.cache_service import ResponseCache
+from app.services.sentiment_service import SentimentService, SentimentWorker
+
+
+class StubLLMService:
+    """Deterministic LLM stand-in that echoes the last user message."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def get_response_async(self, messages, max_tokens=150, timeout=None):
+        self.calls.append(messages)
+        return f"echo: {messages[-1]['content']}"
+
+    async def stream_response(self, messages, max_tokens=150, timeout=None):
+        self.calls.append(messages)
+        for word in f"echo: {messages[-1]['content']}".split(" "):
+            yield word + " "
+
+    def format_conversation_history(self, messages):
+        return [{"role": "system", "content": "system prompt"}] + messages
+
+
+@pytest.fixture
+def llm_service():
+    return StubLLMService()
+
+
+@pytest.fixture
+def simulation_service(llm_service):
+    return SimulationService(llm_service)
+
+
+@pytest.mark.asyncio
+async def test_process_message(simulation_service):
+    assert simulation_service.start_simulation("sim-1")
+    response = await simulation_service.process_message("sim-1", "hello")
+    assert response == "echo: hello"
+
+    messages = simulation_service.get_simulation_details("sim-1")["messages"]
+    assert [m["role"] for m in messages] == ["user", "assistant"]
+
+
+@pytest.mark.asyncio
+async def test_timestamps_are_formatted_on_serialization(simulation_service):
+    simulation_service.start_simulation("sim-1")
+    await simulation_service.process_message("sim-1", "hello")
+    simulation_service.add_note("sim-1", "called back")
+
+    simulation = simulation_service.active_simulations["sim-1"]
+    assert isinstance(simulation.messages[0].timestamp, float)
+    details = simulation_service.get_simulation_details("sim-1")
+    sent = datetime.fromisoformat(details["messages"][0]["timestamp"])
+    assert abs(sent - datetime.utcnow()) < timedelta(seconds=5)
+    assert details["notes"][0]["content"] == "called back"
+    datetime.fromisoformat(details["notes"][0]["timestamp"])
+
+
+@pytest.mark.asyncio
+async def test_process_message_inactive(simulation_service):
+    assert await simulation_service.process_message("missing", "hello") is None
+
+    simulation_service.start_simulation("sim-1")
+    simulation_service.end_simulation("sim-1")
+    assert await simulation_service.process_message("sim-1", "hello") is None
+
+
+@pytest.mark.asyncio
+async def test_stream_message_records_full_response(simulation_service):
+    simulation_service.start_simulation("sim-1")
+    deltas = await simulation_service.stream_message("sim-1", "hello there")
+    received = [delta async for delta in deltas]
+    assert "".join(received) == "echo: hello there "
+
+    messages = simulation_service.get_simulation_details("sim-1")["messages"]
+    assert messages[-1]["role"] == "assistant"
+    assert messages[-1]["content"] == "echo: hello there "
+
+
+@pytest.mark.asyncio
+async def test_stream_message_unknown_simulation(simulation_service):
+    assert await simulation_service.stream_message("missing", "hello") is None
+
+
+@pytest.mark.asyncio
+async def test_response_cache_skips_llm(llm_service):
+    service = SimulationService(llm_service, response_cache=ResponseCache())
+
+    for simulation_id in ["sim-1", "sim-2"]:
+        service.start_simulation(simulation_id)
+        response = await service.process_message(simulation_id, "What are your hours?")
+        assert response == "echo: What are your hours?"
+
+    assert len(llm_service.calls) == 1
+    assert service.get_simulation_details("sim-2")["messages"][-1]["content"] == "echo: What are your hours?"
+
+
+@pytest.mark.asyncio
+async def test_get_all_simulations_in_memory(simulation_service):
+    for i in range(5):
+        simulation_service.start_simulation(f"sim-{i}")
+    simulation_service.add_tag("sim-3", "vip")
+
+    page = await simulation_service.get_all_simulations(limit=2)
+    assert [c["simulation_id"] for c in page["calls"]] == ["sim-4", "sim-3"]
+
+    page = await simulation_service.get_all_simulations(limit=2, cursor=page["next_cursor"])
+    assert [c["simulation_id"] for c in page["calls"]] == ["sim-2", "sim-1"]
+
+    page = await simulation_service.get_all_simulations(tag="vip")
+    assert [c["simulation_id"] for c in page["calls"]] == ["sim-3"]
+    assert page["next_cursor"] is None
+
+
+class KeywordAnalyzer:
+    def polarity_scores(self, text):
+        compound = 0.5 if "great" in text else -0.5 if "terrible" in text else 0.0
+        return {"pos": max(compound, 0), "neg": max(-compound, 0), "neu": 1 - abs(compound), "compound": compound}
+
+
+class SlowSentimentService(SentimentService):
+    """Blocks scoring until released, to prove turns do not wait on it."""
+
+    def __init__(self):
+        super().__init__(analyzer=KeywordAnalyzer())
+        self.release = threading.Event()
+
+    def analyze_batch(self, texts):
+        self.release.wait(timeout=5)
+        return super().analyze_batch(texts)
+
+
+@pytest.mark.asyncio
+async def test_sentiment_is_scored_in_background(llm_service):
+    sentiment_service = SlowSentimentService()
+    worker = SentimentWorker(sentiment_service)
+    simulation_service = SimulationService(llm_service, sentiment_worker=worker)
+    await worker.start()
+
+    simulation_service.start_simulation("sim-1")
+    assert await simulation_service.process_message("sim-1", "this is great") == "echo: this is great"
+    metrics = simulation_service.get_simulation_details("sim-1")["quality_metrics"]
+    assert metrics["sentiment_score"] == 50
+    assert metrics["sentiment_trend"] == []
+
+    await simulation_service.process_message("sim-1", "actually terrible")
+    sentiment_service.release.set()
+    await worker.drain()
+
+    metrics = simulation_service.get_simulation_details("sim-1")["quality_metrics"]
+    assert metrics["sentiment_trend"] == [75.0, 25.0]
+    assert metrics["sentiment_score"] == 50.0
+    assert worker.get_stats()["processed"] == 2
+    await worker.stop()
+
+
+@pytest.mark.asyncio
+async def test_sentiment_queue_drops_when_full(llm_service):
+    worker = SentimentWorker(SentimentService(analyzer=KeywordAnalyzer()), max_queue=1)
+    simulation_service = SimulationService(llm_service, sentiment_worker=worker)
+    simulation_service.start_simulation("sim-1")
+
+    await simulation_service.process_message("sim-1", "great")
+    await simulation_service.process_message("sim-1", "great")
+    assert worker.get_stats() == {"queued": 1, "processed": 0, "dropped": 1}
+
+    await worker.start()
+    await worker.stop()
+    assert simulation_service.get_simulation_details("sim-1")["quality_metrics"]["sentiment_score"] == 75.0
@@ -0,0 +1,112 @@
+import asyncio
+import io
+import numpy as np
+import pytest
+import soundfile as sf
+from app.services.speech_service import SpeechService, SAMPLE_RATE, pcm16_to_float, to_whisper_input
+
+
+class FakeWhisper:
+    """Records what it was asked to transcribe and reports its length."""
+
+    def __init__(self):
+        self.inputs = []
+
+    def transcribe(self, audio, **kwargs):
+        self.inputs.append(audio)
+        return {"text": f" {len(audio) / SAMPLE_RATE:.2f}s "}
+
+
+@pytest.fixture
+def speech_service():
+    return SpeechService(model=FakeWhisper())
+
+
+def tone(seconds, sample_rate=SAMPLE_RATE, amplitude=0.3):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def silence(seconds, sample_rate=SAMPLE_RATE):
+    return np.zeros(int(seconds * sample_rate), dtype=np.float32)
+
+
+def test_pcm16_to_float():
+    data = np.array([0, 16384, -32768], dtype="<i2").tobytes()
+    assert list(pcm16_to_float(data)) == [0.0, 0.5, -1.0]
+
+
+def test_to_whisper_input_downmixes_and_resamples():
+    stereo = np.stack([tone(1, 8000), tone(1, 8000)], axis=1)
+    audio = to_whisper_input(stereo, 8000)
+    assert audio.dtype == np.float32
+    assert audio.shape == (SAMPLE_RATE,)
+
+
+def test_speech_to_text_decodes_in_memory(speech_service):
+    buffer = io.BytesIO()
+    sf.write(buffer, tone(0.5, 8000), 8000, format="WAV")
+    assert speech_service.speech_to_text(buffer.getvalue()) == "0.50s"
+    assert speech_service.speech_to_text(b"not audio") == ""
+
+
+def test_transcribe_array_accepts_pcm_bytes(speech_service):
+    pcm = (tone(0.25) * 32767).astype("<i2").tobytes()
+    assert speech_service.transcribe_array(pcm) == "0.25s"
+    assert speech_service.transcribe_array(np.empty(0)) == ""
+
+
+@pytest.mark.asyncio
+async def test_stream_emits_partials_then_final(speech_service):
+    stream = speech_service.stream(silence_ms=300, partial_ms=300)
+    events = []
+    for chunk in np.split(np.concatenate([silence(0.3), tone(0.9), silence(0.6)]), 18):
+        events.extend(await stream.feed(chunk))
+        # Partials finish in the background while more audio arrives
+        await asyncio.sleep(0.01)
+
+    partials = [e for e in events if e["type"] == "partial"]
+    finals = [e for e in events if e["type"] == "final"]
+    assert len(partials) >= 2
+    assert len(finals) == 1
+    # The first partial arrives well before the caller stops speaking
+    assert float(partials[0]["text"][:-1]) <= 0.5
+    assert not stream.in_speech
+
+
+@pytest.mark.asyncio
+async def test_partials_cover_a_bounded_window(speech_service):
+    stream = speech_service.stream(partial_ms=300, partial_window_seconds=0.6, max_segment_seconds=60)
+    for chunk in np.split(tone(3), 30):
+        await stream.feed(chunk)
+        await asyncio.sleep(0.01)
+    stream.close()
+
+    inputs = speech_service.whisper_model.inputs
+    assert len(inputs) >= 5
+    # Each partial re-decodes at most the window, however long the caller talks
+    assert max(len(audio) for audio in inputs) <= 0.6 * SAMPLE_RATE
+    # A pause adds no new speech, so it is not transcribed again
+    count = len(inputs)
+    await stream.feed(tone(0.3))
+    await asyncio.sleep(0.01)
+    for _ in range(3):
+        await stream.feed(silence(0.1))
+        await asyncio.sleep(0.01)
+    assert len(inputs) == count + 1
+
+
+@pytest.mark.asyncio
+async def test_stream_silence_is_never_transcribed(speech_service):
+    stream = speech_service.stream()
+    assert await stream.feed(silence(2)) == []
+    assert await stream.flush() == []
+    assert speech_service.whisper_model.inputs == []
+
+
+@pytest.mark.asyncio
+async def test_stream_flush_finalizes_open_segment(speech_service):
+    stream = speech_service.stream(partial_ms=10000)
+    pcm = (tone(0.6) * 32767).astype("<i2").tobytes()
+    assert await stream.feed(pcm) == []
+    assert await stream.flush() == [{"type": "final", "text": "0.60s"}]
@@ -0,0 +1,262 @@
+from datetime import datetime, timedelta
+import asyncio
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, func
+from app.models.database import init_async_db, create_tables, Call, Message, Note, Tag
+from app.services.simulation_service import SimulationService, CallSimulation
+from app.services.storage_service import SimulationStore
+from app.services.sentiment_service import SentimentService, SentimentWorker
+
+
+class StubLLMService:
+    async def get_response_async(self, messages, max_tokens=150, timeout=None):
+        return f"echo: {messages[-1]['content']}"
+
+    def format_conversation_history(self, messages):
+        return [{"role": "system", "content": "system prompt"}] + messages
+
+
+@pytest_asyncio.fixture
+async def session_factory(tmp_path):
+    engine, session_factory = init_async_db(f"sqlite+aiosqlite:///{tmp_path}/test.db")
+    await create_tables(engine)
+    yield session_factory
+    await engine.dispose()
+
+
+@pytest.fixture
+def store(session_factory):
+    return SimulationStore(session_factory, flush_interval=60)
+
+
+@pytest.fixture
+def simulation_service(store):
+    return SimulationService(StubLLMService(), store=store)
+
+
+async def count(session_factory, model):
+    async with session_factory() as session:
+        return await session.scalar(select(func.count()).select_from(model))
+
+
+@pytest.mark.asyncio
+async def test_writes_are_deferred_and_batched(simulation_service, store, session_factory):
+    for simulation_id in ["sim-1", "sim-2"]:
+        simulation_service.start_simulation(simulation_id)
+        await simulation_service.process_message(simulation_id, "hello")
+
+    assert await count(session_factory, Call) == 0
+    assert store.get_stats()["dirty"] == 2
+
+    assert await store.flush() == 2
+    assert await count(session_factory, Call) == 2
+    assert await count(session_factory, Message) == 4
+    assert store.get_stats()["dirty"] == 0
+
+
+@pytest.mark.asyncio
+async def test_only_new_rows_are_inserted(simulation_service, store, session_factory):
+    simulation_service.start_simulation("sim-1")
+    await simulation_service.process_message("sim-1", "hello")
+    await store.flush()
+
+    await simulation_service.process_message("sim-1", "again")
+    simulation_service.add_note("sim-1", "VIP caller")
+    simulation_service.add_tag("sim-1", "billing", "warning")
+    simulation_service.end_simulation("sim-1")
+    await store.flush()
+
+    assert await count(session_factory, Call) == 1
+    assert await count(session_factory, Message) == 4
+    assert await count(session_factory, Note) == 1
+    assert await count(session_factory, Tag) == 1
+    async with session_factory() as session:
+        call = await session.scalar(select(Call))
+    assert call.status == "completed"
+    assert call.ended_at is not None
+
+
+class KeywordAnalyzer:
+    def polarity_scores(self, text):
+        compound = 0.5 if "great" in text else -0.5 if "terrible" in text else 0.0
+        return {"pos": max(compound, 0), "neg": max(-compound, 0), "neu": 1 - abs(compound), "compound": compound}
+
+
+@pytest.mark.asyncio
+async def test_live_sentiment_is_written_to_messages(store, session_factory):
+    sentiment_service = SentimentService(analyzer=KeywordAnalyzer())
+    worker = SentimentWorker(sentiment_service)
+    simulation_service = SimulationService(StubLLMService(), store=store, sentiment_worker=worker)
+    simulation_service.start_simulation("sim-1")
+    await simulation_service.process_message("sim-1", "this is great")
+    # Written before the worker has scored it
+    await store.flush()
+
+    await worker.start()
+    await simulation_service.process_message("sim-1", "actually terrible")
+    await worker.drain()
+    await store.flush()
+    await worker.stop()
+
+    async with session_factory() as session:
+        rows = (await session.execute(
+            select(Message.role, Message.sentiment).order_by(Message.id)
+        )).all()
+        live_score = await session.scalar(select(Call.sentiment_score))
+    assert [tuple(row) for row in rows] == [("user", 0.5), ("assistant", None), ("user", -0.5), ("assistant", None)]
+
+    # Nothing is left for the backfill, and it would agree with the live score
+    assert await sentiment_service.backfill(session_factory, workers=1) == 0
+    assert live_score == 50.0
+    restarted = SimulationStore(session_factory)
+    simulation = await restarted.load("sim-1", CallSimulation)
+    assert [m.sentiment for m in simulation.messages] == [0.5, None, -0.5, None]
+
+
+@pytest.mark.asyncio
+async def test_idle_ended_simulations_are_evicted(simulation_service, store):
+    simulation_service.start_simulation("active")
+    simulation_service.start_simulation("ended")
+    simulation_service.end_simulation("ended")
+
+    # Unflushed simulations are never evicted
+    assert simulation_service.evict_idle_simulations(max_idle=0) == 0
+
+    await store.flush()
+    assert simulation_service.evict_idle_simulations(max_idle=0) == 1
+    assert list(simulation_service.active_simulations) == ["active"]
+
+
+@pytest.mark.asyncio
+async def test_eviction_waits_for_flush_in_progress(simulation_service, store):
+    simulation_service.start_simulation("ended")
+    simulation_service.end_simulation("ended")
+
+    flushing = asyncio.ensure_future(store.flush())
+    await asyncio.sleep(0)
+    # Taken off the dirty list, but not written yet
+    assert simulation_service.evict_idle_simulations(max_idle=0) == 0
+    assert await flushing == 1
+
+    assert simulation_service.evict_idle_simulations(max_idle=0) == 1
+    assert store.get_stats()["tracked"] == 0
+
+
+@pytest.mark.asyncio
+async def test_abandoned_active_simulations_are_evicted(simulation_service, store):
+    simulation_service.start_simulation("abandoned")
+    await simulation_service.process_message("abandoned", "hello")
+    await store.flush()
+
+    assert simulation_service.evict_idle_simulations(max_idle=0) == 0
+    assert simulation_service.evict_idle_simulations(max_idle=0, max_idle_active=0) == 1
+    assert "abandoned" not in simulation_service.context_service.contexts
+    assert store.get_stats()["tracked"] == 0
+
+    # A caller coming back picks up where they left off
+    assert await simulation_service.process_message("abandoned", "still there?") == "echo: still there?"
+    assert [m["content"] for m in (await simulation_service.context_service.build_messages("abandoned"))[1:]] == [
+        "hello", "echo: hello", "still there?", "echo: still there?"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_simulation_survives_restart(simulation_service, store, session_factory):
+    simulation_service.start_simulation("sim-1")
+    await simulation_service.process_message("sim-1", "my order is late")
+    simulation_service.transfer_call("sim-1", "agent2", "billing question")
+    await store.flush()
+
+    restarted = SimulationService(StubLLMService(), store=SimulationStore(session_factory))
+    response = await restarted.process_message("sim-1", "any update?")
+    assert response == "echo: any update?"
+
+    details = restarted.get_simulation_details("sim-1")
+    assert [m["content"] for m in details["messages"]] == [
+        "my order is late", "echo: my order is late", "any update?", "echo: any update?"
+    ]
+    assert details["transferred_to"]["name"] == "Sarah Johnson"
+    assert details["notes"][0]["content"].startswith("Call transferred to Sarah Johnson")
+
+
+@pytest.mark.asyncio
+async def test_load_unknown_simulation(store):
+    assert await store.load("missing", CallSimulation) is None
+
+
+async def seed_calls(simulation_service, store, count):
+    for i in range(count):
+        simulation_id = f"sim-{i:03d}"
+        simulation_service.start_simulation(simulation_id)
+        simulation_service.active_simulations[simulation_id].start_time = datetime(2024, 1, 1) + timedelta(minutes=i)
+        if i % 2:
+            simulation_service.add_tag(simulation_id, "billing")
+        if i % 3 == 0:
+            simulation_service.transfer_call(simulation_id, "agent1", "technical issue")
+        simulation_service.end_simulation(simulation_id)
+    await store.flush()
+
+
+@pytest.mark.asyncio
+async def test_list_calls_keyset_pagination(simulation_service, store):
+    await seed_calls(simulation_service, store, 25)
+
+    seen = []
+    cursor = None
+    while True:
+        page = await store.list_calls(limit=10, cursor=cursor)
+        seen.extend(call["simulation_id"] for call in page["calls"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert seen == [f"sim-{i:03d}" for i in reversed(range(25))]
+
+
+@pytest.mark.asyncio
+async def test_list_calls_filters(simulation_service, store):
+    await seed_calls(simulation_service, store, 12)
+
+    page = await store.list_calls(tag="billing", limit=50)
+    assert {c["simulation_id"] for c in page["calls"]} == {f"sim-{i:03d}" for i in range(1, 12, 2)}
+    assert page["calls"][0]["tags"] == [{"name": "billing", "type": "default"}]
+
+    page = await store.list_calls(agent_id="agent1", status="completed", limit=50)
+    assert {c["simulation_id"] for c in page["calls"]} == {"sim-000", "sim-003", "sim-006", "sim-009"}
+    assert page["calls"][0]["note"].startswith("Call transferred to John Smith")
+
+    page = await store.list_calls(date_from=datetime(2024, 1, 1, 0, 10), limit=50)
+    assert [c["simulation_id"] for c in page["calls"]] == ["sim-011", "sim-010"]
+
+    page = await store.list_calls(search="sim-00", limit=50)
+    assert len(page["calls"]) == 10
+
+
+@pytest.mark.asyncio
+async def test_find_details_of_evicted_simulation(simulation_service, store):
+    simulation_service.start_simulation("sim-1")
+    await simulation_service.process_message("sim-1", "hello")
+    simulation_service.end_simulation("sim-1")
+    await store.flush()
+    simulation_service.evict_idle_simulations(max_idle=0)
+
+    details = await simulation_service.find_simulation_details("sim-1")
+    assert details["message_count"] == 2
+    assert "sim-1" not in simulation_service.active_simulations
+
+
+@pytest.mark.asyncio
+async def test_iter_calls_in_batches(simulation_service, store):
+    await seed_calls(simulation_service, store, 7)
+    await simulation_service.process_message("sim-000", "hello")  # inactive, ignored
+    simulation_service.add_note("sim-002", "call back tomorrow")
+    await store.flush()
+
+    records = [record async for record in store.iter_calls(batch_size=3)]
+    assert [r["simulation_id"] for r in records] == [f"sim-{i:03d}" for i in range(7)]
+    assert records[1]["tags"][0]["name"] == "billing"
+    assert records[2]["notes"][-1]["content"] == "call back tomorrow"
+
+    records = [r async for r in store.iter_calls(date_from=datetime(2024, 1, 1, 0, 5))]
+    assert [r["simulation_id"] for r in records] == ["sim-005", "sim-006"]
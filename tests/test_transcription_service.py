@@ -0,0 +1,89 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from app.services import speech_service as speech_module
+from app.services.speech_service import SpeechService, SAMPLE_RATE
+from app.services.transcription_service import TranscriptionService
+
+
+class FakeWhisper:
+    def __init__(self):
+        self.calls = 0
+
+    def transcribe(self, audio, **kwargs):
+        self.calls += 1
+        if not np.any(audio):
+            raise RuntimeError("silence")
+        return {"text": f"{len(audio)} samples"}
+
+
+@pytest.fixture
+def fake_model():
+    # Registered before the pool forks, so worker processes inherit it
+    model = FakeWhisper()
+    speech_module._models["fake"] = model
+    yield model
+    speech_module._models.pop("fake", None)
+
+
+def segment(samples):
+    return np.full(samples, 0.1, dtype=np.float32)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_micro_batched(fake_model):
+    pool = TranscriptionService(
+        workers=1, model_name="fake", max_batch=4, batch_window_ms=20, executor=ThreadPoolExecutor(1)
+    )
+    await pool.start()
+    results = await asyncio.gather(*[pool.transcribe(segment(1000 + i)) for i in range(6)])
+    await pool.stop()
+
+    assert results == [f"{1000 + i} samples" for i in range(6)]
+    stats = pool.get_stats()
+    assert stats["processed"] == 6
+    assert stats["batches"] == 2
+    assert stats["average_batch_size"] == 3
+    assert stats["queue_depth"] == 0
+    assert stats["latency_p95_ms"] >= stats["latency_p50_ms"] > 0
+
+
+@pytest.mark.asyncio
+async def test_worker_processes(fake_model):
+    pool = TranscriptionService(workers=2, model_name="fake")
+    await pool.start()
+    pcm = (segment(800) * 32767).astype("<i2").tobytes()
+    results = await asyncio.gather(
+        pool.transcribe(segment(SAMPLE_RATE)),
+        pool.transcribe(segment(4000), sample_rate=8000),
+        pool.transcribe(pcm),
+    )
+    await pool.stop()
+
+    assert results == [f"{SAMPLE_RATE} samples", "8000 samples", "800 samples"]
+    # Transcription ran in the workers, not in this process
+    assert fake_model.calls == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_segment_returns_empty_text(fake_model):
+    pool = TranscriptionService(workers=1, model_name="fake", executor=ThreadPoolExecutor(1))
+    await pool.start()
+    assert await pool.transcribe(np.zeros(100, dtype=np.float32)) == ""
+    assert await pool.transcribe(segment(100)) == "100 samples"
+    await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_speech_service_uses_pool(fake_model):
+    pool = TranscriptionService(workers=1, model_name="fake", executor=ThreadPoolExecutor(1))
+    await pool.start()
+    speech_service = SpeechService(pool=pool)
+    assert speech_service.whisper_model is None
+
+    stream = speech_service.stream(partial_ms=10000)
+    await stream.feed(np.concatenate([segment(4800), np.zeros(16000, dtype=np.float32)]))
+    await pool.stop()
+
+    assert pool.get_stats()["processed"] == 1
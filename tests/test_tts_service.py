@@ -0,0 +1,135 @@
+import io
+import os
+import numpy as np
+import pytest
+import soundfile as sf
+from app.services.tts_service import TTSService, AudioCache, CommandBackend, split_sentences
+
+
+class FakeBackend:
+    name = "fake"
+    content_type = "audio/wav"
+    extension = "wav"
+    concatenable = True
+
+    def __init__(self):
+        self.calls = []
+
+    def synthesize(self, text):
+        self.calls.append(text)
+        if "fail" in text:
+            raise RuntimeError("engine error")
+        return f"audio[{text}]".encode()
+
+
+@pytest.fixture
+def backend():
+    return FakeBackend()
+
+
+@pytest.fixture
+def tts_service(backend, tmp_path):
+    return TTSService(backend=backend, cache=AudioCache(directory=str(tmp_path)))
+
+
+def test_split_sentences():
+    assert split_sentences("Hello there! How can I help?  Please hold. ") == [
+        "Hello there!", "How can I help?", "Please hold."
+    ]
+    assert split_sentences("   ") == []
+
+
+def test_repeated_phrases_are_synthesized_once(tts_service, backend):
+    assert tts_service.synthesize("Please speak after the tone.") == (
+        b"audio[Please speak after the tone.]", "audio/wav"
+    )
+    assert tts_service.synthesize("Please  speak after the tone.")[0] == b"audio[Please speak after the tone.]"
+    assert backend.calls == ["Please speak after the tone."]
+    assert tts_service.get_stats()["hits"] == 1
+
+
+def test_disk_cache_survives_restart(tts_service, backend, tmp_path):
+    tts_service.synthesize("Welcome")
+    restarted = TTSService(backend=backend, cache=AudioCache(directory=str(tmp_path)))
+    assert restarted.synthesize("Welcome")[0] == b"audio[Welcome]"
+    assert backend.calls == ["Welcome"]
+
+
+def test_synthesize_file(tts_service, backend):
+    path, content_type = tts_service.synthesize_file("Please hold")
+    assert content_type == "audio/wav"
+    with open(path, "rb") as audio_file:
+        assert audio_file.read() == b"audio[Please hold]"
+    assert tts_service.synthesize_file("Please hold")[0] == path
+    assert backend.calls == ["Please hold"]
+
+
+def test_memory_cache_is_bounded(backend, tmp_path):
+    cache = AudioCache(directory=str(tmp_path), max_memory_bytes=20)
+    tts_service = TTSService(backend=backend, cache=cache)
+    for text in ["one", "two", "three"]:
+        tts_service.synthesize(text)
+    assert list(cache._memory.values()) == [b"audio[three]"]
+    assert cache._memory_bytes == 12
+    # Evicted clips are still served from disk
+    assert tts_service.synthesize("one")[0] == b"audio[one]"
+    assert backend.calls == ["one", "two", "three"]
+
+
+def test_disk_cache_is_bounded(backend, tmp_path):
+    cache = AudioCache(directory=str(tmp_path), max_memory_bytes=1, max_disk_bytes=35)
+    tts_service = TTSService(backend=backend, cache=cache)
+    for i, text in enumerate(["one", "two", "three"]):
+        tts_service.synthesize(text)
+        # Oldest first, a second apart so mtimes are distinct
+        os.utime(cache.path(tts_service.cache_key(text), "wav"), (1000 + i, 1000 + i))
+    # Reading "one" makes it the most recently used
+    tts_service.synthesize("one")
+    tts_service.synthesize("four")
+
+    remaining = sorted(os.listdir(tmp_path))
+    assert len(remaining) == 2
+    assert os.path.basename(cache.path(tts_service.cache_key("one"), "wav")) in remaining
+    assert os.path.basename(cache.path(tts_service.cache_key("four"), "wav")) in remaining
+    assert cache.evictions == 2
+    assert sum(os.path.getsize(tmp_path / name) for name in remaining) <= 35
+
+    # Pruned clips are synthesized and written again when served as files
+    path, _ = tts_service.synthesize_file("two")
+    assert os.path.exists(path)
+    assert backend.calls.count("two") == 2
+
+
+@pytest.mark.asyncio
+async def test_stream_by_sentence(tts_service, backend):
+    chunks = [chunk async for chunk in tts_service.stream("Hi. This will fail. Goodbye!")]
+    assert chunks == [b"audio[Hi.]", b"audio[Goodbye!]"]
+    assert backend.calls == ["Hi.", "This will fail.", "Goodbye!"]
+
+
+@pytest.mark.asyncio
+async def test_wav_clips_stream_as_one_file(tmp_path):
+    class ToneBackend(FakeBackend):
+        concatenable = False
+
+        def synthesize(self, text):
+            buffer = io.BytesIO()
+            sf.write(buffer, np.full(100 * len(text), 0.25, dtype=np.float32), 16000, format="WAV", subtype="PCM_16")
+            return buffer.getvalue()
+
+    tts_service = TTSService(backend=ToneBackend(), cache=AudioCache(directory=str(tmp_path)))
+    audio = b"".join([chunk async for chunk in tts_service.stream("Hi. Goodbye!")])
+    assert audio.count(b"RIFF") == 1
+    samples, sample_rate = sf.read(io.BytesIO(audio), dtype="float32")
+    assert sample_rate == 16000
+    # Both sentences are in the one stream
+    assert len(samples) == 100 * (len("Hi.") + len("Goodbye!"))
+    assert np.allclose(samples, 0.25, atol=1e-3)
+
+
+def test_command_backend(tmp_path):
+    tts_service = TTSService(backend=CommandBackend("cat"), cache=AudioCache(directory=str(tmp_path)))
+    data, content_type = tts_service.synthesize("offline speech")
+    assert data == b"offline speech"
+    assert content_type == "audio/wav"
+    assert len(os.listdir(tmp_path)) == 1
@@ -0,0 +1,128 @@
+from urllib.parse import parse_qs
+import httpx
+import pytest
+import pytest_asyncio
+from app.services.simulation_service import SimulationService
+from app.services.twilio_service import TwilioService, GREETING
+from app.services.voice_service import VoiceService
+
+
+class StubLLMService:
+    def __init__(self):
+        self.timeouts = []
+
+    async def get_response_async(self, messages, max_tokens=150, timeout=None):
+        self.timeouts.append(timeout)
+        return f"You said <{messages[-1]['content']}> & more"
+
+    def format_conversation_history(self, messages):
+        return [{"role": "system", "content": "system prompt"}] + messages
+
+
+class FakeTwilio:
+    """Local stand-in for the Twilio REST API."""
+
+    def __init__(self):
+        self.requests = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.url.path.endswith("/Calls.json") and request.method == "POST":
+            return httpx.Response(201, json={"sid": "CA123", "status": "queued"})
+        return httpx.Response(404, json={"code": 20404, "message": "Not found", "status": 404})
+
+
+@pytest.fixture
+def fake_twilio():
+    return FakeTwilio()
+
+
+@pytest_asyncio.fixture
+async def twilio_service(fake_twilio):
+    service = TwilioService(
+        "AC123", "token", "+15550000000",
+        base_url="https://calls.example.com/",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(fake_twilio.handler))
+    )
+    yield service
+    await service.aclose()
+
+
+@pytest.fixture
+def llm_service():
+    return StubLLMService()
+
+
+@pytest.fixture
+def voice_service(llm_service, twilio_service):
+    return VoiceService(SimulationService(llm_service), twilio_service, llm_timeout=5)
+
+
+@pytest.mark.parametrize("message", [None, "", GREETING, "Tom & Jerry <3 \"quotes\" 'apostrophes'"])
+def test_precomputed_twiml_matches_voice_response(twilio_service, message):
+    assert twilio_service.create_twiml_response(message) == TwilioService._render(message)
+
+
+@pytest.mark.asyncio
+async def test_make_call_uses_configured_domain(twilio_service, fake_twilio):
+    assert await twilio_service.make_call("+15551234567") == "CA123"
+
+    request = fake_twilio.requests[0]
+    assert request.url.path == "/2010-04-01/Accounts/AC123/Calls.json"
+    form = parse_qs(request.content.decode())
+    assert form["Url"] == ["https://calls.example.com/api/voice/handle-call"]
+    assert form["StatusCallback"] == ["https://calls.example.com/api/voice/status"]
+    assert form["To"] == ["+15551234567"]
+
+
+@pytest.mark.asyncio
+async def test_make_call_without_credentials():
+    service = TwilioService(None, None, None)
+    assert await service.make_call("+15551234567") == ""
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_inbound_call_loop(voice_service, llm_service):
+    twiml = await voice_service.handle_call("CA1")
+    assert GREETING in twiml
+    # A Gather timeout redirects back without greeting again
+    assert GREETING not in await voice_service.handle_call("CA1")
+
+    twiml = await voice_service.process_speech("CA1", " My bill is wrong ")
+    assert "<Say>You said &lt;My bill is wrong&gt; &amp; more</Say>" in twiml
+    assert twiml.startswith('<?xml version="1.0" encoding="UTF-8"?><Response>')
+    assert llm_service.timeouts == [5]
+
+    # Empty speech just prompts again
+    assert await voice_service.process_speech("CA1", "") == voice_service.twilio_service.reprompt_twiml
+
+    details = voice_service.simulation_service.get_simulation_details("CA1")
+    assert [m["content"] for m in details["messages"]] == [
+        "My bill is wrong", "You said <My bill is wrong> & more"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_process_speech_for_unknown_call_starts_it(voice_service):
+    assert await voice_service.process_speech("CA2", "hello") is not None
+    assert "CA2" in voice_service.simulation_service.active_simulations
+
+
+@pytest.mark.asyncio
+async def test_status_callback_ends_call(voice_service):
+    await voice_service.handle_call("CA1")
+    assert not await voice_service.handle_status("CA1", "in-progress")
+    assert await voice_service.handle_status("CA1", "completed")
+    assert await voice_service.process_speech("CA1", "hello?") is None
+
+    # Outbound calls that never connected are still recorded
+    assert await voice_service.handle_status("CA3", "busy")
+    assert voice_service.simulation_service.get_simulation_details("CA3")["status"] == "busy"
+
+
+@pytest.mark.asyncio
+async def test_media_streams_connect_call_to_websocket(llm_service, twilio_service):
+    voice_service = VoiceService(SimulationService(llm_service), twilio_service, media_streams=True)
+    twiml = await voice_service.handle_call("CA1")
+    assert '<Connect><Stream url="wss://calls.example.com/api/voice/media-stream" /></Connect>' in twiml